@@ -9,6 +9,7 @@ from lib.timeit import timeit
 import logging
 import pydash
 from lib.cli import cli
+from lib.wait import Backoff
 from functools import wraps
 from enum import Enum
 import traceback
@@ -93,6 +94,9 @@ class Base():
         d = self.d
         current = 1
         checker = self.timeout_checker(timeout)
+        # 只有单纯轮询func时使用自适应间隔(首次快速重试，之后指数退避到interval)；
+        # 指定了on_fail或max_times时保持固定间隔，不改变回调频率和总等待时长
+        backoff = None
         while True:
             if checker.check(raise_exception):
                 return False
@@ -112,7 +116,12 @@ class Base():
                 if callable(interval):
                     interval = interval()
                     log.info(f"computed interval: {interval}")
-                time.sleep(interval)
+                if on_fail is None and not max_times:
+                    if backoff is None:
+                        backoff = Backoff(maximum=interval)
+                    time.sleep(backoff.next())
+                else:
+                    time.sleep(interval)
                 current += 1
             else:
                 log.info("wait success")
@@ -1,10 +1,13 @@
 from .base import Base as BaseBot
-import uiautomator2 as u2
+from lib.device_session import get_device
 import hashlib
 import time
 import base64
 from lib.ocr import OCR
 from lib.rapidocr import Ocr as RapidOcr
+from lib.frame_diff import FrameChangeDetector
+from lib.frame_stream import FrameStream
+from PIL import Image
 import pdb
 import os
 import logging
@@ -40,6 +43,7 @@ class Base(BaseBot):
     app_version = None
     package_name = None
     screenshot_context = None
+    _rapid_ocr = None
 
     def is_app_installed(self):
         return self.package_name in self.d.app_list()
@@ -116,7 +120,8 @@ class Base(BaseBot):
         log.info(f"init uiautomator base {args} {kwargs}")
         adb_address = kwargs.get("adb_address", pydash.get(args,'0') or os.environ.get("ADB_ADDRESS"))
         self.adb_address = adb_address
-        self.d = u2.connect(adb_address)
+        self.d = get_device(adb_address)
+        self.frame_detector = FrameChangeDetector()
         if adb_address is None:
             device_info = self.d.device_info
             self.adb_address = device_info['serial']
@@ -173,6 +178,7 @@ class Base(BaseBot):
         q = self.d(text='上滑解锁')
         if q.exists(timeout=1):
             self.d.swipe_ext('up', scale=1)
+            self.mark_ui_changed()
 
     def click(self, *args, **kwargs):
         return self.click_screen_text(*args, **kwargs)
@@ -255,6 +261,7 @@ class Base(BaseBot):
 
             log.info(f"click {x} {y}")
             self.d.click(x, y)
+            self.mark_ui_changed()
             return True
         else:
             log.info(f"text {textContains} not found")
@@ -337,6 +344,7 @@ class Base(BaseBot):
                 self.sleep(delay, '延迟点击')
             try:
                 ele.click(timeout=0, offset=offset)
+                self.mark_ui_changed()
                 return True
             except Exception as e:
                 log.error(f"click error: {e}")
@@ -435,6 +443,7 @@ class Base(BaseBot):
                 if max_times is not None:
                     log.info(f"({current}/{max_times}): scroll {direction} {message}")
                 d.swipe_ext(direction, scale=scale)
+                self.mark_ui_changed()
                 if callable(after):
                     log.info("call after")
                     try:
@@ -483,8 +492,11 @@ class Base(BaseBot):
     @property
     def rapid_ocr(self):
         image = self.take_screenshot_as_image()
-        ocr = RapidOcr(image)
-        return ocr
+        # 画面未变化时复用上一次的识别对象(其识别结果已缓存)
+        if self._rapid_ocr is not None and not self.frame_detector.is_changed('rapid_ocr', image):
+            return self._rapid_ocr
+        self._rapid_ocr = RapidOcr(image)
+        return self._rapid_ocr
 
     def print_ocr_info(self):
         ocr = self.rapid_ocr
@@ -559,9 +571,21 @@ class Base(BaseBot):
         return data
 
     def take_screenshot_as_image(self):
+        # 该设备已有画面流时取最新帧，省去一次截图请求；点击、滑动后只用操作之后采集的帧
+        stream = FrameStream.get(self.adb_address)
+        if stream:
+            frame = stream.current_frame(max_age=1.0)
+            if frame is not None:
+                return Image.fromarray(frame[:, :, ::-1])
         image = self.d.screenshot()
         return image
 
+    def mark_ui_changed(self):
+        """点击、滑动等操作后调用，之后从画面流读取的画面必须是操作之后采集的"""
+        stream = FrameStream.get(self.adb_address)
+        if stream:
+            stream.mark_ui_changed()
+
     def app_stop(self):
         log.info(f"stop app {self.package_name}")
         d = self.d
@@ -0,0 +1,149 @@
+from typing import Any, Callable, Dict, Optional
+import logging
+import threading
+import time
+import uiautomator2 as u2
+
+log = logging.getLogger(__name__)
+
+
+class DeviceSession:
+    """一台设备的uiautomator2连接"""
+    __slots__ = ('serial', 'device', 'connected_at', 'validated_at', 'lock')
+
+    def __init__(self, serial: Optional[str], device: Any):
+        self.serial = serial
+        self.device = device
+        self.connected_at = time.time()
+        self.validated_at = time.monotonic()  # 最近一次确认连接可用的时间
+        self.lock = threading.Lock()
+
+
+class DeviceSessionCache:
+    """进程级共享的uiautomator2连接缓存
+
+    同一设备只建立一次连接(u2.connect)，机器人、截图、设备管理和初始化
+    共用同一个u2.Device。超过validate_after秒未确认的连接在取出前先调用
+    device.info检查，失败则重新连接；后台保活线程定期检查空闲连接，让设备
+    端的代理保持就绪，并提前发现断开的连接。
+    """
+    _instance = None
+    _lock = threading.Lock()  # 单例锁
+
+    @classmethod
+    def get_instance(cls) -> 'DeviceSessionCache':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, validate_after: float = 30.0, keepalive_interval: float = 60.0,
+                 connect: Callable[[Optional[str]], Any] = None):
+        """
+        Args:
+            validate_after: 连接多久未确认后，取出前先检查(秒)
+            keepalive_interval: 保活检查周期(秒)，0表示不启动保活线程
+            connect: 建立连接的函数，默认u2.connect
+        """
+        self.validate_after = validate_after
+        self.keepalive_interval = keepalive_interval
+        self._connect = connect or u2.connect
+        self._sessions: Dict[Optional[str], DeviceSession] = {}
+        self._sessions_lock = threading.Lock()
+        self._keepalive_thread = None
+
+    def _session_for(self, serial: Optional[str]) -> DeviceSession:
+        with self._sessions_lock:
+            session = self._sessions.get(serial)
+            if session is None:
+                session = DeviceSession(serial, None)
+                self._sessions[serial] = session
+            return session
+
+    def get(self, serial: Optional[str]) -> Any:
+        """获取设备连接，没有或已失效时重新连接
+
+        Args:
+            serial: 设备序列号或IP:端口，None表示默认设备
+
+        Raises:
+            连接失败时抛出u2.connect的异常
+        """
+        session = self._session_for(serial)
+        with session.lock:
+            if session.device is not None:
+                if time.monotonic() - session.validated_at < self.validate_after:
+                    return session.device
+                if self._alive(session):
+                    return session.device
+                log.warning(f"设备 {serial} 连接已失效，重新连接")
+            self._reconnect(session)
+        self._ensure_keepalive()
+        return session.device
+
+    def check(self, serial: Optional[str]) -> bool:
+        """检查设备是否在线，连接失效时重新连接一次"""
+        session = self._session_for(serial)
+        with session.lock:
+            if session.device is not None and self._alive(session):
+                return True
+            try:
+                self._reconnect(session)
+            except Exception:
+                return False
+            return self._alive(session)
+
+    def invalidate(self, serial: Optional[str]) -> None:
+        """丢弃设备连接，下次get时重新连接"""
+        with self._sessions_lock:
+            self._sessions.pop(serial, None)
+
+    def _reconnect(self, session: DeviceSession) -> None:
+        session.device = None
+        device = self._connect(session.serial)
+        session.device = device
+        session.connected_at = time.time()
+        session.validated_at = time.monotonic()
+        log.info(f"已连接设备 {session.serial}")
+
+    @staticmethod
+    def _alive(session: DeviceSession) -> bool:
+        try:
+            session.device.info
+            session.validated_at = time.monotonic()
+            return True
+        except Exception as e:
+            log.debug(f"设备 {session.serial} 连接检查失败: {str(e)}")
+            return False
+
+    def _ensure_keepalive(self) -> None:
+        if self.keepalive_interval <= 0 or self._keepalive_thread is not None:
+            return
+        with self._sessions_lock:
+            if self._keepalive_thread is None:
+                self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name='device-keepalive', daemon=True)
+                self._keepalive_thread.start()
+
+    def _keepalive_loop(self) -> None:
+        while True:
+            time.sleep(self.keepalive_interval)
+            with self._sessions_lock:
+                sessions = list(self._sessions.values())
+            for session in sessions:
+                # 正在使用的连接(锁被占用)和最近确认过的连接跳过
+                if session.device is None or time.monotonic() - session.validated_at < self.keepalive_interval:
+                    continue
+                if not session.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if not self._alive(session):
+                        log.warning(f"设备 {session.serial} 保活检查失败，下次使用时重新连接")
+                        session.validated_at = 0.0
+                finally:
+                    session.lock.release()
+
+
+def get_device(serial: Optional[str]) -> Any:
+    """获取共享的u2.Device，见DeviceSessionCache.get"""
+    return DeviceSessionCache.get_instance().get(serial)
@@ -0,0 +1,67 @@
+import threading
+import cv2
+import numpy as np
+
+
+class FrameChangeDetector:
+    """基于分块差异的画面变化检测
+
+    把画面按cell*cell像素分块取灰度均值作为签名，与该key上一次的参考签名
+    逐块比较，任一块的差异超过阈值即视为变化。按块取最大值而不是整幅平均，
+    小块文字、按钮出现等局部变化不会被大面积不变的画面稀释。
+    只有判定为变化时才更新参考签名，避免缓慢渐变的画面在相邻两帧间始终
+    低于阈值而被漏判。
+    """
+
+    def __init__(self, cell=8, threshold=12.0):
+        """
+        Args:
+            cell: 分块边长(像素)
+            threshold: 单个分块的灰度均值差(0-255)超过该值视为画面变化
+        """
+        self.cell = cell
+        self.threshold = threshold
+        self._references = {}
+        self._lock = threading.Lock()
+
+    def signature(self, image):
+        """计算画面签名，image可以是numpy数组或PIL图片"""
+        frame = np.asarray(image)
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        height, width = frame.shape[:2]
+        size = (max(1, width // self.cell), max(1, height // self.cell))
+        thumbnail = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return thumbnail.astype(np.int16)
+
+    def difference(self, first, second):
+        """两个签名中差异最大的分块的灰度差，尺寸不同时视为完全不同"""
+        if first.shape != second.shape:
+            return 255.0
+        return float(np.max(np.abs(first - second)))
+
+    def is_changed(self, key, image):
+        """判断画面相对该key的参考帧是否变化，变化时以当前帧作为新的参考帧
+
+        Args:
+            key: 参考帧的标识，如截图区域
+            image: 当前画面
+
+        Returns:
+            bool: 第一次检测或画面变化时返回True
+        """
+        current = self.signature(image)
+        with self._lock:
+            reference = self._references.get(key)
+            if reference is not None and self.difference(reference, current) <= self.threshold:
+                return False
+            self._references[key] = current
+            return True
+
+    def reset(self, key=None):
+        """清除参考帧，key为None时全部清除"""
+        with self._lock:
+            if key is None:
+                self._references.clear()
+            else:
+                self._references.pop(key, None)
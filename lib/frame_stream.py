@@ -0,0 +1,244 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+import glob
+import logging
+import os
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+from lib.frame_diff import FrameChangeDetector
+from lib.wait import ChangeSignal
+
+log = logging.getLogger(__name__)
+
+
+class DeviceFrameSource:
+    """通过UIAutomator2连接持续获取设备画面"""
+
+    def __init__(self, device):
+        """
+        Args:
+            device: UIAutomator2设备实例
+        """
+        self.device = device
+
+    def read(self) -> np.ndarray:
+        """读取一帧BGR画面"""
+        return self.device.screenshot(format='opencv')
+
+
+class ReplayFrameSource:
+    """回放录制好的画面，用于无设备时的调试和测试"""
+
+    def __init__(self, frames: Union[str, List[np.ndarray]], loop: bool = True):
+        """
+        Args:
+            frames: 图片目录(按文件名排序回放)或BGR帧列表
+            loop: 回放完后是否从头循环，否则停留在最后一帧
+        """
+        if isinstance(frames, str):
+            paths = sorted(
+                path for path in glob.glob(os.path.join(frames, '*'))
+                if path.lower().endswith(('.png', '.jpg', '.jpeg'))
+            )
+            frames = [cv2.imread(path) for path in paths]
+        if not frames:
+            raise ValueError("回放画面为空")
+        self.frames = frames
+        self.loop = loop
+        self._index = 0
+
+    def read(self) -> np.ndarray:
+        frame = self.frames[self._index]
+        if self._index + 1 < len(self.frames):
+            self._index += 1
+        elif self.loop:
+            self._index = 0
+        return frame
+
+
+class FrameStream:
+    """设备画面流
+
+    后台线程持续从画面源读取画面，最新的若干帧保存在环形缓冲区中，
+    动作读取"当前画面"时直接取缓冲区中的最新帧，不再等待一次截图请求。
+    每采集一帧做一次缩略图比较，画面变化时通知changes。
+    每个设备最多一个画面流，通过for_device获取。
+    """
+    _streams: Dict[str, 'FrameStream'] = {}
+    _lock = threading.Lock()  # 画面流注册表锁
+
+    @classmethod
+    def for_device(cls, device_id: str, device=None,
+                   settings: Optional[Dict[str, Any]] = None) -> 'FrameStream':
+        """获取设备的画面流，不存在时创建并启动
+
+        Args:
+            device_id: 设备ID
+            device: UIAutomator2设备实例，配置了replay_dir时可不传
+            settings: 截图配置(配置文件中的screenshot段)
+                - stream_interval: 采集间隔(秒)，默认0.2
+                - stream_buffer_size: 环形缓冲区帧数，默认3
+                - stream_change_threshold: 画面变化阈值(分块灰度差)，默认12.0
+                - replay_dir: 回放目录，设置后使用录制画面代替设备画面
+
+        Returns:
+            FrameStream: 已启动的画面流
+        """
+        settings = settings or {}
+        with cls._lock:
+            stream = cls._streams.get(device_id)
+            if stream is None:
+                replay_dir = settings.get('replay_dir')
+                source = ReplayFrameSource(replay_dir) if replay_dir else DeviceFrameSource(device)
+                stream = cls(
+                    device_id,
+                    source,
+                    interval=settings.get('stream_interval', 0.2),
+                    buffer_size=settings.get('stream_buffer_size', 3),
+                    change_threshold=settings.get('stream_change_threshold', 12.0)
+                )
+                stream.start()
+                cls._streams[device_id] = stream
+            return stream
+
+    @classmethod
+    def get(cls, device_id: str) -> Optional['FrameStream']:
+        """获取设备已启动的画面流，没有时返回None"""
+        return cls._streams.get(device_id)
+
+    @classmethod
+    def release(cls, device_id: str) -> None:
+        """停止并移除设备的画面流"""
+        with cls._lock:
+            stream = cls._streams.pop(device_id, None)
+        if stream:
+            stream.stop()
+
+    def __init__(self, device_id: str, source, interval: float = 0.2, buffer_size: int = 3,
+                 change_threshold: float = 12.0):
+        """
+        Args:
+            device_id: 设备ID
+            source: 画面源，需提供read()方法返回BGR帧
+            interval: 采集间隔(秒)
+            buffer_size: 环形缓冲区帧数
+            change_threshold: 画面变化阈值，超过时通知changes
+        """
+        self.device_id = device_id
+        self.source = source
+        self.interval = interval
+        self._buffer: "deque[Tuple[float, np.ndarray]]" = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        # 画面变化信号，等待类动作据此提前重新检查
+        self.changes = ChangeSignal()
+        self._detector = FrameChangeDetector(threshold=change_threshold)
+        self._running = False
+        self._thread = None
+        self._ui_changed_at = 0.0  # 最近一次改变界面的操作(点击、滑动等)的时间戳
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._capture_loop,
+            name=f'frame-stream-{self.device_id}',
+            daemon=True
+        )
+        self._thread.start()
+        log.info(f"设备 {self.device_id} 画面流已启动")
+
+    def stop(self) -> None:
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+        log.info(f"设备 {self.device_id} 画面流已停止")
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def _capture_loop(self) -> None:
+        while self._running:
+            started = time.monotonic()
+            try:
+                # 以开始截图的时间作为帧的时间戳：截图耗时较长，开始于点击之前的帧
+                # 即使在点击之后才返回，也不会被当作点击后的画面
+                captured_at = time.time()
+                frame = self.source.read()
+                with self._condition:
+                    self._buffer.append((captured_at, frame))
+                    self._condition.notify_all()
+                if self._detector.is_changed(self.device_id, frame):
+                    self.changes.notify()
+            except Exception as e:
+                log.warning(f"设备 {self.device_id} 采集画面失败: {str(e)}")
+            elapsed = time.monotonic() - started
+            time.sleep(max(0.0, self.interval - elapsed))
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[np.ndarray]:
+        """获取最新一帧
+
+        Args:
+            max_age: 允许的最大帧龄(秒)，超过时视为没有可用帧
+
+        Returns:
+            Optional[np.ndarray]: 最新的BGR帧，没有可用帧时返回None
+        """
+        with self._condition:
+            if not self._buffer:
+                return None
+            timestamp, frame = self._buffer[-1]
+        if max_age is not None and time.time() - timestamp > max_age:
+            return None
+        return frame
+
+    def last_frame_time(self) -> Optional[float]:
+        """最新一帧开始采集的时间戳，没有帧时返回None"""
+        with self._condition:
+            return self._buffer[-1][0] if self._buffer else None
+
+    def wait_for_frame(self, after: float, timeout: float) -> Optional[np.ndarray]:
+        """等待一帧采集时间晚于after的画面
+
+        Args:
+            after: 时间戳(time.time())
+            timeout: 最长等待秒数
+
+        Returns:
+            Optional[np.ndarray]: 满足条件的帧，超时返回None
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._running:
+                if self._buffer and self._buffer[-1][0] > after:
+                    return self._buffer[-1][1]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+        return None
+
+    def mark_ui_changed(self) -> None:
+        """记录界面已被操作改变，之后current_frame只返回此后开始采集的帧"""
+        self._ui_changed_at = time.time()
+
+    def current_frame(self, max_age: Optional[float] = None, fresh_timeout: float = 2.0) -> Optional[np.ndarray]:
+        """获取当前画面
+
+        最新帧开始采集于最近一次界面操作之后时按max_age检查帧龄后返回；
+        否则等待采集到界面操作之后的新帧，避免读到操作前的画面(如刚关闭的弹窗)。
+
+        Args:
+            max_age: 没有界面操作时允许的最大帧龄(秒)
+            fresh_timeout: 界面操作后等待新帧的最长时间(秒)
+
+        Returns:
+            Optional[np.ndarray]: 满足条件的BGR帧，没有时返回None，调用方退回直接截图
+        """
+        changed_at = self._ui_changed_at
+        if (self.last_frame_time() or 0) <= changed_at:
+            return self.wait_for_frame(after=changed_at, timeout=fresh_timeout)
+        return self.latest(max_age=max_age)
@@ -1,13 +1,26 @@
 import os
+import threading
 import cv2
 from paddleocr import PaddleOCR
 
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """获取进程内共享的PaddleOCR模型，第一次使用时加载"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = PaddleOCR(use_angle_cls=True, lang='ch')
+    return _model
+
 class OCR:
     def __init__(self, image_path):
         self.image_path = image_path
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Image file not found: {image_path}")
-        self.ocr_model = PaddleOCR(use_angle_cls=True, lang='ch')
+        self.ocr_model = get_model()
 
     def ocr(self):
         return self.ocr_model.ocr(self.image_path, cls=True)
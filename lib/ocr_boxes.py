@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+
+
+def sorted_boxes(dt_boxes):
+    """按从上到下、从左到右排序文字检测框
+
+    纵坐标相差小于10像素的框视为同一行，行内按横坐标排序。
+    与PaddleOCR的排序规则一致，识别结果顺序与PaddleOCR.ocr相同。
+
+    Args:
+        dt_boxes: 检测框数组，形状为(N, 4, 2)
+
+    Returns:
+        list: 排序后的检测框
+    """
+    boxes = sorted(dt_boxes, key=lambda box: (box[0][1], box[0][0]))
+    for i in range(len(boxes) - 1):
+        for j in range(i, -1, -1):
+            if abs(boxes[j + 1][0][1] - boxes[j][0][1]) < 10 and boxes[j + 1][0][0] < boxes[j][0][0]:
+                boxes[j], boxes[j + 1] = boxes[j + 1], boxes[j]
+            else:
+                break
+    return boxes
+
+
+def get_rotate_crop_image(image, points):
+    """按四边形检测框透视变换裁剪文字块，竖排文字块旋转为横排
+
+    Args:
+        image: 原图
+        points: 四个顶点(左上、右上、右下、左下)
+
+    Returns:
+        np.ndarray: 裁剪后的文字块
+    """
+    points = np.asarray(points, dtype=np.float32)
+    width = int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])))
+    height = int(max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])))
+    target = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    matrix = cv2.getPerspectiveTransform(points, target)
+    crop = cv2.warpPerspective(
+        image, matrix, (width, height),
+        borderMode=cv2.BORDER_REPLICATE,
+        flags=cv2.INTER_CUBIC
+    )
+    crop_height, crop_width = crop.shape[0:2]
+    if crop_width and crop_height / crop_width >= 1.5:
+        crop = np.rot90(crop)
+    return crop
+
+
+def get_minarea_rect_crop(image, points):
+    """按检测框的最小外接矩形裁剪文字块(多边形检测框使用)
+
+    Args:
+        image: 原图
+        points: 检测框顶点
+
+    Returns:
+        np.ndarray: 裁剪后的文字块
+    """
+    rect = cv2.minAreaRect(np.asarray(points).astype(np.int32))
+    corners = sorted(cv2.boxPoints(rect), key=lambda point: point[0])
+    # 左侧两点中靠上的为左上，右侧两点中靠上的为右上
+    left_top, left_bottom = (corners[0], corners[1]) if corners[1][1] > corners[0][1] else (corners[1], corners[0])
+    right_top, right_bottom = (corners[2], corners[3]) if corners[3][1] > corners[2][1] else (corners[3], corners[2])
+    return get_rotate_crop_image(image, [left_top, right_top, right_bottom, left_bottom])
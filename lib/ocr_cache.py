@@ -0,0 +1,100 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class OCRResultCache:
+    """OCR原始识别结果的LRU缓存
+
+    key由像素内容哈希、识别区域和引擎参数组成，同一画面用不同条件
+    (text/textContains/textMatches)多次查询时只需识别一次。
+    """
+
+    def __init__(self, max_size=64):
+        """
+        Args:
+            max_size: 最多缓存的识别结果数
+        """
+        self.max_size = max_size
+        self._configured = False
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_size):
+        """设置缓存容量，只有第一次调用生效(与共享OCR服务的配置一致)
+
+        Args:
+            max_size: 最多缓存的识别结果数
+
+        Returns:
+            bool: 本次设置是否生效
+        """
+        with self._lock:
+            if self._configured:
+                return False
+            self._configured = True
+            self.max_size = max_size
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            return True
+
+    @staticmethod
+    def make_key(image, region=None, params=None):
+        """生成缓存key
+
+        Args:
+            image: numpy数组或PIL图片
+            region: 识别区域 [x1, y1, x2, y2]
+            params: 影响识别结果的引擎参数，如 {'engine': 'paddle', 'lang': 'ch'}
+
+        Returns:
+            tuple: 可哈希的缓存key
+        """
+        frame = np.ascontiguousarray(np.asarray(image))
+        digest = hashlib.blake2b(frame.data, digest_size=16).hexdigest()
+        return (
+            digest,
+            frame.shape,
+            str(frame.dtype),
+            tuple(region) if region else None,
+            tuple(sorted(params.items())) if params else None,
+        )
+
+    def get(self, key):
+        """命中时返回缓存结果并刷新其位置，未命中返回None"""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        """返回命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._items),
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+# 进程内共享的默认缓存，PaddleOCR与RapidOCR的结果通过引擎参数区分
+default_cache = OCRResultCache()
@@ -1,17 +1,32 @@
+import threading
 from rapidocr_onnxruntime import RapidOCR
 from lib.text_matcher import TextMatcher
+from lib.ocr_cache import default_cache
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """获取进程内共享的RapidOCR实例，第一次使用时加载"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RapidOCR()
+    return _engine
 
 class Ocr:
     def __init__(self, image_path):
         self.image_path = image_path
+        self._result = None
 
     @property
     def ocr(self):
-        return RapidOCR()
+        return get_engine()
 
     def text_rect_and_text(self, **kwargs):
-        result, elapse = self.ocr(self.image_path)
-        for el in result:
+        result, elapse = self.result()
+        for el in result or []:
           rect, rect_text, score = el
           if TextMatcher(rect_text).match(**kwargs):
             return rect, rect_text
@@ -51,7 +66,17 @@ class Ocr:
         return self.text(**kwargs) is not None
 
     def result(self):
-        return self.ocr(self.image_path)
+        # 同一张图只识别一次，多次查询复用结果
+        if self._result is None:
+            key = None
+            if not isinstance(self.image_path, str):
+                key = default_cache.make_key(self.image_path, params={'engine': 'rapidocr'})
+                self._result = default_cache.get(key)
+            if self._result is None:
+                self._result = self.ocr(self.image_path)
+                if key is not None:
+                    default_cache.put(key, self._result)
+        return self._result
 
     def text_position(self, position = 'center', **kwargs):
         r = self.info(**kwargs)
@@ -0,0 +1,334 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import atexit
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+# 支持的追加格式
+FORMATS = ('jsonl', 'csv')
+
+
+def infer_format(path: Union[str, Path]) -> str:
+    """按扩展名推断格式，.csv为csv，.json为json数组，其余为jsonl"""
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        return 'csv'
+    if suffix == '.json':
+        return 'json'
+    return 'jsonl'
+
+
+class WriterClosedError(RuntimeError):
+    """写入器已关闭"""
+
+
+class RecordLogWriter:
+    """只追加的记录文件(JSON Lines或CSV)
+
+    每次append只把新记录写入文件缓冲区，不读取已有内容，耗时与文件大小无关。
+    距上次同步超过fsync_interval秒时flush并fsync，进程崩溃最多丢失这段时间内
+    的记录；崩溃留下的半行在下次打开时另起一行，读取时跳过。
+    """
+
+    def __init__(self, path: Union[str, Path], format: str = 'jsonl',
+                 fields: Optional[Sequence[str]] = None,
+                 fsync_interval: float = 1.0, buffer_size: int = 64 * 1024):
+        """
+        Args:
+            path: 文件路径
+            format: jsonl或csv
+            fields: csv的列名，不指定时取第一批记录的键；文件已有表头时以表头为准
+            fsync_interval: 两次fsync的最小间隔(秒)，0表示每次append都fsync
+            buffer_size: 写缓冲区大小(字节)
+        """
+        if format not in FORMATS:
+            raise ValueError(f"不支持的追加格式: {format}")
+        self.path = Path(path)
+        self.format = format
+        self.fsync_interval = max(0.0, float(fsync_interval))
+        self._fields = list(fields) if fields else None
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        needs_newline = False
+        if self.path.exists() and self.path.stat().st_size > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+            if format == 'csv':
+                with open(self.path, 'r', encoding='utf-8', newline='') as f:
+                    header = next(csv.reader(f), None)
+                if header:
+                    self._fields = header
+        self._has_header = format == 'csv' and self.path.exists() and self.path.stat().st_size > 0
+
+        self._file = open(self.path, 'a', encoding='utf-8', newline='', buffering=buffer_size)
+        if needs_newline:
+            log.warning(f"{self.path} 末尾有不完整的记录，从新行开始追加")
+            self._file.write('\n')
+        self._csv = csv.writer(self._file) if format == 'csv' else None
+        self._last_sync = time.monotonic()
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        """追加记录
+
+        Returns:
+            int: 写入的记录数
+        """
+        records = list(records)
+        if not records:
+            return 0
+        with self._lock:
+            if self._closed:
+                raise WriterClosedError(f"{self.path} 已关闭")
+            if self.format == 'jsonl':
+                self._file.write(''.join(
+                    json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records
+                ))
+            else:
+                self._append_csv(records)
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+        return len(records)
+
+    def _append_csv(self, records: List[Dict[str, Any]]) -> None:
+        if self._fields is None:
+            self._fields = list(_field_names(records))
+        if not self._has_header:
+            self._csv.writerow(self._fields)
+            self._has_header = True
+        # 表头之外的字段不写入；字典和列表等嵌套值以JSON字符串写入
+        self._csv.writerows(
+            [_csv_value(record.get(field)) for field in self._fields] for record in records
+        )
+
+    def flush(self, sync: bool = True) -> None:
+        """把缓冲区写入文件，sync为True时同时fsync"""
+        with self._lock:
+            if self._closed:
+                return
+            if sync:
+                self._sync()
+            else:
+                self._file.flush()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            try:
+                self._sync()
+            finally:
+                self._file.close()
+
+
+def _field_names(records: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """按出现顺序返回所有记录的键(去重)"""
+    seen = {}
+    for record in records:
+        for field in record:
+            seen.setdefault(field, None)
+    return iter(seen)
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+# 进程内打开的写入器，同一文件共用一个，超过上限时关闭最久未使用的
+MAX_OPEN_WRITERS = 64
+_writers: 'OrderedDict[str, RecordLogWriter]' = OrderedDict()
+_writers_lock = threading.Lock()
+
+
+def get_writer(path: Union[str, Path], format: str = 'jsonl', **options) -> RecordLogWriter:
+    """获取文件的共享写入器，options见RecordLogWriter，只在第一次打开时生效
+
+    Raises:
+        ValueError: 同一文件已按其他格式打开时抛出
+    """
+    key = os.path.abspath(path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is not None:
+            if writer.format != format:
+                raise ValueError(f"{path} 已按 {writer.format} 格式打开")
+            _writers.move_to_end(key)
+            return writer
+        writer = RecordLogWriter(path, format, **options)
+        _writers[key] = writer
+        while len(_writers) > MAX_OPEN_WRITERS:
+            _, oldest = _writers.popitem(last=False)
+            oldest.close()
+        return writer
+
+
+class RecordAppender:
+    """向文件追加记录的写入函数，可交给后台导出队列延后调用
+
+    每次调用时才通过get_writer取共享写入器，写入器在此期间被关闭(超过
+    MAX_OPEN_WRITERS被淘汰、compact或close_writer)时自动重新打开。
+    路径、格式和选项相同的两个RecordAppender相等，导出队列据此合并记录。
+    """
+
+    def __init__(self, path: Union[str, Path], format: str = 'jsonl', **options):
+        """
+        Args:
+            path: 文件路径
+            format: jsonl或csv
+            options: 见RecordLogWriter
+        """
+        self.path = os.path.abspath(path)
+        self.format = format
+        self.options = options
+
+    def __call__(self, records: Iterable[Dict[str, Any]]) -> int:
+        records = list(records)
+        try:
+            return get_writer(self.path, self.format, **self.options).append(records)
+        except WriterClosedError:
+            # 取出写入器后、写入前被其他线程关闭，重新打开后再写一次
+            return get_writer(self.path, self.format, **self.options).append(records)
+
+    def __eq__(self, other: Any) -> bool:
+        return (isinstance(other, RecordAppender) and
+                (self.path, self.format, self.options) == (other.path, other.format, other.options))
+
+    def __repr__(self) -> str:
+        return f"RecordAppender({self.path!r}, {self.format!r})"
+
+
+def close_writer(path: Union[str, Path]) -> None:
+    """关闭文件的共享写入器(如果已打开)"""
+    with _writers_lock:
+        writer = _writers.pop(os.path.abspath(path), None)
+    if writer is not None:
+        writer.close()
+
+
+def flush_all(sync: bool = True) -> None:
+    """把所有打开的写入器写入磁盘"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        try:
+            writer.flush(sync)
+        except Exception as e:
+            log.error(f"写入 {writer.path} 失败: {str(e)}")
+
+
+def close_all() -> None:
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        try:
+            writer.close()
+        except Exception as e:
+            log.error(f"关闭 {writer.path} 失败: {str(e)}")
+
+
+atexit.register(close_all)
+
+
+def read_records(path: Union[str, Path], format: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """逐条读取记录文件，跳过无法解析的行(如崩溃留下的半行)
+
+    Args:
+        path: 文件路径
+        format: jsonl、csv或json(数组)，不指定时按扩展名推断
+
+    Yields:
+        dict: 记录，csv的值均为字符串
+    """
+    format = format or infer_format(path)
+    if format == 'json':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        yield from (data if isinstance(data, list) else [data])
+    elif format == 'csv':
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    log.warning(f"{path} 第 {line_no} 行不是有效的JSON，已跳过")
+
+
+def compact(path: Union[str, Path], key: Union[str, Sequence[str]],
+            output: Optional[Union[str, Path]] = None, format: Optional[str] = None) -> Tuple[int, int]:
+    """按key去重压缩记录文件
+
+    相同key只保留最后写入的记录，位置为该key第一次出现的位置；缺少key字段的
+    记录全部保留。结果先写入临时文件再替换，压缩过程中崩溃不会损坏原文件。
+    压缩的文件不应同时被其他进程追加写入。
+
+    Args:
+        path: 记录文件
+        key: 去重字段，多个字段时传列表
+        output: 输出文件，默认覆盖原文件；格式按扩展名推断(.json输出JSON数组)
+        format: 输入格式，不指定时按扩展名推断
+
+    Returns:
+        Tuple[int, int]: (读取的记录数, 保留的记录数)
+    """
+    keys = [key] if isinstance(key, str) else list(key)
+    path = Path(path)
+    output = Path(output) if output else path
+    # 本进程的写入器先写完并关闭，之后的追加会重新打开压缩后的文件
+    close_writer(path)
+    close_writer(output)
+
+    latest: Dict[Any, Dict[str, Any]] = {}
+    total = 0
+    for record in read_records(path, format):
+        total += 1
+        values = [record.get(field) for field in keys]
+        if any(value is None for value in values):
+            latest[('__no_key__', total)] = record
+        else:
+            latest[json.dumps(values, ensure_ascii=False, sort_keys=True, default=str)] = record
+    records = list(latest.values())
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output.with_name(f".{output.name}.compact")
+    output_format = infer_format(output)
+    with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+        if output_format == 'json':
+            json.dump(records, f, ensure_ascii=False, indent=2, default=str)
+        elif output_format == 'csv':
+            writer = csv.writer(f)
+            fields = list(_field_names(records))
+            writer.writerow(fields)
+            writer.writerows([_csv_value(record.get(field)) for field in fields] for record in records)
+        else:
+            f.write(''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, output)
+    log.info(f"压缩 {path}: 读取 {total} 条，保留 {len(records)} 条")
+    return total, len(records)
@@ -1,10 +1,64 @@
 import re
 import logging
 import os
+from collections import deque
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
+class MultiPatternMatcher:
+    """多模式包含匹配(Aho-Corasick自动机)
+
+    构建一次后，每段文本只需扫描一遍即可得到其中包含的全部模式，
+    匹配耗时与模式数量无关
+    """
+
+    def __init__(self, patterns):
+        self.patterns = [p for p in dict.fromkeys(patterns) if p]
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for pattern in self.patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(pattern)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def search(self, text):
+        """返回text中包含的全部模式"""
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found.update(self._output[state])
+        return found
+
 class TextMatcher:
     def __init__(self, text):
         self.text = text
@@ -35,3 +89,8 @@ if __name__ == "__main__":
     assert not matcher.match(text="看指定视频得金币1")
     assert not matcher.match(textMatches=r"^看指定视频得金币1$")
     assert not matcher.match(textContains="看指定视频得金币1")
+
+    multi_matcher = MultiPatternMatcher(["同意", "同意并继续", "确定", "继续"])
+    assert multi_matcher.search("同意并继续") == {"同意", "同意并继续", "继续"}
+    assert multi_matcher.search("确定取消") == {"确定"}
+    assert not multi_matcher.search("取消")
@@ -0,0 +1,186 @@
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class ChangeSignal:
+    """变化信号
+
+    画面流检测到画面变化、UI快照失效时调用notify，正在等待的轮询会被
+    提前唤醒并重新检查。通过版本号判断"从某一时刻起是否发生过变化"，
+    不会漏掉检查期间发生的变化。
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+        self._linked: List['ChangeSignal'] = []
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def link(self, target: 'ChangeSignal') -> None:
+        """本信号通知时同时通知target"""
+        with self._condition:
+            if target is not self and target not in self._linked:
+                self._linked.append(target)
+
+    def unlink(self, target: 'ChangeSignal') -> None:
+        with self._condition:
+            if target in self._linked:
+                self._linked.remove(target)
+
+    def notify(self) -> None:
+        """通知发生了变化，唤醒所有等待方"""
+        with self._condition:
+            self._version += 1
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+            linked = list(self._linked)
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        for target in linked:
+            target.notify()
+
+    def wait(self, since: int, timeout: float) -> bool:
+        """等待版本号不再等于since
+
+        Args:
+            since: 开始等待前读取的version
+            timeout: 最长等待秒数
+
+        Returns:
+            bool: 期间发生了变化返回True，超时返回False
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._version != since, timeout)
+
+    async def wait_async(self, since: int, timeout: float) -> bool:
+        """wait的异步版本，等待期间不占用线程"""
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            if self._version != since:
+                return True
+            future = loop.create_future()
+            self._async_waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._condition:
+                if (loop, future) in self._async_waiters:
+                    self._async_waiters.remove((loop, future))
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class Backoff:
+    """自适应轮询间隔
+
+    第一次间隔为initial，之后每次乘以factor直到maximum，每个间隔加入
+    ±jitter比例的随机抖动，避免多台设备的轮询同时发生。
+    """
+
+    def __init__(self, initial: float = 0.1, maximum: float = 2.0,
+                 factor: float = 2.0, jitter: float = 0.2):
+        """
+        Args:
+            initial: 第一次轮询间隔(秒)
+            maximum: 最大轮询间隔(秒)
+            factor: 每次失败后间隔的放大倍数
+            jitter: 随机抖动比例(0-1)
+        """
+        self.maximum = max(0.0, float(maximum))
+        self.initial = min(max(0.0, float(initial)), self.maximum)
+        self.factor = max(1.0, float(factor))
+        self.jitter = min(max(0.0, float(jitter)), 1.0)
+        self._current = self.initial
+
+    def reset(self) -> None:
+        """回到初始间隔，界面发生变化后重新快速轮询"""
+        self._current = self.initial
+
+    def next(self) -> float:
+        """返回下一次等待的秒数"""
+        delay = self._current
+        self._current = min(self._current * self.factor, self.maximum)
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return min(delay, self.maximum)
+
+
+def wait_until(check: Callable[[], Any], timeout: float, max_interval: float = 2.0,
+               initial: float = 0.1, factor: float = 2.0, jitter: float = 0.2,
+               signal: Optional[ChangeSignal] = None) -> Any:
+    """自适应轮询，直到check返回真值或超时
+
+    第一次检查立即执行，之后按Backoff退避。指定signal时，等待期间一旦
+    收到变化通知就提前重新检查(两次检查至少间隔initial)，并把间隔重置为initial。
+
+    Args:
+        check: 检查函数，返回真值表示等待结束
+        timeout: 超时秒数
+        max_interval: 最大轮询间隔(秒)
+        initial/factor/jitter: 见Backoff
+        signal: 变化信号
+
+    Returns:
+        check返回的真值；超时时返回最后一次检查的结果
+    """
+    deadline = time.monotonic() + timeout
+    backoff = Backoff(initial, max_interval, factor, jitter)
+    while True:
+        version = signal.version if signal else 0
+        result = check()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return result
+        delay = min(backoff.next(), remaining)
+        if signal:
+            started = time.monotonic()
+            if signal.wait(version, delay):
+                log.debug("收到变化信号，重新检查")
+                backoff.reset()
+                # 两次检查至少间隔initial，画面持续变化时不会连续检查
+                time.sleep(max(0.0, min(initial, remaining) - (time.monotonic() - started)))
+        else:
+            time.sleep(delay)
+
+
+async def wait_until_async(check: Callable[[], Awaitable[Any]], timeout: float, max_interval: float = 2.0,
+                           initial: float = 0.1, factor: float = 2.0, jitter: float = 0.2,
+                           signal: Optional[ChangeSignal] = None) -> Any:
+    """wait_until的异步版本，check为协程函数"""
+    deadline = time.monotonic() + timeout
+    backoff = Backoff(initial, max_interval, factor, jitter)
+    while True:
+        version = signal.version if signal else 0
+        result = await check()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return result
+        delay = min(backoff.next(), remaining)
+        if signal:
+            started = time.monotonic()
+            if await signal.wait_async(version, delay):
+                log.debug("收到变化信号，重新检查")
+                backoff.reset()
+                await asyncio.sleep(max(0.0, min(initial, remaining) - (time.monotonic() - started)))
+        else:
+            await asyncio.sleep(delay)
@@ -1,5 +1,6 @@
 from flask import Flask, request, jsonify
 from pathlib import Path
+import asyncio
 import threading
 from typing import Dict, Any
 from rpa.utils.logger import get_logger
@@ -9,10 +10,15 @@ import yaml
 import os
 import glob
 from rpa.utils.db import DatabaseManager 
+from rpa.utils.ocr_service import OCRService
+from rpa.core.async_runner import AsyncFlowRunner
+from rpa.core.scheduler import TaskScheduler, SchedulerFullError
+from concurrent.futures import Future
 from run import load_config
 import requests
 import time
 import json
+import uuid
 
 app = Flask(__name__)
 logger = get_logger(__name__)
@@ -68,9 +74,10 @@ def run_flow(flow_config: Dict[str, Any], task_id: str, device_ip: str, start_st
         # 初始化设备
         logger.info("开始初始化设备UIAutomator2环境...")
         if not setup_uiautomator2(device_ip):
-            logger.error("设备初始化失败")
             device_manager.release_device(device_ip)
-            return
+            # 流程未执行，不作为可恢复的任务保留
+            running_tasks.pop(task_id, None)
+            raise RuntimeError(f"设备 {device_ip} 初始化失败")
         logger.info("设备初始化完成")
         
         
@@ -88,29 +95,148 @@ def run_flow(flow_config: Dict[str, Any], task_id: str, device_ip: str, start_st
         logger.error(traceback.format_exc())
         raise
 
+async def run_flow_async(flow_config: Dict[str, Any], task_id: str, device_ip: str, start_step_index: int = 0):
+    """在共享事件循环中运行流程，逻辑与run_flow相同
+    
+    Args:
+        flow_config: 流程配置
+        task_id: 任务ID
+        device_ip: 设备IP
+        start_step_index: 开始执行的步骤索引
+    """
+    from run import setup_uiautomator2, main_async
+    loop = asyncio.get_running_loop()
+    
+    try:
+        # 检查是否有已存储的任务标识
+        if task_id in running_tasks:
+            # 使用存储的variables参数
+            flow_config['variables'] = running_tasks[task_id].get('variables', {})
+            start_step_index += 1
+            logger.info(f"恢复任务 {task_id} 的执行，从步骤 {start_step_index} 开始")
+            await main_async(flow_config, device_ip, start_step_index, task_id)
+            return
+        else:
+            running_tasks[task_id] = {
+                'device_ip': device_ip,
+                'variables': flow_config.get('variables', {})
+            }
+        
+        # 初始化设备
+        logger.info("开始初始化设备UIAutomator2环境...")
+        if not await loop.run_in_executor(None, setup_uiautomator2, device_ip):
+            device_manager.release_device(device_ip)
+            # 流程未执行，不作为可恢复的任务保留
+            running_tasks.pop(task_id, None)
+            raise RuntimeError(f"设备 {device_ip} 初始化失败")
+        logger.info("设备初始化完成")
+        
+        # 执行流程
+        logger.info(f"开始执行流程: {flow_config.get('name', '未命名流程')}")
+        await main_async(flow_config, device_ip, start_step_index, task_id)
+        logger.info("流程执行完成")
+
+        # 清理任务记录
+        if task_id in running_tasks:
+            del running_tasks[task_id]
+        
+    except Exception as e:
+        logger.error(f"执行出错: {str(e)}")
+        logger.error(traceback.format_exc())
+        raise
+
+
+def launch_flow(task: Dict[str, Any], device_ip: str) -> Future:
+    """启动调度器分配了设备的任务
+    
+    Args:
+        task: 调度器中的任务
+        device_ip: 分配的设备IP
+        
+    Returns:
+        Future: 流程执行结果
+    """
+    # 加载流程配置
+    with open(task['flow_path'], 'r', encoding='utf-8') as f:
+        flow_config = yaml.safe_load(f)
+        
+    # 合并API传入的变量到流程配置中
+    variables = task['variables']
+    if variables:
+        # 如果YAML中没有variables部分，先创建
+        if 'variables' not in flow_config:
+            flow_config['variables'] = {}
+        # 合并变量，API传入的变量优先级更高
+        flow_config['variables'].update(variables)
+        logger.info(f"已合并API传入的变量: {variables}")
+    
+    task_id = task['task_id']
+    start_step_index = task['start_step_index']
+    async_engine = get_config().get('async_engine', {})
+    if async_engine.get('enabled', False):
+        # 异步模式：所有流程作为协程在同一个事件循环中运行
+        return AsyncFlowRunner.get_instance(async_engine).submit(
+            run_flow_async(flow_config, task_id, device_ip, start_step_index)
+        )
+    
+    # 创建新线程运行流程
+    future = Future()
+    def target():
+        try:
+            future.set_result(run_flow(flow_config, task_id, device_ip, start_step_index))
+        except Exception as e:
+            future.set_exception(e)
+    threading.Thread(target=target, name=f'flow-{task_id}', daemon=True).start()
+    return future
+
+def get_scheduler() -> TaskScheduler:
+    """获取任务调度器，第一次调用时创建并恢复持久化队列中的任务"""
+    return TaskScheduler.get_instance(get_config().get('scheduler', {}), launch_flow)
+
+def submit_task(flow_path: str, task_id: str, variables: Dict[str, Any] = None,
+                priority: int = None, start_step_index: int = 0) -> Dict[str, Any]:
+    """提交任务到调度器，/api/flow/start与订单轮询共用
+    
+    任务之前执行失败(仍在running_tasks中)时作为恢复任务提交：使用原来占用的设备，
+    没有传入新的variables时使用存储的variables。
+    
+    Raises:
+        SchedulerFullError: 排队任务数达到上限
+    """
+    device_ip = None
+    if task_id in running_tasks:
+        device_ip = running_tasks[task_id]['device_ip']
+        if not variables:
+            variables = running_tasks[task_id].get('variables', {})
+    return get_scheduler().submit(flow_path, task_id, variables, priority, start_step_index, device_ip)
 
 @app.route('/api/flow/start', methods=['POST'])
 def start_flow():
-    """启动流程
+    """提交流程任务
+    
+    任务写入调度队列后立即返回，由调度器在流程配置的设备空闲时启动。
     
     请求体:
     {
         "flow_path": "flows/test.yaml",
-        "task_id": "unique_task_id",  // 可选
+        "task_id": "unique_task_id",  // 可选，排队中或执行中的任务重复提交时不会重复执行
         "start_step_index": 0,         // 可选，默认从0开始
+        "priority": 0,                 // 可选，越大越先执行，默认取流程文件的scheduler.priority
         "variables": {                 // 可选，流程变量
             "var1": "新手机",
             "var2": "平板电脑",
             "var3": "自定义值"
         }
     }
+    
+    排队任务数达到上限时返回429，Retry-After头为建议的重试间隔(秒)。
     """
-    global running_tasks  # 声明使用全局的 running_tasks
     try:
         data = request.get_json()
         flow_path = data.get('flow_path')
-        task_id = data.get('task_id', str(threading.get_ident()))
+        task_id = data.get('task_id') or uuid.uuid4().hex
         start_step_index = data.get('start_step_index', 0)
+        priority = data.get('priority')
         variables = data.get('variables', {})
         
         if not flow_path:
@@ -130,55 +256,27 @@ def start_flow():
                 "message": f"流程文件不存在: {flow_path}"
             }), 404
             
-        # 获取设备 IP
-        if task_id in running_tasks:
-            device_ip = running_tasks[task_id]['device_ip']
-            # 如果是恢复任务且没有传入新的variables,使用存储的variables
-            if not variables:
-                variables = running_tasks[task_id].get('variables', {})
-        else:
-            # 获取可用设备
-            device_config = yaml.safe_load(open(flow_file, 'r', encoding='utf-8'))
-            device_ids = device_config.get('device', {}).get('ip', [])
-            if not device_ids:
-                return jsonify({
-                    "success": False,
-                    "message": "未配置设备"
-                }), 500
-            
-            # 获取可用设备
-            device_ip = device_manager.get_available_device(device_ids)  # 传入设备ID列表
-            if not device_ip:
-                return jsonify({
-                    "success": False,
-                    "message": "没有可用的空闲设备"
-                }), 500
-            
-        # 加载流程配置
-        with open(flow_file, 'r', encoding='utf-8') as f:
-            flow_config = yaml.safe_load(f)
-            
-        # 合并API传入的变量到流程配置中
-        if variables:
-            # 如果YAML中没有variables部分，先创建
-            if 'variables' not in flow_config:
-                flow_config['variables'] = {}
-            # 合并变量，API传入的变量优先级更高
-            flow_config['variables'].update(variables)
-            logger.info(f"已合并API传入的变量: {variables}")
-        
-        # 创建新线程运行流程
-        thread = threading.Thread(
-            target=run_flow,
-            args=(flow_config, task_id, device_ip, start_step_index),  # 传递开始步骤索引
-            daemon=True
-        )
-        thread.start()
+        scheduler = get_scheduler()
+        try:
+            task = submit_task(str(flow_file), task_id, variables, priority, start_step_index)
+        except SchedulerFullError as e:
+            response = jsonify({
+                "success": False,
+                "message": str(e)
+            })
+            response.headers['Retry-After'] = str(scheduler.retry_after)
+            return response, 429
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "message": str(e)
+            }), 400
         
         return jsonify({
             "success": True,
-            "message": "流程已启动",
-            "task_id": task_id
+            "message": "流程已加入队列" if task['status'] == 'queued' else "流程已在执行",
+            "task_id": task_id,
+            "status": task['status']
         })
         
     except Exception as e:
@@ -191,13 +289,15 @@ def start_flow():
 
 @app.route('/api/flow/status/<task_id>', methods=['GET'])
 def get_flow_status(task_id):
-    """获取流程状态"""
-    global running_tasks  # 声明使用全局的 running_tasks
-    if task_id in running_tasks:
-        thread = running_tasks[task_id]['thread']
+    """获取流程状态: queued/running/completed/failed"""
+    task = get_scheduler().get_task(task_id)
+    if task:
         return jsonify({
             "success": True,
-            "status": "running" if thread.is_alive() else "completed"
+            "status": task['status'],
+            "device_ip": task['device_ip'],
+            "position": task.get('position'),
+            "error": task['error']
         })
     else:
         return jsonify({
@@ -248,7 +348,12 @@ def upload_flow():
     return jsonify({"success": False, "message": "文件格式不正确，必须为 YAML 文件"}), 400
 
 def poll_external_api():
-    """轮询外部接口获取待处理订单"""
+    """轮询外部接口获取待处理订单
+    
+    每次处理整批待处理订单：跳过调度器中排队中、执行中或刚结束(poller.dedupe_ttl秒内)
+    的订单，按流程设备中的空闲设备数一次提交多个订单，其余留到下一轮。
+    远端支持时使用ETag条件请求(304时沿用上次的订单列表)和长轮询(poller.long_poll_timeout)。
+    """
     config = get_config()
     poller_settings = config.get('poller', {})
     
@@ -258,88 +363,105 @@ def poll_external_api():
         '瑞幸': 'taobao://item.taobao.com/item.htm?id=600254519991',
         '麦当劳': 'taobao://item.taobao.com/item.htm?id=727352428927'
     }
+    
+    session = requests.Session()  # 复用HTTP连接
+    etag = None
+    orders = []
+
+    def fetch_orders(url):
+        """获取待处理订单列表，列表未变化(304)时返回上次的列表，请求失败时返回None"""
+        nonlocal etag, orders
+        headers = {'If-None-Match': etag} if etag else {}
+        params = {}
+        long_poll_timeout = poller_settings.get('long_poll_timeout', 0)
+        if long_poll_timeout:
+            # 远端在有新订单或超时后才返回
+            params[poller_settings.get('long_poll_param', 'wait')] = long_poll_timeout
+        response = session.get(url, headers=headers, params=params, timeout=long_poll_timeout + 30)
+        
+        if response.status_code == 304:
+            return orders
+        if response.status_code != 200:
+            logger.error(f"请求外部接口失败: {response.status_code}")
+            return None
+        data = response.json()
+        if data.get('code') != 200:
+            logger.error(f"外部接口返回错误: {data.get('msg') or data.get('code')}")
+            return None
+        etag = response.headers.get('ETag')
+        orders = data.get('data') or []
+        return orders
 
-    def start_flow_with_retry(flow_data, max_retries=float('inf'), retry_interval=5):
-        """启动流程并在遇到500错误时重试
+    def dispatch_orders(orders):
+        """去重后按空闲设备数提交订单"""
+        scheduler = get_scheduler()
+        dedupe_ttl = poller_settings.get('dedupe_ttl', 600)
+        now = time.time()
         
-        Args:
-            flow_data: 流程数据
-            max_retries: 最大重试次数，默认无限重试
-            retry_interval: 重试间隔时间（秒）
-        """
-        retry_count = 0
-        while True:
+        new_orders = []
+        seen = set()
+        for order in orders:
+            if order.get('id') is None:
+                continue
+            task_id = str(order.get('id'))
+            if task_id in seen:
+                continue
+            seen.add(task_id)
+            task = scheduler.get_task(task_id)
+            if task and (task['status'] in ('queued', 'running') or now - (task['finished_at'] or 0) < dedupe_ttl):
+                continue
+            # 获取服务提供商对应的店铺链接，无法处理的订单不占用本轮名额
+            service_provider = order.get('serviceProvider', '')
+            intent_url = provider_url_map.get(service_provider)
+            if not intent_url:
+                logger.error(f"未找到服务提供商 {service_provider} ")
+                continue
+            new_orders.append((task_id, {
+                "intent_url": intent_url,
+                "order_id": order.get('id'),
+                "specs": order.get('productList'),
+                "service_provider": service_provider
+            }))
+        if not new_orders:
+            logger.info(f"{len(orders)} 个待处理订单均已在处理中或无法处理")
+            return
+        
+        flow_file = Path(os.environ.get('RPA_PROJECT_ROOT', '')) / poller_settings.get('flow_path', 'flows/taobao_pay.yaml')
+        with open(flow_file, 'r', encoding='utf-8') as f:
+            device_ids = (yaml.safe_load(f).get('device', {}) or {}).get('ip') or ''
+        device_ids = [ip.strip() for ip in str(device_ids).split(',') if ip.strip()]
+        # 已排队的任务会占用接下来空闲的设备
+        capacity = len(device_manager.available_devices(device_ids)) - scheduler.queued_count(str(flow_file))
+        if capacity <= 0:
+            logger.info(f"没有空闲设备，{len(new_orders)} 个订单等待下一轮")
+            return
+        logger.info(f"获取到 {len(new_orders)} 个待处理订单，本轮提交 {min(capacity, len(new_orders))} 个")
+        
+        for task_id, variables in new_orders[:capacity]:
             try:
-                response = requests.post(config.get('base_url','') + '/api/flow/start', json=flow_data)
+                submit_task(str(flow_file), task_id, variables)
+                logger.info(f"已提交{variables['service_provider']}订单处理流程: {task_id}")
                 
-                if response.status_code == 500:
-                    retry_count += 1
-                    logger.warning(f"启动流程返回500错误，这是第{retry_count}次重试")
-                    time.sleep(retry_interval)
-                    continue
-                    
-                if response.status_code == 200:
-                    logger.info(f"成功启动{flow_data['variables']['service_provider']}订单处理流程: {flow_data['task_id']}")
-                    return True
-                else:
-                    logger.error(f"启动流程失败: {response.text}")
-                    return False
-                    
+            except SchedulerFullError as e:
+                logger.warning(f"任务队列已满，剩余订单等待下一轮: {str(e)}")
+                break
             except Exception as e:
-                logger.error(f"调用流程API时出错: {str(e)}")
-                return False
+                logger.error(f"处理订单 {task_id} 时出错: {str(e)}")
     
     while poller_settings.get('auto_start', False):
+        started = time.monotonic()
         try:
             url = config.get('remote_api','') + poller_settings.get('api_url')
             if not url:
                 logger.error("未配置轮询接口URL")
                 return
                 
-            response = requests.get(url)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('code') == 200:
-                    orders = data.get('data', [])
-                    if not orders:
-                        logger.info("当前没有待处理的订单")
-                    else:
-                        logger.info(f"获取到待处理订单")
-                        
-                        # 只处理第一条数据
-                        order = orders[0]
-                        logger.info(f"获取到待处理订单: {order.get('id')}")
-                        
-                        try:
-                            # 获取服务提供商
-                            service_provider = order.get('serviceProvider', '')
-                            
-                            # 获取店铺链接
-                            intent_url = provider_url_map.get(service_provider)
-                            
-                            if not intent_url:
-                                logger.error(f"未找到服务提供商 {service_provider} ")
-                                continue
-                                
-                            flow_data = {
-                                "flow_path": 'flows/taobao_pay.yaml',
-                                "task_id": order.get('id'),
-                                "variables": {
-                                    "intent_url": intent_url,
-                                    "order_id": order.get('id'),
-                                    "specs": order.get('productList'),
-                                    "service_provider": service_provider
-                                }
-                            }
-                            
-                            # 使用重试机制启动流程
-                            start_flow_with_retry(flow_data)
-                            
-                        except Exception as e:
-                            logger.error(f"处理订单 {order.get('orderNum')} 时出错: {str(e)}")
-            else:
-                logger.error(f"请求外部接口失败: {response.status_code}")
+            current_orders = fetch_orders(url)
+            # 请求失败时返回None，错误已记录，下一轮重试
+            if current_orders:
+                dispatch_orders(current_orders)
+            elif current_orders is not None:
+                logger.info("当前没有待处理的订单")
                 
         except Exception as e:
             logger.error(f"轮询外部接口时出错: {str(e)}")
@@ -348,18 +470,24 @@ def poll_external_api():
         # 重新获取配置，以便支持动态修改配置
         config = get_config()
         poller_settings = config.get('poller', {})
-        # 等待下一次轮询
-        time.sleep(poller_settings.get('polling_interval', 5))
+        # 等待下一次轮询，长轮询时请求本身已等待，只补足剩余时间
+        time.sleep(max(0.0, poller_settings.get('polling_interval', 5) - (time.monotonic() - started)))
 
 def start_server(host='0.0.0.0', port=5000):
     """启动API服务器"""
 
+    # 创建任务调度器，恢复上次未执行完的任务
+    get_scheduler()
+
     logger.info("启动轮询任务...")
     # 在单独的线程中启动轮询，不阻塞服务器启动
     polling_thread = threading.Thread(target=poll_external_api, daemon=True)
     polling_thread.start()
     logger.info("轮询任务已启动")
 
+    # 创建共享OCR服务，按配置在后台预加载模型
+    OCRService.get_instance(get_config().get('ocr', {}))
+
     # 自动获取flows和tests/flows下的yaml文件中的IP并注册设备
     flow_paths = glob.glob('flows/*.yaml') + glob.glob('tests/flows/*.yaml')
     for flow_path in flow_paths:
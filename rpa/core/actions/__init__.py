@@ -30,7 +30,8 @@ from .flow_actions import (
     ForEachAction,
     CheckNoRepeatedValueAction,
     BreakLoopAction,
-    ContinueLoopAction
+    ContinueLoopAction,
+    ParallelAction
 )
 from .app_actions import (
     CheckAndInstallAppAction,
@@ -85,6 +86,7 @@ ACTION_MAP = {
     'set_timestamp': SetTimestampAction,
     'break_loop': BreakLoopAction,
     'continue_loop': ContinueLoopAction,
+    'parallel': ParallelAction,
     'validate_variable': ValidateVariableAction,
     'TaobaoSearchAction': TaobaoSearchAction,
     'TaobaoPayListAction': TaobaoPayListAction,
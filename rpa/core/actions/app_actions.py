@@ -7,6 +7,7 @@ from .base_action import BaseAction
 
 class CheckAndInstallAppAction(BaseAction):
     """检查并安装应用动作"""
+    invalidates_ui = True
     
     def execute(self, params: Dict[str, Any]) -> Dict[str, Any]:
         package = params.get('package')
@@ -69,18 +70,19 @@ class CheckAndInstallAppAction(BaseAction):
 
 class VerifyAppInstalledAction(BaseAction):
     """验证应用是否已安装动作"""
+    waits = True
     
     def execute(self, params: Dict[str, Any]) -> bool:
         package = params.get('package')
         timeout = params.get('timeout', 60)
+        interval = params.get('interval', 1)  # 最大检查间隔(秒)
         
         if not package:
             raise ValueError("必须提供package参数")
             
-        start_time = time.time()
         logger.info(f"开始验证应用 {package} 是否安装...")
         
-        while time.time() - start_time < timeout:
+        def is_installed() -> bool:
             try:
                 result = subprocess.run(
                     ['adb', '-s', self.device_id, 'shell', 'pm', 'list', 'packages', package],
@@ -94,8 +96,11 @@ class VerifyAppInstalledAction(BaseAction):
             except subprocess.CalledProcessError as e:
                 logger.warning(f"检查安装状态时出错: {str(e)}")
                 
-            logger.debug(f"应用 {package} 尚未安装完成，等待1秒后重试...")
-            time.sleep(1)
+            logger.debug(f"应用 {package} 尚未安装完成，稍后重试...")
+            return False
+            
+        if self._wait_until(is_installed, timeout, interval):
+            return True
             
         logger.error(f"验证应用安装超时({timeout}秒)")
         return False
@@ -104,6 +109,8 @@ class StartAppAction(BaseAction):
 
 
     """启动应用动作"""
+    invalidates_ui = True
+
     def execute(self, params: Dict[str, Any]) -> bool:
         package = params.get('package')
         max_retries = params.get('max_retries', 5)
@@ -167,6 +174,7 @@ class StartAppAction(BaseAction):
 
 class WaitForAppInstalledAction(BaseAction):
     """等待应用安装完成动作"""
+    waits = True
     
     def execute(self, params: Dict[str, Any]) -> bool:
         package = params.get('package')
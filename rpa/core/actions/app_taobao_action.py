@@ -11,6 +11,7 @@ import requests
 
 class TaobaoIntentAction(BaseAction):
     """打开淘宝并进入指定商品"""
+    invalidates_ui = True
 
     def execute(self, params: Dict[str, Any]) -> None:
         intent_url = params.get('intent_url')
@@ -35,6 +36,8 @@ class TaobaoSearchAction(BaseAction):
 
 class TaobaoPayListAction(BaseAction):
     """淘宝选购商品支付操作动作"""
+    invalidates_ui = True
+
     def execute(self, params: Dict[str, Any]) -> None:
 
 
@@ -1,15 +1,23 @@
-from typing import Dict, Any, List, Optional, Union, Tuple
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Union, Tuple
 from pathlib import Path
+import asyncio
+import functools
 import cv2
 import time
 import yaml
 import numpy as np
 from ...utils.logger import get_logger
+from lib.wait import wait_until, wait_until_async
 import subprocess
 import uiautomator2 as u2
 
 class BaseAction:
     """动作基类"""
+
+    # 执行后是否会改变界面(点击、滑动、输入等)，为True时BaseBot在执行后使UI快照失效
+    invalidates_ui = False
+    # 执行期间会等待(休眠、轮询重试)，界面可能在等待期间变化，为True时BaseBot在执行后使UI快照失效
+    waits = False
     
     def __init__(self, bot):
         """初始化动作
@@ -29,6 +37,11 @@ class BaseAction:
             self.screenshot_helper = bot.screenshot_helper
         if hasattr(bot, 'device_id'):
             self.device_id = bot.device_id
+        if hasattr(bot, 'ui_snapshot'):
+            self.ui_snapshot = bot.ui_snapshot
+        # 界面变化信号和等待引擎参数，供_wait_until使用
+        self.ui_changes = getattr(bot, 'ui_changes', None)
+        self.wait_settings = getattr(bot, 'wait_settings', None) or {}
     
     def execute(self, params: Dict[str, Any]) -> Any:
         """执行动作
@@ -43,6 +56,53 @@ class BaseAction:
             NotImplementedError: 子类必须实现此方法
         """
         raise NotImplementedError("子类必须实现execute方法")
+
+    async def execute_async(self, params: Dict[str, Any]) -> Any:
+        """异步执行动作(BaseBot.run_flow_async使用)
+        
+        默认把execute放到事件循环的线程池中执行；等待、OCR、循环等动作
+        重写此方法，等待期间不占用线程。
+        
+        Args:
+            params: 动作参数
+            
+        Returns:
+            执行结果
+        """
+        return await self._run_in_executor(self.execute, params)
+
+    def _wait_until(self, check: Callable[[], Any], timeout: float, interval: float) -> Any:
+        """按等待引擎轮询check，直到返回真值或超时
+        
+        第一次检查立即执行，之后从wait.initial_interval开始指数退避(带抖动)，
+        最长不超过interval；界面变化时提前重新检查。
+        
+        Args:
+            check: 检查函数，返回真值表示等待结束
+            timeout: 超时秒数
+            interval: 最大轮询间隔(秒)，即动作原有的检查间隔参数
+            
+        Returns:
+            check返回的真值，超时返回最后一次检查结果
+        """
+        return wait_until(check, timeout, max_interval=interval, signal=self.ui_changes, **self._backoff_params())
+
+    async def _wait_until_async(self, check: Callable[[], Awaitable[Any]], timeout: float, interval: float) -> Any:
+        """_wait_until的异步版本，check为协程函数"""
+        return await wait_until_async(check, timeout, max_interval=interval, signal=self.ui_changes,
+                                      **self._backoff_params())
+
+    def _backoff_params(self) -> Dict[str, float]:
+        return {
+            'initial': self.wait_settings.get('initial_interval', 0.1),
+            'factor': self.wait_settings.get('backoff_factor', 2.0),
+            'jitter': self.wait_settings.get('jitter', 0.2),
+        }
+
+    async def _run_in_executor(self, func: Callable, *args, **kwargs) -> Any:
+        """在事件循环的线程池中执行阻塞调用(截图、dump、点击、adb等)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
     
     def get_variable(self, name: str, default: Any = None) -> Any:
         """获取变量值
@@ -64,6 +124,24 @@ class BaseAction:
             value: 变量值
         """
         self.bot.set_variable(name, value) 
+
+    def resolve_value(self, value: Any, missing: Any = None) -> Any:
+        """解析值中的${...}变量引用
+        
+        Args:
+            value: 字符串、字典或列表
+            missing: 整个字符串为单个占位符且变量不存在时的返回值
+            
+        Returns:
+            整个字符串为单个占位符时返回变量原始值，否则返回拼接后的字符串
+        """
+        return self.bot.resolve_value(value, missing)
+    
+    def _mark_ui_changed(self) -> None:
+        """动作内部点击后通知机器人界面已变化，同一动作后续的检查使用点击后的画面"""
+        mark_ui_changed = getattr(self.bot, 'mark_ui_changed', None)
+        if mark_ui_changed:
+            mark_ui_changed()
     
     def _click_at_point(self, x: int, y: int, region: List[int] = None) -> bool:
         """使用UIAnimator2在指定坐标点执行点击"""
@@ -77,6 +155,7 @@ class BaseAction:
             
             # 使用UIAnimator2执行点击
             self.ui_animator.click(click_x, click_y)
+            self._mark_ui_changed()
             self.logger.info(f"点击坐标: ({click_x}, {click_y})")
             return True
             
@@ -4,8 +4,21 @@ import json
 import yaml
 from pathlib import Path
 from datetime import datetime
+from functools import partial
+import threading
 import mysql.connector
 import sqlite3
+from ...utils.export_queue import ExportQueue
+from ...utils.db import get_mysql_pool, get_sqlite_pool
+from lib import record_log
+
+def get_export_queue(bot) -> ExportQueue:
+    """获取进程共享的后台导出队列"""
+    return ExportQueue.get_instance(bot.config.get('export', {}))
+
+def write_behind_enabled(bot, params: Dict[str, Any]) -> bool:
+    """步骤参数write_behind优先，其次取配置export.write_behind"""
+    return params.get('write_behind', bot.config.get('export', {}).get('write_behind', False))
 
 class AppendToListAction(BaseAction):
     """向列表追加数据"""
@@ -21,8 +34,8 @@ class AppendToListAction(BaseAction):
             if not isinstance(current_list, list):
                 current_list = []
                 
-            # 解析数据
-            resolved_data = self._resolve_data(data)
+            # 解析数据中的变量引用(支持字符串、字典和列表)
+            resolved_data = self.resolve_value(data)
             
             # 添加新数据
             current_list.append(resolved_data)
@@ -41,38 +54,6 @@ class AppendToListAction(BaseAction):
             self.logger.error(f"追加数据到列表失败: {str(e)}")
             return False
             
-    def _resolve_data(self, data: Any) -> Any:
-        """解析数据中的变量引用
-        
-        处理两种情况:
-        1. 简单变量引用: "${variable_name}"
-        2. 复杂数据结构: {"key": "${variable_name}", ...}
-        """
-        if isinstance(data, str):
-            # 情况1: 简单变量引用
-            if data.startswith("${") and data.endswith("}"):
-                var_name = data[2:-1]
-                return self.bot.get_variable(var_name)
-            return data
-            
-        elif isinstance(data, dict):
-            # 情况2: 复杂数据结构
-            resolved_dict = {}
-            for key, value in data.items():
-                if isinstance(value, str) and "${" in value:
-                    # 解析变量引用
-                    var_name = value[2:-1]
-                    resolved_dict[key] = self.bot.get_variable(var_name)
-                else:
-                    resolved_dict[key] = value
-            return resolved_dict
-            
-        elif isinstance(data, list):
-            # 处理列表中的变量引用
-            return [self._resolve_data(item) for item in data]
-            
-        return data
-
 class ExportDataAction(BaseAction):
     """导出数据到文件"""
     
@@ -82,10 +63,15 @@ class ExportDataAction(BaseAction):
         Args:
             params:
                 data: 数据变量名
-                format: 导出格式(json)
+                format: 导出格式
+                    json: JSON数组，每次导出读取并重写整个文件
+                    jsonl: JSON Lines，只追加新记录
+                    csv: CSV，只追加新记录
                 filepath: 输出目录路径
                 filename: 文件名(支持变量引用)
                 mode: 导出模式(append)
+                fields: csv的列名，默认取第一批记录的键
+                write_behind: 是否交给后台导出队列写入，默认取export.write_behind配置
         """
         try:
             data_var = params['data']
@@ -100,11 +86,10 @@ class ExportDataAction(BaseAction):
 
             # 解析文件名中的变量引用
             if "${" in filename:
-                var_name = filename[filename.index("${") + 2:filename.index("}")]
-                var_value = self.bot.get_variable(var_name)
-                if var_value is None:
-                    raise ValueError(f"变量 {var_name} 未定义")
-                filename = filename.replace("${" + var_name + "}", str(var_value))
+                resolved = self.resolve_value(filename)
+                if resolved is None or "${" in str(resolved):
+                    raise ValueError(f"文件名中的变量未定义: {filename}")
+                filename = str(resolved)
             
             # 确保输出目录存在
             output_dir = Path(filepath)
@@ -114,33 +99,53 @@ class ExportDataAction(BaseAction):
             file_path = output_dir / filename
 
             if format == 'json':
-                existing_data = []
-                if file_path.exists():
-                    # 读取现有数据
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        try:
-                            existing_data = json.load(f)
-                        except json.JSONDecodeError:
-                            self.logger.warning(f"文件 {file_path} 内容无效，将重新创建")
-                            existing_data = []
-                
-                # 合并数据
-                if isinstance(data, list):
-                    existing_data.extend(data)
-                else:
-                    existing_data.append(data)
+                write = partial(self._write_json, file_path)
+            elif format in record_log.FORMATS:
+                export_config = self.bot.config.get('export', {})
+                # 写入时才取共享写入器，排队期间写入器被关闭时自动重新打开
+                write = record_log.RecordAppender(
+                    file_path, format,
+                    fields=params.get('fields'),
+                    fsync_interval=export_config.get('fsync_interval', 1.0),
+                    buffer_size=export_config.get('buffer_size', 64 * 1024)
+                )
+            else:
+                raise ValueError(f"不支持的导出格式: {format}")
 
-                # 写入所有数据
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(existing_data, f, ensure_ascii=False, indent=2)
+            # 复制一份列表，之后流程继续向原列表追加数据不影响本次导出
+            records = list(data) if isinstance(data, list) else [data]
+            if write_behind_enabled(self.bot, params):
+                get_export_queue(self.bot).submit(str(file_path), write, records)
+                self.logger.info(f"已提交 {len(records)} 条记录到导出队列: {file_path}")
+                return True
 
-            self.logger.info(f"已导出 {len(data) if isinstance(data, list) else 1} 条记录到 {file_path}")
+            write(records)
+            self.logger.info(f"已导出 {len(records)} 条记录到 {file_path}")
             return True
 
         except Exception as e:
             self.logger.error(f"导出数据失败: {str(e)}")
             return False
 
+    def _write_json(self, file_path: Path, records: List[Any]) -> None:
+        """把记录追加到JSON数组文件"""
+        existing_data = []
+        if file_path.exists():
+            # 读取现有数据
+            with open(file_path, 'r', encoding='utf-8') as f:
+                try:
+                    existing_data = json.load(f)
+                except json.JSONDecodeError:
+                    self.logger.warning(f"文件 {file_path} 内容无效，将重新创建")
+                    existing_data = []
+        
+        # 合并数据
+        existing_data.extend(records)
+
+        # 写入所有数据
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(existing_data, f, ensure_ascii=False, indent=2)
+
 class SetVariableAction(BaseAction):
     """设置变量值"""
     
@@ -149,7 +154,7 @@ class SetVariableAction(BaseAction):
             # 支持单个变量设置
             if "name" in params and "value" in params:
                 name = params["name"]
-                value = self._resolve_value(params["value"])
+                value = self.resolve_value(params["value"])
                 self.set_variable(name, value)
                 return True
                 
@@ -157,7 +162,7 @@ class SetVariableAction(BaseAction):
             elif "variables" in params:
                 variables = params["variables"]
                 for name, value in variables.items():
-                    resolved_value = self._resolve_value(value)
+                    resolved_value = self.resolve_value(value)
                     self.set_variable(name, resolved_value)
                 return True
                 
@@ -168,30 +173,6 @@ class SetVariableAction(BaseAction):
             self.logger.error(f"设置变量失败: {str(e)}")
             return False
 
-    def _resolve_value(self, value: Any) -> Any:
-        """解析变量值中的变量引用
-        
-        Args:
-            value: 要解析的值
-            
-        Returns:
-            解析后的值
-        """
-        # 处理字符串类型的变量引用
-        if isinstance(value, str) and "${" in value:
-            var_name = value[2:-1]  # 去掉 ${ 和 }
-            return self.get_variable(var_name)
-            
-        # 处理字典类型
-        elif isinstance(value, dict):
-            return {k: self._resolve_value(v) for k, v in value.items()}
-            
-        # 处理列表类型
-        elif isinstance(value, list):
-            return [self._resolve_value(item) for item in value]
-            
-        return value
-
 class GetVariableAction(BaseAction):
     """获取变量值"""
     
@@ -260,8 +241,63 @@ class SetTimestampAction(BaseAction):
             return False 
 
 class ExportToDBAction(BaseAction):
-    """导出数据到数据库(支持MySQL和SQLite)"""
-    
+    """导出数据到数据库(支持MySQL和SQLite)
+
+    每批数据用一次IN查询取出已有记录，在内存中对比后用executemany批量
+    插入和更新，整批在一个事务中提交。建表语句每个进程每个数据库只执行一次。
+    """
+
+    SQLITE_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS gas_stations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            station_name TEXT NOT NULL,
+            station_address TEXT NOT NULL,
+            oil_92_gun_price REAL,
+            oil_92_platform_price REAL,
+            oil_92_guns TEXT,
+            oil_95_gun_price REAL,
+            oil_95_platform_price REAL,
+            oil_95_guns TEXT,
+            skip_station BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT (LOCAL_TIMESTAMP()),
+            updated_at TIMESTAMP DEFAULT (LOCAL_TIMESTAMP()),
+            UNIQUE(station_name)
+        )
+    """
+
+    MYSQL_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS gas_stations (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            station_name VARCHAR(100) NOT NULL,
+            station_address VARCHAR(255) NOT NULL,
+            oil_92_gun_price DECIMAL(10,2),
+            oil_92_platform_price DECIMAL(10,2),
+            oil_92_guns JSON,
+            oil_95_gun_price DECIMAL(10,2),
+            oil_95_platform_price DECIMAL(10,2),
+            oil_95_guns JSON,
+            skip_station BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE KEY uk_name_address (station_name)
+        )
+    """
+
+    # 新增记录写入的字段
+    INSERT_FIELDS = (
+        "station_name", "station_address",
+        "oil_92_gun_price", "oil_92_platform_price", "oil_92_guns",
+        "oil_95_gun_price", "oil_95_platform_price", "oil_95_guns"
+    )
+    # 插入时名称已存在(其他进程刚插入)改为更新的字段，新值为NULL时保留旧值
+    CONFLICT_UPDATE_FIELDS = INSERT_FIELDS[1:]
+    # 单次IN查询的最大名称数(SQLite默认变量上限为999)
+    SELECT_CHUNK_SIZE = 500
+
+    # 已完成建表的数据库(_target_key)
+    _schema_ready = set()
+    _schema_lock = threading.Lock()
+
     def __init__(self, bot):
         super().__init__(bot)
         self.config = self._load_config()
@@ -276,77 +312,88 @@ class ExportToDBAction(BaseAction):
         with open(config_path, "r", encoding="utf-8") as f:
             return yaml.safe_load(f)
     
-    def _ensure_sqlite_db(self) -> None:
-        """确保SQLite数据库和表存在"""
-        db_path = Path(self.config["sqlite"]["database"])
-        db_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # 创建时区相关函数
-        conn.create_function('LOCAL_TIMESTAMP', 0, lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-        
-        # 创建表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS gas_stations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                station_name TEXT NOT NULL,
-                station_address TEXT NOT NULL,
-                oil_92_gun_price REAL,
-                oil_92_platform_price REAL,
-                oil_92_guns TEXT,
-                oil_95_gun_price REAL,
-                oil_95_platform_price REAL,
-                oil_95_guns TEXT,
-                skip_station BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT (LOCAL_TIMESTAMP()),
-                updated_at TIMESTAMP DEFAULT (LOCAL_TIMESTAMP()),
-                UNIQUE(station_name)
-            )
-        """)
-        
-        conn.commit()
-        conn.close()
+    def _ensure_schema(self, conn) -> None:
+        """确保表存在，每个进程每个数据库只执行一次"""
+        key = self._target_key()
+        if key in ExportToDBAction._schema_ready:
+            return
+        with ExportToDBAction._schema_lock:
+            if key in ExportToDBAction._schema_ready:
+                return
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.SQLITE_SCHEMA if self.use_local else self.MYSQL_SCHEMA)
+                conn.commit()
+            finally:
+                cursor.close()
+            ExportToDBAction._schema_ready.add(key)
     
-    def _get_connection(self):
-        """获取数据库连接"""
+    def _connection(self):
+        """从进程共享的连接池取出数据库连接(上下文管理器)"""
         if self.use_local:
-            self._ensure_sqlite_db()
-            db_path = Path(self.config["sqlite"]["database"])
-            conn = sqlite3.connect(db_path)
-            # 启用外键约束
-            conn.execute("PRAGMA foreign_keys = ON")
-            return conn
-        else:
-            return mysql.connector.connect(**self.config["mysql"])
+            return get_sqlite_pool(self.config["sqlite"]["database"], self._init_sqlite_connection).connection()
+        mysql_config = dict(self.config["mysql"])
+        pool_config = self.config.get("pool", {})
+        return get_mysql_pool(
+            mysql_config,
+            size=pool_config.get("size", 8),
+            timeout=pool_config.get("timeout", 30),
+            ping_interval=pool_config.get("ping_interval", 60)
+        ).connection()
+
+    @staticmethod
+    def _init_sqlite_connection(conn: sqlite3.Connection) -> None:
+        # 创建时区相关函数(表的默认值使用)
+        conn.create_function('LOCAL_TIMESTAMP', 0, lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
     
     def execute(self, params: Dict[str, Any]) -> bool:
-        """执行数据导出"""
+        """执行数据导出
+        
+        Args:
+            params:
+                data: 数据变量名
+                write_behind: 是否交给后台导出队列写入，默认取export.write_behind配置
+        """
         try:
             data_var = params["data"]
             raw_data = self.bot.get_variable(data_var)
             if not raw_data:
                 return True
-                
-            stations = self._transform_data(raw_data)
-            conn = self._get_connection()
             
-            try:
-                if self.use_local:
-                    self._execute_sqlite(conn, stations)
-                else:
-                    self._execute_mysql(conn, stations)
-                    
-                conn.commit()
+            if write_behind_enabled(self.bot, params):
+                # 复制一份列表，数据转换和写库都在后台线程中进行
+                get_export_queue(self.bot).submit(self._target_key(), self._write_stations, list(raw_data))
+                self.logger.info(f"已提交 {len(raw_data)} 条记录到导出队列: {self._target_key()}")
                 return True
                 
-            finally:
-                conn.close()
+            self._write_stations(raw_data)
+            return True
                 
         except Exception as e:
             self.logger.error(f"导出数据失败: {str(e)}")
             return False
+
+    def _target_key(self) -> str:
+        """导出队列中的写入目标标识"""
+        if self.use_local:
+            return f"sqlite:{self.config['sqlite']['database']}"
+        mysql_config = self.config["mysql"]
+        return f"mysql:{mysql_config.get('host')}:{mysql_config.get('port', 3306)}/{mysql_config.get('database')}"
+
+    def _write_stations(self, raw_data: List[Dict]) -> None:
+        """转换数据并在一个事务中写入数据库，失败时回滚并抛出异常"""
+        stations = self._transform_data(raw_data)
+        if not stations:
+            return
+        # 连接池在异常时回滚
+        with self._connection() as conn:
+            self._ensure_schema(conn)
+            if self.use_local:
+                self._execute_sqlite(conn, stations)
+            else:
+                self._execute_mysql(conn, stations)
+                
+            conn.commit()
     
     def _prepare_update_fields(self, station: Dict, existing: Dict) -> Tuple[List[str], Dict, bool]:
         """准备更新字段
@@ -428,164 +475,139 @@ class ExportToDBAction(BaseAction):
     def _execute_sqlite(self, conn: sqlite3.Connection, stations: List[Dict]) -> None:
         """执行SQLite数据操作"""
         cursor = conn.cursor()
-        
-        for station in stations:
-            # 验证必要字段
-            if not station.get("station_name"):
-                self.logger.warning("跳过无效数据: 缺少加油站名称")
-                continue
-            
-            # 检查是否存在该加油站
-            cursor.execute(
-                "SELECT * FROM gas_stations WHERE station_name = ?",
-                (station["station_name"],)
-            )
-            existing = cursor.fetchone()
-            
-            if existing:
-                # 转换为字典格式
-                columns = [col[0] for col in cursor.description]
-                existing = dict(zip(columns, existing))
-                
-                # 准备更新字段
-                update_fields, update_values, has_price_update = self._prepare_update_fields(station, existing)
-                
-                # 只有在有字段需要更新时才执行更新
-                if update_fields:
-                    # 转换MySQL风格的参数占位符为SQLite风格
-                    update_fields = [f.replace('%(', ':').replace(')s', '') for f in update_fields]
-                    
-                    # 只有在价格有更新时才更新时间戳
-                    if has_price_update:
-                        update_fields.append("updated_at = datetime('now', 'localtime')")
-                    
-                    update_sql = f"""
-                        UPDATE gas_stations SET
-                            {', '.join(update_fields)}
-                        WHERE id = :id
-                    """
-                    cursor.execute(update_sql, update_values)
-                    self.logger.debug(f"更新加油站数据: {station['station_name']}")
-                else:
-                    self.logger.info(f"加油站数据无变化: {station['station_name']}")
-                    
-            else:
-                # 验证新记录的必要字段
-                if not station.get("station_address"):
-                    self.logger.warning(f"跳过新增数据: 加油站 {station['station_name']} 缺少地址信息")
-                    continue
-                    
-                # 插入新记录
-                insert_sql = """
-                    INSERT INTO gas_stations (
-                        station_name, station_address,
-                        oil_92_gun_price, oil_92_platform_price, oil_92_guns,
-                        oil_95_gun_price, oil_95_platform_price, oil_95_guns,
-                        created_at, updated_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now', 'localtime'), datetime('now', 'localtime'))
-                """
-                cursor.execute(insert_sql, (
-                    station["station_name"],
-                    station["station_address"],
-                    station["oil_92_gun_price"],
-                    station["oil_92_platform_price"],
-                    station["oil_92_guns"],
-                    station["oil_95_gun_price"],
-                    station["oil_95_platform_price"],
-                    station["oil_95_guns"]
-                ))
-                self.logger.debug(f"插入新加油站: {station['station_name']}")
+        try:
+            self._upsert_stations(cursor, stations, sqlite=True)
+        finally:
+            cursor.close()
     
     def _execute_mysql(self, conn: mysql.connector.connection.MySQLConnection, stations: List[Dict]) -> None:
         """执行MySQL数据操作"""
         cursor = conn.cursor(dictionary=True)
-        
         try:
-            # 首先确保表存在
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS gas_stations (
-                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                    station_name VARCHAR(100) NOT NULL,
-                    station_address VARCHAR(255) NOT NULL,
-                    oil_92_gun_price DECIMAL(10,2),
-                    oil_92_platform_price DECIMAL(10,2),
-                    oil_92_guns JSON,
-                    oil_95_gun_price DECIMAL(10,2),
-                    oil_95_platform_price DECIMAL(10,2),
-                    oil_95_guns JSON,
-                    skip_station BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                    UNIQUE KEY uk_name_address (station_name)
-                )
-            """)
-            conn.commit()
-            
-            for station in stations:
-                # 验证必要字段
-                if not station.get("station_name"):
-                    self.logger.warning("跳过无效数据: 缺少加油站名称")
-                    continue
-                    
-                # 检查是否存在该加油站
-                cursor.execute(
-                    "SELECT * FROM gas_stations WHERE station_name = %(station_name)s",
-                    {"station_name": station["station_name"]}
-                )
-                existing = cursor.fetchone()
-                
-                if existing:
-                    # 准备更新字段
-                    update_fields, update_values, has_price_update = self._prepare_update_fields(station, existing)
-                    
-                    # 只有在有字段需要更新时才执行更新
-                    if update_fields:
-                        # 只有在价格有更新时才更新时间戳
-                        if has_price_update:
-                            update_fields.append("updated_at = CURRENT_TIMESTAMP")
-                        
-                        update_sql = f"""
-                            UPDATE gas_stations SET
-                                {', '.join(update_fields)}
-                            WHERE id = %(id)s
-                        """
-                        cursor.execute(update_sql, update_values)
-                        self.logger.info(f"更新加油站数据: {station['station_name']}")
-                    # 记录变化的字段
-                    for field, value in update_values.items():
-                        if field != 'id':
-                            old_value = existing[field] if field in existing else None
-                            self.logger.debug(f"字段 {field} 变化: {old_value} -> {value}")
-                    else:
-                        self.logger.info(f"加油站数据无变化: {station['station_name']}")
-                    
-                else:
-                    # 验证新记录的必要字段
-                    if not station.get("station_address"):
-                        self.logger.warning(f"跳过新增数据: 加油站 {station['station_name']} 缺少地址信息")
-                        continue
-                    
-                    # 插入新记录
-                    insert_sql = """
-                        INSERT INTO gas_stations (
-                            station_name, station_address,
-                            oil_92_gun_price, oil_92_platform_price, oil_92_guns,
-                            oil_95_gun_price, oil_95_platform_price, oil_95_guns
-                        ) VALUES (
-                            %(station_name)s, %(station_address)s,
-                            %(oil_92_gun_price)s, %(oil_92_platform_price)s, %(oil_92_guns)s,
-                            %(oil_95_gun_price)s, %(oil_95_platform_price)s, %(oil_95_guns)s
-                        )
-                    """
-                    cursor.execute(insert_sql, station)
-                    self.logger.info(f"插入新加油站: {station['station_name']}")
-            
-            conn.commit()
-            
+            self._upsert_stations(cursor, stations, sqlite=False)
         except Exception as e:
             self.logger.error(f"MySQL操作失败: {str(e)}")
-            conn.rollback()
             raise
+        finally:
+            cursor.close()
+
+    def _upsert_stations(self, cursor, stations: List[Dict], sqlite: bool) -> None:
+        """批量插入或更新加油站数据(不提交)"""
+        names = list(dict.fromkeys(station["station_name"] for station in stations if station.get("station_name")))
+        existing_rows = self._fetch_existing(cursor, names, sqlite)
+        inserts, updates, unchanged = self._plan_changes(stations, existing_rows)
+
+        param = (lambda field: f":{field}") if sqlite else (lambda field: f"%({field})s")
+        now = "datetime('now', 'localtime')" if sqlite else "CURRENT_TIMESTAMP"
+
+        if inserts:
+            columns = ", ".join(self.INSERT_FIELDS)
+            values = ", ".join(param(field) for field in self.INSERT_FIELDS)
+            if sqlite:
+                insert_sql = f"""
+                    INSERT INTO gas_stations ({columns}, created_at, updated_at)
+                    VALUES ({values}, {now}, {now})
+                    ON CONFLICT(station_name) DO UPDATE SET
+                        {', '.join(f"{field} = COALESCE(excluded.{field}, {field})" for field in self.CONFLICT_UPDATE_FIELDS)}
+                """
+            else:
+                insert_sql = f"""
+                    INSERT INTO gas_stations ({columns})
+                    VALUES ({values})
+                    ON DUPLICATE KEY UPDATE
+                        {', '.join(f"{field} = COALESCE(VALUES({field}), {field})" for field in self.CONFLICT_UPDATE_FIELDS)}
+                """
+            cursor.executemany(insert_sql, [
+                {field: station[field] for field in self.INSERT_FIELDS} for station in inserts
+            ])
+
+        # 更新字段相同的记录用同一条语句批量执行
+        groups: Dict[Tuple, List[Dict]] = {}
+        for row_id, (values, has_price_update) in updates.items():
+            groups.setdefault((tuple(sorted(values)), has_price_update), []).append(dict(values, id=row_id))
+        for (fields, has_price_update), rows in groups.items():
+            assignments = [f"{field} = {param(field)}" for field in fields]
+            # 只有在价格有更新时才更新时间戳
+            if has_price_update:
+                assignments.append(f"updated_at = {now}")
+            cursor.executemany(
+                f"UPDATE gas_stations SET {', '.join(assignments)} WHERE id = {param('id')}",
+                rows
+            )
+
+        self.logger.info(f"加油站数据写入完成: 新增 {len(inserts)} 条, 更新 {len(updates)} 条, 无变化 {unchanged} 条")
+
+    def _fetch_existing(self, cursor, names: List[str], sqlite: bool) -> Dict[str, Dict]:
+        """按名称批量查询已有记录
+
+        Returns:
+            Dict[str, Dict]: 加油站名称 -> 记录
+        """
+        placeholder = "?" if sqlite else "%s"
+        existing_rows = {}
+        for start in range(0, len(names), self.SELECT_CHUNK_SIZE):
+            chunk = names[start:start + self.SELECT_CHUNK_SIZE]
+            cursor.execute(
+                f"SELECT * FROM gas_stations WHERE station_name IN ({', '.join([placeholder] * len(chunk))})",
+                chunk
+            )
+            columns = [col[0] for col in cursor.description]
+            for row in cursor.fetchall():
+                if not isinstance(row, dict):
+                    row = dict(zip(columns, row))
+                existing_rows[row["station_name"]] = row
+        return existing_rows
+
+    def _plan_changes(self, stations: List[Dict], existing_rows: Dict[str, Dict]) -> Tuple[List[Dict], Dict[Any, Tuple[Dict, bool]], int]:
+        """在内存中对比新旧数据
+
+        同一批中同名加油站出现多次时按顺序合并，结果与逐条写入一致。
+
+        Returns:
+            Tuple: (待插入记录列表, {记录id: (更新值字典, 是否有价格更新)}, 无变化条数)
+        """
+        inserts: Dict[str, Dict] = {}
+        updates: Dict[Any, Tuple[Dict, bool]] = {}
+        unchanged = 0
+        for station in stations:
+            # 验证必要字段
+            name = station.get("station_name")
+            if not name:
+                self.logger.warning("跳过无效数据: 缺少加油站名称")
+                continue
+
+            if name in inserts:
+                # 本批中已新增，合并到待插入记录
+                _, update_values, _ = self._prepare_update_fields(station, dict(inserts[name], id=None))
+                update_values.pop("id")
+                inserts[name].update(update_values)
+                continue
+
+            existing = existing_rows.get(name)
+            if existing is None:
+                # 验证新记录的必要字段
+                if not station.get("station_address"):
+                    self.logger.warning(f"跳过新增数据: 加油站 {name} 缺少地址信息")
+                    continue
+                inserts[name] = dict(station)
+                self.logger.debug(f"插入新加油站: {name}")
+                continue
+
+            update_fields, update_values, has_price_update = self._prepare_update_fields(station, existing)
+            if not update_fields:
+                unchanged += 1
+                self.logger.debug(f"加油站数据无变化: {name}")
+                continue
+
+            row_id = update_values.pop("id")
+            # 记录变化的字段
+            for field, value in update_values.items():
+                self.logger.debug(f"{name} 字段 {field} 变化: {existing.get(field)} -> {value}")
+            existing.update(update_values)
+            pending_values, pending_price_update = updates.get(row_id, ({}, False))
+            pending_values.update(update_values)
+            updates[row_id] = (pending_values, pending_price_update or has_price_update)
+        return list(inserts.values()), updates, unchanged
     
     def _transform_data(self, raw_data: List[Dict]) -> List[Dict]:
         """转换数据格式以适应数据库表结构"""
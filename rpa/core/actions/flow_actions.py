@@ -1,10 +1,16 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from .base_action import BaseAction
+from ..flow_plan import Branch, Condition, compile_conditions
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
 import time
 import ast
 
 class SleepAction(BaseAction):
     """等待指定时间"""
+    waits = True
     
     def execute(self, params: Dict[str, Any]) -> bool:
         try:
@@ -16,16 +22,70 @@ class SleepAction(BaseAction):
             self.logger.error(f"等待操作失败: {str(e)}")
             return False
 
-class LoopAction(BaseAction):
+    async def execute_async(self, params: Dict[str, Any]) -> bool:
+        try:
+            seconds = float(params['seconds'])
+            await asyncio.sleep(seconds)
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"等待操作失败: {str(e)}")
+            return False
+
+# 当前执行上下文(线程或协程)中最内层循环的信号，break_loop/continue_loop只作用于该循环。
+# 并行分支在独立的线程或协程中执行，各分支内的循环互不影响
+_current_loop: ContextVar[Optional[Dict[str, bool]]] = ContextVar('current_loop', default=None)
+
+def _signal_current_loop(action: BaseAction, signal: str) -> None:
+    """给当前循环设置信号，不在循环中时忽略"""
+    signals = _current_loop.get()
+    if signals is None:
+        action.logger.warning(f"{signal}_loop不在循环中执行，已忽略")
+        return
+    signals[signal] = True
+
+class LoopSignalMixin:
+    """读取并重置break_loop/continue_loop设置的循环信号"""
+
+    @contextmanager
+    def _loop_scope(self):
+        """进入一层循环，循环内的break_loop/continue_loop只作用于这一层"""
+        token = _current_loop.set({})
+        try:
+            yield
+        finally:
+            _current_loop.reset(token)
+
+    def _consume_loop_signal(self) -> Optional[str]:
+        """返回'break'、'continue'或None，读取后重置标记"""
+        signals = _current_loop.get() or {}
+        # 检查是否需要中断循环
+        if signals.pop('break', False):
+            self.logger.info("检测到中断信号，提前结束循环")
+            return 'break'
+            
+        # 检查是否需要继续下一次循环
+        if signals.pop('continue', False):
+            self.logger.info("检测到继续信号，跳过剩余步骤")
+            return 'continue'
+        return None
+
+class LoopAction(LoopSignalMixin, BaseAction):
     """循环执行步骤"""
     
-    def execute(self, params: Dict[str, Any]) -> bool:
+    def _prepare(self, params: Dict[str, Any]) -> Tuple[int, Tuple[Condition, ...], Any]:
+        """读取循环参数并清理上一次的退出条件结果"""
         max_iterations = params.get('max_iterations', 999999)
-        break_conditions = params.get('break_conditions', [])
+        # 编译后的流程中break_conditions已是Condition，这里兼容直接传入的条件字典
+        break_conditions = compile_conditions(params.get('break_conditions', []))
         steps = params.get('steps', [])
         
         # 清理break conditions相关的step results
         self._clear_break_condition_results(break_conditions)
+        return max_iterations, break_conditions, steps
+    
+    def execute(self, params: Dict[str, Any]) -> bool:
+        max_iterations, break_conditions, steps = self._prepare(params)
         
         # 先检查一次条件,如果已经满足就直接返回
         if self._check_any_condition(break_conditions):
@@ -33,62 +93,69 @@ class LoopAction(BaseAction):
         
         # 如果条件未满足,则开始循环
         iteration = 0
-        while iteration < max_iterations:
-            iteration += 1
-            self.logger.info(f"开始第 {iteration} 次循环")
+        with self._loop_scope():
+            while iteration < max_iterations:
+                iteration += 1
+                self.logger.info(f"开始第 {iteration} 次循环")
             
-            # 执行步骤
-            for step in steps:
-                self.bot._execute_step(step)
+                # 执行步骤
+                for step in steps:
+                    self.bot._execute_step(step)
                 
-                # 检查是否需要中断循环
-                if self.bot.get_variable('_break_current_loop', False):
-                    self.bot.set_variable('_break_current_loop', False)  # 重置标记
-                    self.logger.info("检测到中断信号，提前结束循环")
-                    return True
-                    
-                # 检查是否需要继续下一次循环
-                if self.bot.get_variable('_continue_current_loop', False):
-                    self.bot.set_variable('_continue_current_loop', False)  # 重置标记
-                    self.logger.info("检测到继续信号，跳过剩余步骤")
+                    signal = self._consume_loop_signal()
+                    if signal == 'break':
+                        return True
+                    if signal == 'continue':
+                        break
+            
+                # 检查退出条件
+                if self._check_any_condition(break_conditions):
+                    self.logger.info("循环退出")
                     break
+                
+        return True
+
+    async def execute_async(self, params: Dict[str, Any]) -> bool:
+        max_iterations, break_conditions, steps = self._prepare(params)
+        
+        if self._check_any_condition(break_conditions):
+            return True
+        
+        iteration = 0
+        with self._loop_scope():
+            while iteration < max_iterations:
+                iteration += 1
+                self.logger.info(f"开始第 {iteration} 次循环")
             
-            # 检查退出条件
-            if self._check_any_condition(break_conditions):
-                self.logger.info("循环退出")
-                break
+                for step in steps:
+                    await self.bot._execute_step_async(step)
+                
+                    signal = self._consume_loop_signal()
+                    if signal == 'break':
+                        return True
+                    if signal == 'continue':
+                        break
+            
+                if self._check_any_condition(break_conditions):
+                    self.logger.info("循环退出")
+                    break
                 
         return True
         
-    def _clear_break_condition_results(self, conditions: List[Dict[str, Any]]) -> None:
+    def _clear_break_condition_results(self, conditions: Tuple[Condition, ...]) -> None:
         """清理与break conditions相关的step results"""
         for condition in conditions:
-            if condition['type'] == 'step_result':
-                step_name = condition['step']
+            if condition.kind == 'step_result':
                 # 只清理break condition中涉及的step result
                 if hasattr(self.bot, '_step_results'):
-                    self.bot._step_results.pop(step_name, None)
+                    self.bot._step_results.pop(condition.name, None)
     
-    def _check_any_condition(self, conditions: List[Dict[str, Any]]) -> bool:
+    def _check_any_condition(self, conditions: Tuple[Condition, ...]) -> bool:
         """检查是否有任一条件满足"""
         for condition in conditions:
-            if condition['type'] == 'step_result':
-                step_name = condition['step']
-                expected_value = condition['value']
-                step_result = self.bot._get_step_result(step_name)
-                
-                if step_result == expected_value:
-                    self.logger.info(f"满足退出条件: {step_name} = {expected_value}")
-                    return True
-                    
-            elif condition['type'] == 'variable':
-                var_name = condition['name']
-                expected_value = condition['value']
-                var_value = self.bot.get_variable(var_name)
-                
-                if var_value == expected_value:
-                    self.logger.info(f"满足退出条件: {var_name} = {expected_value}")
-                    return True
+            if condition.check(self.bot):
+                self.logger.info(f"满足退出条件: {condition.name} = {condition.value}")
+                return True
         
         return False
 
@@ -101,65 +168,94 @@ class BreakLoopAction(BaseAction):
         Returns:
             bool: 始终返回True以表示成功执行
         """
-        self.bot.set_variable('_break_current_loop', True)
+        _signal_current_loop(self, 'break')
         return True
 
-class ForEachAction(BaseAction):
+    async def execute_async(self, params: Optional[Dict[str, Any]] = None) -> bool:
+        # 只设置标记，不需要放到线程池
+        return self.execute(params)
+
+class ForEachAction(LoopSignalMixin, BaseAction):
     """循环遍历列表中的每个元素"""
     
+    def _resolve_items(self, list_param: Any) -> List[Any]:
+        """把list参数解析为列表"""
+        # 如果是字符串且包含变量引用，则获取变量值
+        if isinstance(list_param, str):
+            if '${' in list_param:
+                items = self.resolve_value(list_param)
+            else:
+                # 尝试解析字符串为列表
+                try:
+                    items = ast.literal_eval(list_param)
+                except:
+                    raise ValueError(f"无法解析列表字符串: {list_param}")
+        else:
+            # 检查是否可以转换为列表
+            try:
+                items = list(list_param)
+            except:
+                raise ValueError(f"参数无法转换为列表: {list_param}")
+        
+        # 确保是列表类型
+        if not isinstance(items, list):
+            raise ValueError(f"参数 {list_param} 必须是列表类型，当前类型: {type(items)}")
+        return items
+    
     def execute(self, params: Dict[str, Any]) -> bool:
         try:
             # 获取列表和变量名
-            list_param = params['list']
+            items = self._resolve_items(params['list'])
             variable_name = params['variable']
             steps = params.get('steps', [])
             
-            # 如果是字符串且包含变量引用，则获取变量值
-            if isinstance(list_param, str):
-                if list_param.startswith('${'):
-                    var_name = list_param.strip('${}')
-                    items = self.bot.get_variable(var_name)
-                else:
-                    # 尝试解析字符串为列表
-                    try:
-                        import ast
-                        items = ast.literal_eval(list_param)
-                    except:
-                        raise ValueError(f"无法解析列表字符串: {list_param}")
-            else:
-                # 检查是否可以转换为列表
-                try:
-                    items = list(list_param)
-                except:
-                    raise ValueError(f"参数无法转换为列表: {list_param}")
+            self.logger.info(f"开始遍历列表，共 {len(items)} 项")
             
-            # 确保是列表类型
-            if not isinstance(items, list):
-                raise ValueError(f"参数 {list_param} 必须是列表类型，当前类型: {type(items)}")
+            # 遍历列表
+            with self._loop_scope():
+                for index, item in enumerate(items, 1):
+                    # 设置当前项的变量
+                    self.bot.set_variable(variable_name, item)
+                    self.logger.info(f"处理第 {index}/{len(items)} 项: {item}")
+                
+                    # 执行步骤
+                    for step in steps:
+                        self.bot._execute_step(step)
+                    
+                        signal = self._consume_loop_signal()
+                        if signal == 'break':
+                            return True
+                        if signal == 'continue':
+                            break
+            
+            self.logger.info("列表遍历完成")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"ForEach循环执行失败: {str(e)}")
+            return False
+
+    async def execute_async(self, params: Dict[str, Any]) -> bool:
+        try:
+            items = self._resolve_items(params['list'])
+            variable_name = params['variable']
+            steps = params.get('steps', [])
             
             self.logger.info(f"开始遍历列表，共 {len(items)} 项")
             
-            # 遍历列表
-            for index, item in enumerate(items, 1):
-                # 设置当前项的变量
-                self.bot.set_variable(variable_name, item)
-                self.logger.info(f"处理第 {index}/{len(items)} 项: {item}")
+            with self._loop_scope():
+                for index, item in enumerate(items, 1):
+                    self.bot.set_variable(variable_name, item)
+                    self.logger.info(f"处理第 {index}/{len(items)} 项: {item}")
                 
-                # 执行步骤
-                for step in steps:
-                    self.bot._execute_step(step)
+                    for step in steps:
+                        await self.bot._execute_step_async(step)
                     
-                    # 检查是否需要中断循环
-                    if self.bot.get_variable('_break_current_loop', False):
-                        self.bot.set_variable('_break_current_loop', False)  # 重置标记
-                        self.logger.info("检测到中断信号，提前结束循环")
-                        return True
-                        
-                    # 检查是否需要继续下一次循环
-                    if self.bot.get_variable('_continue_current_loop', False):
-                        self.bot.set_variable('_continue_current_loop', False)  # 重置标记
-                        self.logger.info("检测到继续信号，跳过剩余步骤")
-                        break
+                        signal = self._consume_loop_signal()
+                        if signal == 'break':
+                            return True
+                        if signal == 'continue':
+                            break
             
             self.logger.info("列表遍历完成")
             return True
@@ -179,9 +275,7 @@ class CheckNoRepeatedValueAction(BaseAction):
             save_to = params.get('save_to')  # 保存结果的变量名
             
             # 解析value中的变量引用
-            if isinstance(value, str) and "${" in value:
-                var_name = value[2:-1]  # 去掉 ${ 和 }
-                value = self.bot.get_variable(var_name)
+            value = self.resolve_value(value)
             
             # 获取列表数据
             items = self.bot.get_variable(list_param)
@@ -222,5 +316,133 @@ class ContinueLoopAction(BaseAction):
         Returns:
             bool: 始终返回True以表示成功执行
         """
-        self.bot.set_variable('_continue_current_loop', True)
-        return True
\ No newline at end of file
+        _signal_current_loop(self, 'continue')
+        return True
+
+    async def execute_async(self, params: Optional[Dict[str, Any]] = None) -> bool:
+        # 只设置标记，不需要放到线程池
+        return self.execute(params)
+
+class ParallelAction(BaseAction):
+    """并行执行多个分支
+
+    各分支在同一个机器人上并发执行，分支内的步骤仍按顺序执行。
+    join决定何时继续执行parallel之后的步骤:
+    - all: 等待所有分支完成，任一分支失败则步骤失败(默认)
+    - any: 任一分支成功完成即继续，其余分支在后台继续执行(失败只记录日志)
+    - detach: 不等待，分支在后台执行，失败时流程失败
+    后台分支在流程结束前统一等待。
+    """
+    JOIN_MODES = ('all', 'any', 'detach')
+
+    def _prepare(self, params: Dict[str, Any]) -> Tuple[Tuple[Branch, ...], str, Optional[float]]:
+        """读取分支、join方式和超时"""
+        # 编译后的流程中branches已是Branch，这里兼容直接传入的分支定义
+        branches = self.bot.compiler.compile_branches(params.get('branches', []))
+        join = params.get('join', 'all')
+        timeout = params.get('timeout')
+        if join not in self.JOIN_MODES:
+            raise ValueError(f"不支持的join方式: {join}")
+        if not branches:
+            raise ValueError("parallel至少需要一个分支")
+        self.logger.info(f"并行执行 {len(branches)} 个分支 (join: {join})")
+        return branches, join, timeout
+
+    def _run_branch(self, branch: Branch) -> bool:
+        self.logger.info(f"开始分支: {branch.name}")
+        for step in branch.steps:
+            self.bot._execute_step(step)
+        self.logger.info(f"分支完成: {branch.name}")
+        return True
+
+    async def _run_branch_async(self, branch: Branch) -> bool:
+        # 协程复制了创建时的上下文，清除外层循环，分支内的循环信号只在分支内生效
+        _current_loop.set(None)
+        self.logger.info(f"开始分支: {branch.name}")
+        for step in branch.steps:
+            await self.bot._execute_step_async(step)
+        self.logger.info(f"分支完成: {branch.name}")
+        return True
+
+    def execute(self, params: Dict[str, Any]) -> bool:
+        branches, join, timeout = self._prepare(params)
+
+        # 每个分支一个线程，分支内嵌套parallel时不会因线程池占满而互相等待
+        executor = ThreadPoolExecutor(max_workers=len(branches), thread_name_prefix='rpa-branch')
+        futures = {executor.submit(self._run_branch, branch): branch for branch in branches}
+        executor.shutdown(wait=False)
+
+        if join == 'detach':
+            self.bot._add_background_branches(futures)
+            return True
+
+        if join == 'all':
+            done, pending = wait(futures, timeout=timeout)
+            return self._join_all(futures, done, pending, timeout)
+
+        # join: any
+        pending = set(futures)
+        succeeded = False
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while pending and not succeeded:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            succeeded = any(future.exception() is None for future in done)
+        return self._join_any(futures, pending, succeeded, timeout)
+
+    async def execute_async(self, params: Dict[str, Any]) -> bool:
+        branches, join, timeout = self._prepare(params)
+
+        tasks = {asyncio.ensure_future(self._run_branch_async(branch)): branch for branch in branches}
+
+        if join == 'detach':
+            self.bot._add_background_branches(tasks)
+            return True
+
+        if join == 'all':
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            return self._join_all(tasks, done, pending, timeout)
+
+        # join: any
+        pending = set(tasks)
+        succeeded = False
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while pending and not succeeded:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            succeeded = any(task.exception() is None for task in done)
+        return self._join_any(tasks, pending, succeeded, timeout)
+
+    def _join_all(self, futures: Dict[Any, Branch], done: set, pending: set, timeout: Optional[float]) -> bool:
+        """join: all的结果处理，超时或任一分支失败时抛出异常"""
+        if pending:
+            # 超时的分支无法中止，转为后台分支，流程结束前等待
+            self.bot._add_background_branches({future: futures[future] for future in pending})
+            names = ', '.join(futures[future].name for future in futures if future in pending)
+            raise TimeoutError(f"等待并行分支超时({timeout}秒): {names}")
+        failures = [
+            f"{branch.name}: {future.exception()}"
+            for future, branch in futures.items()
+            if future.exception() is not None
+        ]
+        if failures:
+            raise RuntimeError(f"并行分支执行失败: {'; '.join(failures)}")
+        return True
+
+    def _join_any(self, futures: Dict[Any, Branch], pending: set, succeeded: bool,
+                  timeout: Optional[float]) -> bool:
+        """join: any的结果处理，未完成的分支转入后台，没有分支成功时抛出异常"""
+        if pending:
+            # 已有分支成功时，其余分支的失败不影响流程
+            self.bot._add_background_branches({future: futures[future] for future in pending},
+                                              required=not succeeded)
+        if succeeded:
+            return True
+        if pending:
+            raise TimeoutError(f"等待并行分支超时({timeout}秒)")
+        failures = [f"{branch.name}: {future.exception()}" for future, branch in futures.items()]
+        raise RuntimeError(f"并行分支全部失败: {'; '.join(failures)}")
@@ -1,8 +1,8 @@
 from typing import Dict, List, Optional, Union, Any
 from .base_action import BaseAction
+from ...utils.ui_tree import UITree, parse_bounds
 import time
 import re
-import xml.etree.ElementTree as ET
 import os
 from datetime import datetime
 
@@ -17,6 +17,7 @@ class GetNodeDescendantsContentAction(BaseAction):
                 bounds: 目标区域范围 [left, top, right, bottom]
                 content_desc_pattern: 内容匹配模式(正则表达式)
                 save_to: 保存结果的变量名
+                refresh: 是否忽略UI快照重新获取层级，默认False
         """
         try:
             bounds = params.get("bounds")
@@ -26,7 +27,7 @@ class GetNodeDescendantsContentAction(BaseAction):
             pattern = params.get("content_desc_pattern")
             
             # 获取区域内的所有节点内容
-            results = self._collect_nodes_in_bounds(bounds, pattern)
+            results = self._collect_nodes_in_bounds(bounds, pattern, params.get("refresh", False))
             
             # 保存结果
             if "save_to" in params:
@@ -39,51 +40,18 @@ class GetNodeDescendantsContentAction(BaseAction):
             self.logger.error(f"获取节点内容失败: {str(e)}")
             return []
 
-    def _check_node_in_bounds(self, node_bounds: Dict, target_bounds: List[int]) -> bool:
-        """检查节点是否在指定区域内"""
-        try:
-            return (node_bounds.get('left', 0) >= target_bounds[0] and
-                    node_bounds.get('top', 0) >= target_bounds[1] and 
-                    node_bounds.get('right', 0) <= target_bounds[2] and
-                    node_bounds.get('bottom', 0) <= target_bounds[3])
-        except:
-            return False
-
-    def _collect_nodes_in_bounds(self, bounds: List[int], pattern: Optional[str] = None) -> List[str]:
+    def _collect_nodes_in_bounds(self, bounds: List[int], pattern: Optional[str] = None,
+                                 refresh: bool = False) -> List[str]:
         """收集指定区域内符合条件的节点内容"""
         # 用字典按drawing_order分组存储节点内容
         order_groups = {}
         
         try:
-            # 获取所有节点
-            nodes = self.ui_animator.xpath('//*//*[@content-desc]').all()
-            
-            # 遍历所有节点
-            for node in nodes:
-                attrs = node.attrib
-                
-                # 解析bounds
-                bounds_str = attrs.get('bounds', '')
-                if not bounds_str:
-                    continue
-                    
-                try:
-                    bounds_parts = bounds_str.strip('[]').split('][')
-                    x1, y1 = map(int, bounds_parts[0].split(','))
-                    x2, y2 = map(int, bounds_parts[1].split(','))
-                    node_bounds = {
-                        'left': x1,
-                        'top': y1,
-                        'right': x2,
-                        'bottom': y2
-                    }
-                except:
-                    continue
+            # 通过空间索引获取区域内的节点
+            tree = self.ui_snapshot.get_tree(refresh=refresh)
+            for index in tree.nodes_in_region(bounds):
+                attrs = tree.node(index).attrib
                 
-                # 检查bounds
-                if not self._check_node_in_bounds(node_bounds, bounds):
-                    continue
-                    
                 # 获取content-desc
                 content = attrs.get('content-desc', '')
                 if not content:
@@ -112,6 +80,7 @@ class GetNodeDescendantsContentAction(BaseAction):
 
 class WaitAndClickNodeAction(BaseAction):
     """等待并点击指定节点"""
+    invalidates_ui = True
     
     def execute(self, params: Dict) -> bool:
         """
@@ -129,9 +98,10 @@ class WaitAndClickNodeAction(BaseAction):
                     - "exact": 精确匹配
                     - "contains": 包含匹配
                 timeout (int): 超时时间(秒)
-                interval (float): 检查间隔(秒)
+                interval (float): 最大检查间隔(秒)，从短间隔开始退避，界面变化时提前检查
                 bounds (List[int], optional): 优先区域范围 [left, top, right, bottom]
                 save_to (str): 可选,保存执行结果到变量
+                refresh (bool): 第一次查找是否忽略UI快照，默认False(之后的重试总是重新获取)
         """
         locate_by = params.get("locate_by", "text")
         text = params.get("text", "")
@@ -140,11 +110,10 @@ class WaitAndClickNodeAction(BaseAction):
         interval = params.get("interval", 0.5)
         bounds = params.get("bounds")
         save_to = params.get("save_to")
+        refresh = params.get("refresh", False)
         
         # 解析text中的变量引用
-        if isinstance(text, str) and "${" in text:
-            var_name = text[2:-1]  # 去掉 ${ 和 }
-            text = self.get_variable(var_name)
+        text = self.resolve_value(text)
             
         # 检查text是否为None或空
         if not text:
@@ -153,114 +122,100 @@ class WaitAndClickNodeAction(BaseAction):
                 self.set_variable(save_to, False)
             return False
             
-        end_time = time.time() + timeout
+        attempts = 0
         
-        while time.time() < end_time:
+        def find_and_click() -> bool:
+            nonlocal attempts
             try:
-                # 构建选择器
-                selector = self._build_selector(locate_by, text, match_type)
-                
-                # 检查元素是否存在
-                if selector.exists:
-                    # 获取元素信息
-                    element_info = selector.info
-                    if not element_info or 'bounds' not in element_info:
-                        self.logger.warning("无法获取元素bounds信息")
-                        time.sleep(interval)
-                        continue
-                        
-                    element_bounds = element_info['bounds']
-                    
-                    # 如果指定了bounds，检查元素是否在bounds内
-                    if bounds:
-                        if not self._check_node_in_bounds(element_bounds, bounds):
-                            # 如果不在指定区域内，尝试查找下一个匹配元素
-                            xml_content = self.ui_animator.dump_hierarchy()
-                            root = ET.fromstring(xml_content)
-                            
-                            # 根据定位方式构建xpath
-                            if locate_by == "text":
-                                xpath = f".//*[@text='{text}']" if match_type == "exact" else f".//*[contains(@text,'{text}')]"
-                            elif locate_by == "description":
-                                xpath = f".//*[@content-desc='{text}']" if match_type == "exact" else f".//*[contains(@content-desc,'{text}')]"
-                            else:
-                                raise ValueError(f"不支持的定位方式: {locate_by}")
-                            
-                            # 查找所有匹配的元素
-                            matching_elements = root.findall(xpath)
-                            
-                            # 遍历找到第一个在bounds内的元素
-                            for element in matching_elements:
-                                bounds_str = element.get('bounds', '')
-                                if not bounds_str:
-                                    continue
-                                    
-                                try:
-                                    bounds_parts = bounds_str.strip('[]').split('][')
-                                    x1, y1 = map(int, bounds_parts[0].split(','))
-                                    x2, y2 = map(int, bounds_parts[1].split(','))
-                                    node_bounds = {
-                                        'left': x1,
-                                        'top': y1,
-                                        'right': x2,
-                                        'bottom': y2
-                                    }
-                                    
-                                    if self._check_node_in_bounds(node_bounds, bounds):
-                                        element_bounds = node_bounds
-                                        break
-                                except:
-                                    continue
-                            else:
-                                # 没找到在bounds内的元素，继续等待
-                                time.sleep(interval)
-                                continue
-                    
-                    # 计算点击坐标
-                    center_x = (element_bounds['left'] + element_bounds['right']) // 2
-                    center_y = (element_bounds['top'] + element_bounds['bottom']) // 2
-                    
-                    self.ui_animator.click(center_x, center_y)
-                    if save_to:
-                        self.set_variable(save_to, True)
-                    return True
-                    
+                # 第一次可以复用UI快照，重试时界面可能已变化，需要重新获取
+                tree = self.ui_snapshot.get_tree(refresh=refresh or attempts > 0)
+                attempts += 1
+                return self._click_first_match(tree, locate_by, text, match_type, bounds)
             except Exception as e:
                 self.logger.warning(f"点击元素时出错: {str(e)}")
-                
-            time.sleep(interval)
+                return False
+        
+        if self._wait_until(find_and_click, timeout, interval):
+            if save_to:
+                self.set_variable(save_to, True)
+            return True
 
         self.logger.error(f"未能在 {timeout} 秒内找到并点击符合条件的元素: {text}")
         if save_to:
             self.set_variable(save_to, False)
         return False
 
-    def _check_node_in_bounds(self, node_bounds: Dict, target_bounds: List[int]) -> bool:
-        """检查节点是否在指定区域内"""
-        try:
-            return (node_bounds['left'] >= target_bounds[0] and
-                    node_bounds['top'] >= target_bounds[1] and 
-                    node_bounds['right'] <= target_bounds[2] and
-                    node_bounds['bottom'] <= target_bounds[3])
-        except:
+    async def execute_async(self, params: Dict) -> bool:
+        """异步版本：dump和点击在线程池中执行，重试间隔不占用线程，参数同execute"""
+        locate_by = params.get("locate_by", "text")
+        text = self.resolve_value(params.get("text", ""))
+        match_type = params.get("match_type", "exact")
+        timeout = params.get("timeout", 10)
+        interval = params.get("interval", 0.5)
+        bounds = params.get("bounds")
+        save_to = params.get("save_to")
+        refresh = params.get("refresh", False)
+        
+        if not text:
+            self.logger.error("text参数不能为空")
+            if save_to:
+                self.set_variable(save_to, False)
+            return False
+            
+        attempts = 0
+        
+        async def find_and_click() -> bool:
+            nonlocal attempts
+            try:
+                tree = await self._run_in_executor(self.ui_snapshot.get_tree, refresh=refresh or attempts > 0)
+                attempts += 1
+                return await self._run_in_executor(self._click_first_match, tree, locate_by, text, match_type, bounds)
+            except Exception as e:
+                self.logger.warning(f"点击元素时出错: {str(e)}")
+                return False
+        
+        if await self._wait_until_async(find_and_click, timeout, interval):
+            if save_to:
+                self.set_variable(save_to, True)
+            return True
+
+        self.logger.error(f"未能在 {timeout} 秒内找到并点击符合条件的元素: {text}")
+        if save_to:
+            self.set_variable(save_to, False)
+        return False
+
+    def _click_first_match(self, tree: UITree, locate_by: str, text: str,
+                           match_type: str, bounds: Optional[List[int]] = None) -> bool:
+        """点击第一个匹配元素的中心，没有匹配元素时返回False"""
+        # 查找第一个匹配的元素(指定了bounds时必须在区域内)
+        element_bounds = self._find_element_bounds(tree, locate_by, text, match_type, bounds)
+        if not element_bounds:
             return False
+        # 计算点击坐标
+        center_x = (element_bounds['left'] + element_bounds['right']) // 2
+        center_y = (element_bounds['top'] + element_bounds['bottom']) // 2
+        
+        self.ui_animator.click(center_x, center_y)
+        return True
 
-    def _build_selector(self, locate_by: str, text: str, match_type: str) -> object:
-        """构建元素选择器"""
+    def _find_element_bounds(self, tree: UITree, locate_by: str, text: str,
+                             match_type: str, bounds: Optional[List[int]] = None) -> Optional[Dict]:
+        """查找第一个匹配元素的bounds"""
+        contains = match_type != "exact"
         if locate_by == "text":
-            if match_type == "exact":
-                return self.ui_animator(text=text)
-            else:
-                return self.ui_animator(textContains=text)
-                
+            indices = tree.find_by_text(text, contains=contains)
         elif locate_by == "description":
-            if match_type == "exact":
-                return self.ui_animator(description=text)
-            else:
-                return self.ui_animator(descriptionContains=text)
-            
+            indices = tree.find_by_desc(text, contains=contains)
         else:
             raise ValueError(f"不支持的定位方式: {locate_by}")
+            
+        if bounds:
+            indices = tree.filter_in_region(indices, bounds)
+        for index in indices:
+            element_bounds = tree.bounds_of(index)
+            if element_bounds:
+                return element_bounds
+        return None
 
 class GetNodeByPathAction(BaseAction):
     """通过路径获取节点值"""
@@ -284,9 +239,8 @@ class GetNodeByPathAction(BaseAction):
             pattern = params.get("pattern")  # 可选的匹配模式
             result_pattern = params.get("result_pattern")  # 新增: 结果提取模式
             
-            # 获取当前UI树
-            xml_content = self.ui_animator.dump_hierarchy()
-            root = ET.fromstring(xml_content)
+            # 从UI快照获取当前UI树
+            root = self.ui_snapshot.get_root(refresh=params.get("refresh", False))
             
             # 首先找到package对应的根节点
             package_nodes = root.findall(f".//*[@package='{package}']")
@@ -390,7 +344,7 @@ class GetNodeByPathAction(BaseAction):
                     dump_file = os.path.join(dumps_dir, f"hierarchy_dump_{save_to}_{timestamp}.xml")
                     
                     with open(dump_file, "w", encoding="utf-8") as f:
-                        f.write(xml_content)
+                        f.write(self.ui_snapshot.get_xml())
                         
                     self.logger.info(f"UI层级结构已保存到: {dump_file}")
                 except Exception as dump_err:
@@ -409,28 +363,21 @@ class GetListItemBoundsAction(BaseAction):
         save_to = params['save_to']
         
         try:
-            # 获取当前UI树
-            xml_content = self.ui_animator.dump_hierarchy()
-            root = ET.fromstring(xml_content)
-            
-            # 找到列表容器节点
-            list_nodes = root.findall(f".//*[@resource-id='{list_id}']")
+            # 从UI快照获取当前UI树，按resource-id索引找到列表容器节点
+            tree = self.ui_snapshot.get_tree(refresh=params.get('refresh', False))
+            list_nodes = tree.find_by_resource_id(list_id)
             if not list_nodes:
                 self.logger.error(f"未找到列表节点: {list_id}")
                 return False
             
-            list_node = list_nodes[0]
+            list_node = tree.node(list_nodes[0])
             
             # 获取直接子节点
             bounds_list = []
             for child in list_node:
-                bounds = child.get('bounds')
+                bounds = parse_bounds(child.get('bounds', ''))
                 if bounds:
-                    # 解析bounds字符串 "[x1,y1][x2,y2]"
-                    bounds_parts = bounds.strip('[]').split('][')
-                    x1, y1 = map(int, bounds_parts[0].split(','))
-                    x2, y2 = map(int, bounds_parts[1].split(','))
-                    bounds_list.append([x1, y1, x2, y2])
+                    bounds_list.append(list(bounds))
             
             # 保存结果
             self.bot.set_variable(save_to, bounds_list)
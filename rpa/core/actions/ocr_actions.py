@@ -1,5 +1,6 @@
 from typing import Dict, Any, List, Optional
 from .base_action import BaseAction
+from lib.text_matcher import MultiPatternMatcher
 import subprocess
 import time
 
@@ -20,16 +21,13 @@ class OCRBaseAction(BaseAction):
         """
         try:
             box = result['box']
-            scale = self.bot.screenshot_helper.get_scale_factor()
 
-            # 计算中心点坐标
-            center_x = int((box[0][0] + box[2][0]) / (2 * scale))
-            center_y = int((box[0][1] + box[2][1]) / (2 * scale))
-
-            # 添加区域偏移
-            if screenshot_region:
-                center_x += screenshot_region[0]
-                center_y += screenshot_region[1]
+            # 计算中心点坐标并映射回屏幕坐标(含区域偏移)
+            center_x, center_y = self.bot.screenshot_helper.to_screen_coordinates(
+                (box[0][0] + box[2][0]) / 2,
+                (box[0][1] + box[2][1]) / 2,
+                screenshot_region
+            )
 
             # 添加点击偏移
             if click_offset:
@@ -38,6 +36,7 @@ class OCRBaseAction(BaseAction):
 
             # 使用UIAnimator2执行点击
             self.ui_animator.click(center_x, center_y)
+            self._mark_ui_changed()
 
             self.logger.debug(f"点击OCR结果: {result}")
             self.logger.info(f"点击坐标: ({center_x}, {center_y})")
@@ -48,7 +47,11 @@ class OCRBaseAction(BaseAction):
             return False
 
 class WaitAndClickOCRTextAction(OCRBaseAction):
-    """等待并点击指定文本"""
+    """等待并点击指定文本
+
+    check_interval为最大轮询间隔，实际按等待引擎从短间隔开始退避，画面变化时提前检查
+    """
+    invalidates_ui = True
 
     def execute(self, params: Dict[str, Any]) -> bool:
         text = params.get('text')
@@ -59,33 +62,67 @@ class WaitAndClickOCRTextAction(OCRBaseAction):
         textContains = params.get('textContains')
         textMatches = params.get('textMatches')
 
+        def find_and_click() -> bool:
+            screenshot = self.bot.screenshot_helper.capture_frame(
+                region=screenshot_region,
+                filename_prefix="wait_click_text"
+            )
+
+            results = self.bot.ocr_helper.find(
+                screenshot,
+                text=text,
+                textContains=textContains,
+                textMatches=textMatches
+            )
+
+            if results:
+                self.logger.info(f"找到目标文本: text: {text} , textContains: {textContains} , textMatches: {textMatches} , {results}, screenshot_region: {screenshot_region}, click_offset: {click_offset}")
+                return self._click_ocr_result(results[0], screenshot_region, click_offset)
+            return False
+
         try:
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                screenshot = self.bot.screenshot_helper.take_screenshot(
-                    save_path="temp",
-                    filename_prefix="wait_click_text",
-                    region=screenshot_region
-                )
+            if self._wait_until(find_and_click, timeout, check_interval):
+                return True
 
-                # results = self.bot.ocr_helper.extract_text(
-                #    screenshot,
-                #    keywords=[text]
-                # )
+            self.logger.warning(f"等待超时: {text}")
+            return False
 
-                results = self.bot.ocr_helper.find(
-                    screenshot,
-                    text=text,
-                    textContains=textContains,
-                    textMatches=textMatches
-                )
+        except Exception as e:
+            self.logger.error(f"等待点击文本失败: {str(e)}")
+            return False
 
-                if results:
-                    self.logger.info(f"找到目标文本: text: {text} , textContains: {textContains} , textMatches: {textMatches} , {results}, screenshot_region: {screenshot_region}, click_offset: {click_offset}")
-                    if self._click_ocr_result(results[0], screenshot_region, click_offset):
-                        return True
+    async def execute_async(self, params: Dict[str, Any]) -> bool:
+        """异步版本：截图和点击在线程池中执行，OCR直接等待识别服务，间隔等待不占用线程"""
+        text = params.get('text')
+        timeout = params.get('timeout', 30)
+        check_interval = params.get('check_interval', 2)
+        screenshot_region = params.get('screenshot_region')
+        click_offset = params.get('click_offset')
+        textContains = params.get('textContains')
+        textMatches = params.get('textMatches')
 
-                time.sleep(check_interval)
+        async def find_and_click() -> bool:
+            screenshot = await self._run_in_executor(
+                self.bot.screenshot_helper.capture_frame,
+                region=screenshot_region,
+                filename_prefix="wait_click_text"
+            )
+
+            results = await self.bot.ocr_helper.find_async(
+                screenshot,
+                text=text,
+                textContains=textContains,
+                textMatches=textMatches
+            )
+
+            if results:
+                self.logger.info(f"找到目标文本: text: {text} , textContains: {textContains} , textMatches: {textMatches} , {results}, screenshot_region: {screenshot_region}, click_offset: {click_offset}")
+                return await self._run_in_executor(self._click_ocr_result, results[0], screenshot_region, click_offset)
+            return False
+
+        try:
+            if await self._wait_until_async(find_and_click, timeout, check_interval):
+                return True
 
             self.logger.warning(f"等待超时: {text}")
             return False
@@ -96,6 +133,7 @@ class WaitAndClickOCRTextAction(OCRBaseAction):
 
 class HandlePopupsUntilTargetAction(OCRBaseAction):
     """处理弹窗直到目标出现"""
+    invalidates_ui = True
 
     def execute(self, params: Dict[str, Any]) -> bool:
         timeout = params.get('timeout', 60)
@@ -104,31 +142,35 @@ class HandlePopupsUntilTargetAction(OCRBaseAction):
         screenshot_region = params.get('screenshot_region')
         popups = params.get('popups', [])
 
+        # 所有弹窗模式和目标文本只构建一次自动机，每帧一次扫描完成匹配
+        matcher = MultiPatternMatcher(
+            [pattern for popup in popups for pattern in popup['patterns']] + [target_text]
+        )
+
         try:
             start_time = time.time()
             while time.time() - start_time < timeout:
-                screenshot = self.bot.screenshot_helper.take_screenshot(
-                    save_path="temp",
-                    filename_prefix="handle_popups",
-                    region=screenshot_region
+                screenshot = self.bot.screenshot_helper.capture_frame(
+                    region=screenshot_region,
+                    filename_prefix="handle_popups"
                 )
 
+                # 每帧只做一次OCR
+                results = self.bot.ocr_helper.extract_text(screenshot)
+
+                # 模式 -> 包含该模式的识别结果(保持识别顺序)
+                pattern_hits = {}
+                for result in results:
+                    for pattern in matcher.search(result['text']):
+                        pattern_hits.setdefault(pattern, []).append(result)
+
                 for popup in popups:
                     patterns = popup['patterns']
                     action = popup.get('action', 'click_first')
 
-                    results = self.bot.ocr_helper.extract_text(screenshot)
-
-                    # 使用包含匹配检查所有 patterns 是否存在
-                    pattern_matches = {}
-                    for pattern in patterns:
-                        matched = [r for r in results if pattern in r['text']]
-                        if matched:
-                            pattern_matches[pattern] = matched
-
                     # 只有当所有 pattern 都匹配时才处理弹窗
-                    if len(pattern_matches) == len(patterns):
-                        self.logger.info(f"检测到弹窗: {popup['name']}")
+                    if all(pattern in pattern_hits for pattern in patterns):
+                        self.logger.info(f"检测到弹窗: {popup.get('name')}")
 
                         if action == 'click_first':
                             # 对于 click_first，使用精确匹配来查找第一个 pattern
@@ -142,12 +184,7 @@ class HandlePopupsUntilTargetAction(OCRBaseAction):
                                 if self._click_region(click_region):
                                     break
 
-                target_results = self.bot.ocr_helper.extract_text(
-                    screenshot,
-                    keywords=[target_text]
-                )
-
-                if target_results:
+                if target_text in pattern_hits:
                     self.logger.info(f"检测到目标文本: {target_text}")
                     return True
 
@@ -162,6 +199,7 @@ class HandlePopupsUntilTargetAction(OCRBaseAction):
 
 class GetTextFromRegionAction(BaseAction):
     """获取文本内容"""
+    waits = True
 
     def _get_selector_map(self):
         """获取匹配方式映射"""
@@ -268,53 +306,46 @@ class VerifyTextInRegionAction(BaseAction):
 
         try:
             # 处理region参数
-            if isinstance(region, str) and region.startswith('${') and region.endswith('}'):
-                var_name = region.strip('${}')
-                region = self.bot.get_variable(var_name)
+            if isinstance(region, str) and '${' in region:
+                var_ref = region
+                region = self.resolve_value(region)
                 if region is None:
-                    self.logger.error(f"变量 {var_name} 未找到")
+                    self.logger.error(f"变量 {var_ref} 未找到")
                     if save_to:
                         self.bot.set_variable(save_to, False)
                     return False
 
-            # 定义匹配方式映射
-            selector_map = {
-                'text': (f'new UiSelector().text("{expected_text}")', "text"),
-                'text_contains': (f'new UiSelector().textContains("{expected_text}")', "textContains"),
-                'description': (f'new UiSelector().description("{expected_text}")', "description"),
-                'description_contains': (f'new UiSelector().descriptionContains("{expected_text}")', "descriptionContains")
-            }
-
-            if match_type not in selector_map:
+            # 在UI快照的索引中查找匹配的节点
+            tree = self.ui_snapshot.get_tree(refresh=params.get('refresh', False))
+            if match_type == 'text':
+                indices = tree.find_by_text(expected_text)
+            elif match_type == 'text_contains':
+                indices = tree.find_by_text(expected_text, contains=True)
+            elif match_type == 'description':
+                indices = tree.find_by_desc(expected_text)
+            elif match_type == 'description_contains':
+                indices = tree.find_by_desc(expected_text, contains=True)
+            else:
                 raise ValueError(f"不支持的匹配方式: {match_type}")
 
-            selector_str, selector_type = selector_map[match_type]
-
             if region:
                 # 确保region是列表或元组且包含4个值
                 if not isinstance(region, (list, tuple)) or len(region) != 4:
                     raise ValueError("region参数必须是包含4个值的列表或元组: [x1, y1, x2, y2]")
 
-                x1, y1, x2, y2 = map(int, region)
+                matching = tree.filter_in_region(indices, region)
+                if matching:
+                    bounds = tree.bounds_of(matching[0])
+                    self.logger.info(f"在指定区域内找到文本: {expected_text} (bounds: {bounds})")
 
-                # 获取所有匹配的元素
-                matching_elements = self.ui_animator.xpath(f'//*[@{selector_type}="{expected_text}"]').all()
-
-                for element in matching_elements:
-                    bounds = element.info['bounds']
-                    if (bounds['left'] >= x1 and bounds['top'] >= y1 and
-                        bounds['right'] <= x2 and bounds['bottom'] <= y2):
-                        self.logger.info(f"在指定区域内找到文本: {expected_text} (bounds: {bounds})")
-
-                        if save_to:
-                            self.bot.set_variable(save_to, True)
-                        return True
+                    if save_to:
+                        self.bot.set_variable(save_to, True)
+                    return True
 
                 self.logger.info(f"在指定区域内未找到文本: {expected_text}")
             else:
                 # 不限制区域的查找
-                matching_elements = self.ui_animator.xpath(f'//*[@{selector_type}="{expected_text}"]').all()
-                if matching_elements:
+                if indices:
                     self.logger.info(f"找到文本: {expected_text}")
 
                     if save_to:
@@ -336,21 +367,17 @@ class VerifyTextInRegionAction(BaseAction):
 
 class WaitForInputReadyAction(BaseAction):
     """等待输入框准备就绪"""
+    waits = True
 
     def execute(self, params: Dict[str, Any]) -> bool:
         timeout = params.get('timeout', 5)
         check_interval = params.get('check_interval', 0.5)
 
         try:
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                # 使用UIAutomator2检查当前焦点是否在输入框
-                focused = self.ui_animator(focused=True)
-                if focused.exists:
-                    self.logger.info("输框已激活")
-                    return True
-
-                time.sleep(check_interval)
+            # 使用UIAutomator2检查当前焦点是否在输入框
+            if self._wait_until(lambda: self.ui_animator(focused=True).exists, timeout, check_interval):
+                self.logger.info("输框已激活")
+                return True
 
             self.logger.warning("等待输入框激活超时")
             # 如果UIAutomator2检测失败，尝试使用adb命令
@@ -375,16 +402,17 @@ class WaitForInputReadyAction(BaseAction):
 
 class InputTextAction(BaseAction):
     """输入文本"""
+    invalidates_ui = True
 
     def execute(self, params: Dict[str, Any]) -> bool:
         try:
             # 获取要输入的文本并解析变量
             text = params['text']
             if isinstance(text, str) and "${" in text:
-                var_name = text.replace("${", "").replace("}", "")
-                text = self.bot.get_variable(var_name)
+                var_ref = text
+                text = self.resolve_value(text)
                 if text is None:
-                    self.logger.error(f"变量 {var_name} 未找到")
+                    self.logger.error(f"变量 {var_ref} 未找到")
                     return False
 
             if not isinstance(text, str):
@@ -411,6 +439,7 @@ class InputTextAction(BaseAction):
 
 class WaitForKeyElementAction(BaseAction):
     """等待关键元素出现并获取其位置信息"""
+    waits = True
 
     def execute(self, params: Dict[str, Any]) -> bool:
         text_pattern = params['text_pattern']  # 文本模式
@@ -431,17 +460,16 @@ class WaitForKeyElementAction(BaseAction):
                 'description_contains': (self.ui_animator(descriptionContains=text_pattern), "descriptionContains")
             }
 
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                # 如果指定了匹配方式
-                if match_type:
-                    if match_type not in selector_map:
-                        raise ValueError(f"不支持的匹配方式: {match_type}")
-                    selectors = [selector_map[match_type]]
-                else:
-                    # 尝试所有匹配方式
-                    selectors = list(selector_map.values())
+            # 如果指定了匹配方式
+            if match_type:
+                if match_type not in selector_map:
+                    raise ValueError(f"不支持的匹配方式: {match_type}")
+                selectors = [selector_map[match_type]]
+            else:
+                # 尝试所有匹配方式
+                selectors = list(selector_map.values())
 
+            def find_element() -> bool:
                 for selector, selector_type in selectors:
                     if selector.exists:
                         element = selector.info
@@ -484,8 +512,10 @@ class WaitForKeyElementAction(BaseAction):
                                 }
                                 self.bot.set_variable(save_to, element_info)
                             return True
+                return False
 
-                time.sleep(interval)
+            if self._wait_until(find_element, timeout, interval):
+                return True
 
             self.logger.warning(f"等待关键元素超时: {text_pattern}")
             return False
@@ -1,5 +1,6 @@
 from typing import Dict, Any, List
 from .base_action import BaseAction
+from ...utils.ui_tree import parse_bounds
 import time
 import subprocess
 import cv2
@@ -9,6 +10,7 @@ import shutil
 
 class WaitAndClickRegionAction(BaseAction):
     """等待并点击指定区域"""
+    invalidates_ui = True
     
     def execute(self, params: Dict[str, Any]) -> bool:
         region = params['region']
@@ -17,9 +19,8 @@ class WaitAndClickRegionAction(BaseAction):
         
         try:
             # 先解析变量引用
-            if isinstance(region, str) and region.startswith('${') and region.endswith('}'):
-                var_name = region.strip('${}')
-                region = self.bot.get_variable(var_name)
+            if isinstance(region, str) and '${' in region:
+                region = self.resolve_value(region)
             
             # 处理region参数
             if isinstance(region, (list, tuple)):
@@ -37,11 +38,10 @@ class WaitAndClickRegionAction(BaseAction):
                         x1, y1, x2, y2 = map(int, region_list)
                     except:
                         # 如果解析失败，尝试作为bounds字符串处理
-                        bounds_parts = region.strip('[]').split('][')
-                        if len(bounds_parts) != 2:
+                        bounds = parse_bounds(region)
+                        if not bounds:
                             raise ValueError("bounds格式错误，应为: [x1,y1][x2,y2]")
-                        x1, y1 = map(int, bounds_parts[0].split(','))
-                        x2, y2 = map(int, bounds_parts[1].split(','))
+                        x1, y1, x2, y2 = bounds
                 else:
                     raise ValueError("region参数格式错误")
             else:
@@ -68,6 +68,7 @@ class WaitAndClickRegionAction(BaseAction):
 
 class ScrollAction(BaseAction):
     """滚动屏幕"""
+    invalidates_ui = True
     def execute(self, params: Dict[str, Any]) -> bool:
         direction = params['direction']
         distance = int(params['distance'])
@@ -112,6 +113,7 @@ class ScrollAction(BaseAction):
 
 class SwipeAction(BaseAction):
     """滑动操作"""
+    invalidates_ui = True
     def execute(self, params: Dict[str, Any]) -> bool:
         start_x = params['start_x']
         start_y = params['start_y']
@@ -133,6 +135,7 @@ class SwipeAction(BaseAction):
 
 class ClickRegionAction(BaseAction):
     """点击指定区域"""
+    invalidates_ui = True
     def execute(self, params: Dict[str, Any]) -> bool:
         region = params['region']
         
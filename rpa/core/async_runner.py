@@ -0,0 +1,80 @@
+from typing import Any, Coroutine, Dict, Optional
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from rpa.utils.logger import get_logger
+
+class AsyncFlowRunner:
+    """进程级共享的异步流程运行器
+
+    所有设备的流程在同一个事件循环中以协程运行(BaseBot.run_flow_async)。
+    事件循环在独立的后台线程中运行，默认线程池容量固定为max_workers，
+    截图、dump、点击、adb等阻塞调用都在该线程池中执行，等待类动作在等待
+    期间不占用线程，因此线程数不再随设备数增长。
+    """
+    _instance = None
+    _lock = threading.Lock()  # 单例锁
+
+    @classmethod
+    def get_instance(cls, settings: Optional[Dict[str, Any]] = None) -> 'AsyncFlowRunner':
+        """获取运行器单例
+
+        Args:
+            settings: 异步引擎配置(配置文件中的async_engine段)，只在第一次创建时生效
+
+        Returns:
+            AsyncFlowRunner: 共享的运行器
+        """
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    settings = dict(settings or {})
+                    settings.pop('enabled', None)
+                    cls._instance = cls(**settings)
+        return cls._instance
+
+    def __init__(self, max_workers: int = 32):
+        """
+        Args:
+            max_workers: 执行阻塞调用的线程池大小
+        """
+        self.logger = get_logger(__name__)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rpa-io')
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self._thread = threading.Thread(target=self._run_loop, name='rpa-event-loop', daemon=True)
+        self._thread.start()
+        self.logger.info(f"异步流程运行器已启动 (线程池大小: {max_workers})")
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine) -> Future:
+        """把协程提交到共享事件循环，可在任意线程调用
+
+        Args:
+            coro: 要运行的协程，如bot.run_flow_async(...)
+
+        Returns:
+            Future: 协程的执行结果
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    def _log_failure(self, future: Future) -> None:
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.logger.error(f"异步流程执行失败: {str(error)}")
+
+    def shutdown(self) -> None:
+        """停止事件循环和线程池"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self.executor.shutdown(wait=False)
+        with AsyncFlowRunner._lock:
+            if AsyncFlowRunner._instance is self:
+                AsyncFlowRunner._instance = None
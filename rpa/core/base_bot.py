@@ -1,16 +1,25 @@
 import os
+import asyncio
+import concurrent.futures
 import logging
 import subprocess
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Mapping, Optional, Tuple, Union
 from pathlib import Path
 import time
 import yaml
 from rpa.utils.logger import get_logger  # 改为绝对导入
 from rpa.utils.screenshot import ScreenshotHelper
 from rpa.utils.ocr_helper import OCRHelper
+from rpa.utils.ui_snapshot import UISnapshot
+from rpa.utils.export_queue import ExportQueue
+from lib import record_log
 import uiautomator2 as u2  # 修改导入方式
 import requests  # 添加请求库以发送飞书通知
 from rpa.core.actions import get_action_class  # 导入获取动作类的函数
+from rpa.core.flow_plan import FlowCompiler, FlowPlan, CompiledStep
+from rpa.core.template import lookup_path, resolve_value
+from lib.wait import ChangeSignal
+from lib.device_session import get_device
 
 class BaseBot:
     """RPA基础机器人类"""
@@ -44,21 +53,37 @@ class BaseBot:
         }
         
         # 初始化工具类
-        self.screenshot_helper = ScreenshotHelper(self.device_ip)
-        self.ocr_helper = OCRHelper()
+        self.screenshot_helper = ScreenshotHelper(self.device_ip, self.config.get('screenshot', {}))
+        self.ocr_helper = OCRHelper(settings=self.config.get('ocr', {}))
+        # 界面变化信号：UI快照失效或画面流检测到画面变化时通知，等待类动作据此提前重新检查
+        self.ui_changes = ChangeSignal()
+        if self.screenshot_helper.stream:
+            self.screenshot_helper.stream.changes.link(self.ui_changes)
+        # UI层级快照，节点类动作共用，改变界面的动作执行后失效
+        self.ui_snapshot = UISnapshot(self.ui_animator, ttl=self.config.get('ui_snapshot', {}).get('ttl', 2.0),
+                                      changes=self.ui_changes)
+        # 等待引擎参数(见lib/wait.py)
+        self.wait_settings = self.config.get('wait', {})
 
        # 参数
         self.variables = self.config.get('variables', {})
 
        # 任务id，主要用作发送飞书通知
         self.task_id = task_id
+
+        # 流程编译器，流程在执行前编译为执行计划
+        self.compiler = FlowCompiler(self)
+
+        # 运行时变量和步骤结果，parallel的分支会并发读写，提前创建
+        self._variables = {}
+        self._step_results = {}
+        # parallel转入后台的分支(Future/Task -> (Branch, 失败时流程是否失败))，流程结束前统一等待
+        self._background_branches = {}
         
     def _init_device(self):
-        """初始化设备连接"""
-        import uiautomator2 as u2
-        
+        """初始化设备连接(进程内同一设备共用一个连接)"""
         try:
-            device = u2.connect(self.device_ip)
+            device = get_device(self.device_ip)
             # 应用设备配置
             if 'settings' in self.device_config:
                 settings = self.device_config['settings']
@@ -112,72 +137,163 @@ class BaseBot:
         except subprocess.CalledProcessError:
             raise RuntimeError("设备状态检查失败")
             
-    def _resolve_variable(self, value: str) -> str:
-        """解析配置中的变量引用，支持嵌套引用
+    def _lookup_variable(self, path: Tuple[str, ...]) -> Any:
+        """按占位符路径查找变量值，一次查找即可确定来源
+        
+        查找顺序: variables.*(流程定义)、prerequisites.*、环境变量、运行时变量
         
         Args:
-            value: 包含变量引用的字符串
+            path: 占位符路径，如 ('variables', 'x', 'y')
             
         Returns:
-            解析后的字符串
+            变量值，找不到时返回MISSING
         """
-        if not isinstance(value, str):
-            return value
-            
-        if "${" not in value:
-            return value
-            
-        # 解析环境变量
-        result = value
-        for key, val in self.env.items():
-            result = result.replace(f"${{{key}}}", str(val))
+        head = path[0]
+        flow_config = getattr(self, 'current_flow_config', None) or {}
+        if head == 'variables' and len(path) > 1:
+            return lookup_path(flow_config.get('variables', {}), path[1:])
+        if head == 'prerequisites' and len(path) > 1:
+            return lookup_path(flow_config.get('prerequisites', {}), path[1:])
+        if len(path) == 1 and head in self.env:
+            return self.env[head]
+        return lookup_path(getattr(self, '_variables', {}), path)
+
+    def resolve_value(self, value: Any, missing: Any = None) -> Any:
+        """解析值中的${...}引用，包括运行时变量
         
-        # 解析流程配置中的变量
-        if hasattr(self, 'current_flow_config'):
-            # 解析 variables 中的变量
-            variables = self.current_flow_config.get('variables', {})
-            for key, val in variables.items():
-                placeholder = f"${{variables.{key}}}"
-                if placeholder in result:
-                    result = result.replace(placeholder, str(val))
+        Args:
+            value: 字符串、字典或列表
+            missing: 整个字符串为单个占位符且找不到变量时的返回值
             
-            # 解析 prerequisites 中的变量
-            prerequisites = self.current_flow_config.get('prerequisites', {})
-            for section, section_data in prerequisites.items():
-                if isinstance(section_data, dict):
-                    for key, val in section_data.items():
-                        placeholder = f"${{prerequisites.{section}.{key}}}"
-                        if placeholder in result:
-                            result = result.replace(placeholder, str(val))
-                            
-        return result
+        Returns:
+            整个字符串为单个占位符时返回变量原始值，否则返回拼接后的字符串；
+            字典和列表递归解析
+        """
+        return resolve_value(value, self._lookup_variable, missing)
         
     def run_flow(self, flow_config: Dict[str, Any], start_step_index: int = 0) -> None:
         """执行流程"""
         try:
-            self.current_flow_config = flow_config
-
-            # 验证流程配置
-            self._validate_flow_config(flow_config)
+            plan = self._begin_flow(flow_config)
             
             # 执行流程步骤
-            steps = flow_config.get('steps', [])
-            for index, step in enumerate(steps):
+            for index, step in enumerate(plan.steps):
                 # 从指定步骤索引开始执行
                 if index < start_step_index:
-                    self.logger.info(f"跳过步骤: {step.get('name')}")
+                    self.logger.info(f"跳过步骤: {step.name}")
                     continue
                 
                 self._execute_step(step, self.current_step_index)  # 使用步骤执行监听器执行步骤
-                self.current_step_index += 1  # 每个步骤执行后递增序号
-                # 记录已完成步骤
-                self.completed_steps.append(step.get('name'))
+                self._step_completed(step)
+            
+            # 等待parallel转入后台的分支
+            self._raise_branch_errors(self._join_background_branches())
+                
+        except Exception as e:
+            self.logger.error(f"流程执行失败: {str(e)}")
+            raise RuntimeError(f"流程执行失败: {str(e)}")
+        finally:
+            # 流程异常结束时也等待后台分支，避免分支在画面流关闭后继续操作设备
+            self._join_background_branches()
+            self._end_flow()
+
+    async def run_flow_async(self, flow_config: Dict[str, Any], start_step_index: int = 0) -> None:
+        """在事件循环中执行流程
+        
+        与run_flow的执行顺序和结果一致。每个步骤通过动作的execute_async执行：
+        等待类动作在等待期间让出事件循环，其余阻塞调用放到线程池，
+        因此一个事件循环可以同时驱动多台设备的流程。
+        """
+        try:
+            plan = self._begin_flow(flow_config)
+            
+            for index, step in enumerate(plan.steps):
+                if index < start_step_index:
+                    self.logger.info(f"跳过步骤: {step.name}")
+                    continue
+                
+                await self._execute_step_async(step, self.current_step_index)
+                self._step_completed(step)
+            
+            self._raise_branch_errors(await self._join_background_branches_async())
                 
         except Exception as e:
             self.logger.error(f"流程执行失败: {str(e)}")
             raise RuntimeError(f"流程执行失败: {str(e)}")
         finally:
-            self.current_flow_config = None
+            await self._join_background_branches_async()
+            self._end_flow()
+
+    def _begin_flow(self, flow_config: Dict[str, Any]) -> FlowPlan:
+        """验证并编译流程"""
+        self.current_flow_config = flow_config
+
+        # 验证流程配置
+        self._validate_flow_config(flow_config)
+        
+        # 编译执行计划(绑定动作实例、解析条件、编译嵌套步骤)，整个流程只做一次
+        return self.compiler.compile_flow(flow_config)
+
+    def _step_completed(self, step: CompiledStep) -> None:
+        self.current_step_index += 1  # 每个步骤执行后递增序号
+        # 记录已完成步骤
+        self.completed_steps.append(step.name)
+
+    def _add_background_branches(self, futures: Dict[Any, Any], required: bool = True) -> None:
+        """登记parallel转入后台的分支
+
+        Args:
+            futures: Future或asyncio.Task到分支(Branch)的映射
+            required: 分支失败时流程是否失败，为False时只记录日志
+        """
+        for future, branch in futures.items():
+            self._background_branches[future] = (branch, required)
+
+    def _join_background_branches(self) -> List[str]:
+        """等待所有后台分支完成
+
+        Returns:
+            List[str]: 必须成功的分支中失败分支的错误描述
+        """
+        errors = []
+        while self._background_branches:
+            future, (branch, required) = self._background_branches.popitem()
+            try:
+                future.result()
+            except Exception as e:
+                self.logger.error(f"后台分支 {branch.name} 执行失败: {str(e)}")
+                if required:
+                    errors.append(f"{branch.name}: {str(e)}")
+        return errors
+
+    async def _join_background_branches_async(self) -> List[str]:
+        """_join_background_branches的异步版本，同时支持Future和asyncio.Task"""
+        errors = []
+        while self._background_branches:
+            future, (branch, required) = self._background_branches.popitem()
+            if isinstance(future, concurrent.futures.Future):
+                future = asyncio.wrap_future(future)
+            try:
+                await future
+            except Exception as e:
+                self.logger.error(f"后台分支 {branch.name} 执行失败: {str(e)}")
+                if required:
+                    errors.append(f"{branch.name}: {str(e)}")
+        return errors
+
+    def _raise_branch_errors(self, errors: List[str]) -> None:
+        if errors:
+            raise RuntimeError(f"后台分支执行失败: {'; '.join(errors)}")
+
+    def _end_flow(self) -> None:
+        self.current_flow_config = None
+        # 等待后台导出队列写完本流程提交的记录
+        export_queue = ExportQueue.current()
+        if export_queue and not export_queue.flush(self.config.get('export', {}).get('flush_timeout', 60)):
+            self.logger.error("等待导出队列写入超时")
+        record_log.flush_all()
+        # 流程结束后停止画面流，避免空闲设备持续被截图
+        self.screenshot_helper.close()
             
     def _validate_flow_config(self, config: Dict[str, Any]) -> None:
         """验证流程配置格式"""
@@ -186,76 +302,99 @@ class BaseBot:
             if field not in config:
                 raise ValueError(f"缺少必要的配置项: {field}")
                 
-    def _execute_step(self, step: Dict[str, Any], step_index: int) -> None:
-        """执行单个步骤并处理异常"""
+    def _execute_step(self, step: Union[Dict[str, Any], CompiledStep], step_index: int = None) -> None:
+        """执行单个步骤并处理异常
+
+        Args:
+            step: 编译后的步骤，传入步骤字典时先编译
+            step_index: 步骤索引，默认为当前步骤序号(loop/for_each的子步骤)
+        """
+        if step_index is None:
+            step_index = self.current_step_index
         try:
-            step_name = step.get('name', '未命名步骤')
+            step, params = self._prepare_step(step, step_index)
+            if step is None:
+                return
 
-            # # 统一处理条件检查
-            # if not self._should_execute_step(step):
-            #     self.logger.info(f"跳过步骤 {step_name}: 条件不满足")
-            #     return
-            
-            # 处理步骤参数中的变量
-            if 'params' in step:
-                params = step['params']
-                for key, value in params.items():
-                    params[key] = self._resolve_variable(value)
-
-            action_name = step.get('action')
-            self.logger.info(f"执行步骤: {step.get('name')} (步骤索引: {step_index})")
-
-            # 使用 get_action_class 获取动作类
-            action_class = get_action_class(action_name)
-
-             # 缓存实例
-            action_cache_name = f'_{action_name}_action'
-            if not hasattr(self, action_cache_name):
-                setattr(self, action_cache_name, action_class(self))
-                
-            action = getattr(self, action_cache_name)
-            action.execute(params)
+            action = step.action
+            try:
+                result = action.execute(params)
+            finally:
+                self._after_action(action)
+            self._save_step_result(step.name, result)
 
         except Exception as e:
             self.logger.error(f"步骤 {step.get('name')} 执行失败: {str(e)}")
             self.notify_failure(step.get('name'), str(e), step_index)
             raise  # 重新抛出异常以停止流程
 
-    def _should_execute_step(self, step: Dict[str, Any]) -> bool:
-        """检查步骤是否应该执行"""
-        # 处理单个condition
-        condition = step.get('condition')
-        if condition:
-            if isinstance(condition, str) and "${" in condition:
-                # 解析条件变量
-                var_name = condition[2:-1]  # 去掉 ${ 和 }
-                condition_value = self.get_variable(var_name)
-                if not condition_value:
-                    self.logger.info(f"跳过步骤 {step.get('name', '')}: 条件不满足 ({var_name} = {condition_value})")
-                    return False
-        
-        # 处理conditions列表
-        conditions = step.get('conditions', [])
-        if conditions:
-            # 所有条件都必须满足
-            for condition in conditions:
-                condition_type = condition['type']
-                if condition_type == 'variable':
-                    var_name = condition['name']
-                    expected_value = condition['value']
-                    actual_value = self.get_variable(var_name)
-                    if actual_value != expected_value:
-                        self.logger.info(f"跳过步骤 {step.get('name', '')}: 条件不满足 ({var_name} = {actual_value}, 期望 = {expected_value})")
-                        return False
-                elif condition_type == 'step_result':
-                    step_name = condition['step']
-                    expected_value = condition['value']
-                    step_result = self._get_step_result(step_name)
-                    if step_result != expected_value:
-                        self.logger.info(f"跳过步骤 {step.get('name', '')}: 条件不满足 ({step_name} = {step_result}, 期望 = {expected_value})")
-                        return False
+    async def _execute_step_async(self, step: Union[Dict[str, Any], CompiledStep], step_index: int = None) -> None:
+        """_execute_step的异步版本，通过动作的execute_async执行"""
+        if step_index is None:
+            step_index = self.current_step_index
+        try:
+            step, params = self._prepare_step(step, step_index)
+            if step is None:
+                return
+
+            action = step.action
+            try:
+                result = await action.execute_async(params)
+            finally:
+                self._after_action(action)
+            self._save_step_result(step.name, result)
+
+        except Exception as e:
+            self.logger.error(f"步骤 {step.get('name')} 执行失败: {str(e)}")
+            # 飞书通知是阻塞的HTTP请求，放到线程池发送
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.notify_failure, step.get('name'), str(e), step_index
+            )
+            raise
+
+    def _prepare_step(self, step: Union[Dict[str, Any], CompiledStep],
+                      step_index: int) -> Tuple[Optional[CompiledStep], Mapping[str, Any]]:
+        """编译步骤、检查条件并生成本次调用的参数
+
+        Returns:
+            (编译后的步骤, 参数视图)，条件不满足时步骤为None
+        """
+        step = self.compiler.compile_step(step)
+
+        # 统一处理条件检查
+        if not step.should_execute(self):
+            return None, {}
         
-        return True
+        # 生成本次调用的参数视图，步骤定义保持不变，循环中每次迭代重新解析
+        params = step.resolve_params(self)
+
+        self.logger.info(f"执行步骤: {step.name} (步骤索引: {step_index})")
+        return step, params
+
+    def mark_ui_changed(self) -> None:
+        """界面已被操作改变：UI快照失效，之后的截图使用操作后采集的画面"""
+        self.screenshot_helper.mark_ui_changed()
+        self.ui_snapshot.invalidate()
+
+    def _after_action(self, action: Any) -> None:
+        """动作执行后的处理：改变界面的动作使UI快照和画面失效，等待类动作使UI快照失效"""
+        if action.invalidates_ui:
+            self.mark_ui_changed()
+        elif action.waits:
+            self.ui_snapshot.invalidate()
+
+    def _should_execute_step(self, step: Union[Dict[str, Any], CompiledStep]) -> bool:
+        """检查步骤是否应该执行"""
+        return self.compiler.compile_step(step).should_execute(self)
+
+    def _get_action(self, action_type: str) -> Any:
+        """获取动作实例，同一类型的动作在机器人内只创建一次"""
+        action_cache_name = f'_{action_type}_action'
+        action = getattr(self, action_cache_name, None)
+        if action is None:
+            action = get_action_class(action_type)(self)
+            setattr(self, action_cache_name, action)
+        return action
 
     def _save_step_result(self, step_name: str, result: Any) -> None:
         """保存步骤执行结果"""
@@ -270,15 +409,11 @@ class BaseBot:
     def _execute_action(self, action_type: str, params: Dict[str, Any]) -> Any:
         """执行指定类型的动作"""
         try:
-            action_class = get_action_class(action_type)
-            
-            # 缓存实例
-            action_cache_name = f'_{action_type}_action'
-            if not hasattr(self, action_cache_name):
-                setattr(self, action_cache_name, action_class(self))
-                
-            action = getattr(self, action_cache_name)
-            return action.execute(params)
+            action = self._get_action(action_type)
+            try:
+                return action.execute(params)
+            finally:
+                self._after_action(action)
             
         except Exception as e:
             self.logger.error(f"执行动作 {action_type} 失败: {str(e)}")
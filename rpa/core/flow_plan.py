@@ -0,0 +1,203 @@
+from typing import Any, Dict, List, Mapping, Tuple
+from collections import ChainMap
+from types import MappingProxyType
+from rpa.core.template import KEEP, has_template
+
+# 子步骤需要预编译的容器动作
+CONTAINER_ACTIONS = ('loop', 'for_each')
+# 分支需要预编译的并行动作
+PARALLEL_ACTION = 'parallel'
+
+class Condition:
+    """预解析的步骤条件
+
+    kind取值:
+    - truthy: 变量值为真，对应 condition: "${var}"
+    - variable: 变量值等于value
+    - step_result: 步骤结果等于value
+    """
+    __slots__ = ('kind', 'name', 'value')
+
+    def __init__(self, kind: str, name: str, value: Any = None):
+        self.kind = kind
+        self.name = name
+        self.value = value
+
+    @classmethod
+    def from_dict(cls, condition: Dict[str, Any]) -> 'Condition':
+        """从conditions/break_conditions中的条件字典创建"""
+        condition_type = condition['type']
+        if condition_type == 'variable':
+            return cls('variable', condition['name'], condition['value'])
+        if condition_type == 'step_result':
+            return cls('step_result', condition['step'], condition['value'])
+        raise ValueError(f"不支持的条件类型: {condition_type}")
+
+    def actual(self, bot) -> Any:
+        """获取条件涉及的实际值"""
+        if self.kind == 'step_result':
+            return bot._get_step_result(self.name)
+        return bot.get_variable(self.name)
+
+    def check(self, bot) -> bool:
+        if self.kind == 'truthy':
+            return bool(self.actual(bot))
+        return self.actual(bot) == self.value
+
+    def describe(self, bot) -> str:
+        """用于日志的条件描述"""
+        if self.kind == 'truthy':
+            return f"{self.name} = {self.actual(bot)}"
+        return f"{self.name} = {self.actual(bot)}, 期望 = {self.value}"
+
+class CompiledStep:
+    """编译后的步骤
+
+    动作实例在编译时绑定，含${...}的参数键预先记录，条件预先解析为
+    Condition，loop/for_each的子步骤和parallel的分支也已编译。params是只读映射，
+    每次执行通过resolve_params得到本次调用的参数视图，步骤定义本身不会被修改。
+    """
+    __slots__ = ('name', 'action_name', 'action', 'params', 'template_keys', 'conditions')
+
+    def __init__(self, name: str, action_name: str, action, params: Mapping[str, Any],
+                 template_keys: Tuple[str, ...], conditions: Tuple[Condition, ...]):
+        self.name = name
+        self.action_name = action_name
+        self.action = action
+        self.params = params
+        self.template_keys = template_keys
+        self.conditions = conditions
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """兼容步骤字典的读取方式"""
+        if key == 'name':
+            return self.name
+        if key == 'action':
+            return self.action_name
+        if key == 'params':
+            return self.params
+        return default
+
+    def resolve_params(self, bot) -> Mapping[str, Any]:
+        """生成本次调用的参数视图
+
+        只解析含${...}的参数，结果放在ChainMap的第一层，其余参数直接读取
+        步骤定义，不复制。没有模板参数时直接返回只读的步骤参数。
+        """
+        if not self.template_keys:
+            return self.params
+        resolved = {
+            key: bot.resolve_value(self.params[key], KEEP)
+            for key in self.template_keys
+        }
+        return ChainMap(resolved, self.params)
+
+    def should_execute(self, bot) -> bool:
+        """所有条件都满足时返回True"""
+        for condition in self.conditions:
+            if not condition.check(bot):
+                bot.logger.info(f"跳过步骤 {self.name}: 条件不满足 ({condition.describe(bot)})")
+                return False
+        return True
+
+class Branch:
+    """编译后的并行分支"""
+    __slots__ = ('name', 'steps')
+
+    def __init__(self, name: str, steps: Tuple[CompiledStep, ...]):
+        self.name = name
+        self.steps = steps
+
+class FlowPlan:
+    """编译后的流程执行计划"""
+    __slots__ = ('name', 'steps')
+
+    def __init__(self, name: str, steps: Tuple[CompiledStep, ...]):
+        self.name = name
+        self.steps = steps
+
+class FlowCompiler:
+    """把YAML流程定义编译为执行计划，每个流程只编译一次"""
+
+    def __init__(self, bot):
+        """
+        Args:
+            bot: BaseBot实例，动作实例绑定到该机器人
+        """
+        self.bot = bot
+
+    def compile_flow(self, flow_config: Dict[str, Any]) -> FlowPlan:
+        return FlowPlan(
+            flow_config.get('name', '未命名流程'),
+            self.compile_steps(flow_config.get('steps', []))
+        )
+
+    def compile_steps(self, steps: List[Dict[str, Any]]) -> Tuple[CompiledStep, ...]:
+        return tuple(self.compile_step(step) for step in steps)
+
+    def compile_step(self, step: Dict[str, Any]) -> CompiledStep:
+        """编译单个步骤
+
+        Raises:
+            ValueError: 动作类型未知或参数格式错误时抛出
+        """
+        if isinstance(step, CompiledStep):
+            return step
+
+        name = step.get('name', '未命名步骤')
+        action_name = step.get('action')
+        action = self.bot._get_action(action_name)
+
+        params = dict(step.get('params') or {})
+        if action_name in CONTAINER_ACTIONS:
+            nested_steps = params.get('steps', [])
+            if not isinstance(nested_steps, (list, tuple)):
+                raise ValueError(f"步骤 {name} 的steps参数必须是列表")
+            params['steps'] = self.compile_steps(nested_steps)
+            if 'break_conditions' in params:
+                params['break_conditions'] = compile_conditions(params['break_conditions'])
+        elif action_name == PARALLEL_ACTION:
+            params['branches'] = self.compile_branches(params.get('branches', []), name)
+
+        template_keys = tuple(key for key, value in params.items() if has_template(value))
+
+        conditions = []
+        condition = step.get('condition')
+        if isinstance(condition, str) and condition.startswith('${') and condition.endswith('}'):
+            conditions.append(Condition('truthy', condition[2:-1]))
+        conditions.extend(compile_conditions(step.get('conditions', [])))
+
+        return CompiledStep(name, action_name, action, MappingProxyType(params),
+                            template_keys, tuple(conditions))
+
+    def compile_branches(self, branches: List[Any], step_name: str = '') -> Tuple[Branch, ...]:
+        """编译parallel的分支
+
+        分支可以写成{name, steps}，也可以直接写成步骤列表；已编译的分支原样保留。
+
+        Raises:
+            ValueError: 分支格式错误时抛出
+        """
+        if not isinstance(branches, (list, tuple)):
+            raise ValueError(f"步骤 {step_name} 的branches参数必须是列表")
+        compiled = []
+        for index, branch in enumerate(branches, 1):
+            if isinstance(branch, Branch):
+                compiled.append(branch)
+                continue
+            if isinstance(branch, dict):
+                name = branch.get('name', f'分支{index}')
+                steps = branch.get('steps', [])
+            else:
+                name, steps = f'分支{index}', branch
+            if not isinstance(steps, (list, tuple)):
+                raise ValueError(f"步骤 {step_name} 的分支 {name} 的steps必须是列表")
+            compiled.append(Branch(name, self.compile_steps(steps)))
+        return tuple(compiled)
+
+def compile_conditions(conditions: List[Any]) -> Tuple[Condition, ...]:
+    """把条件字典列表编译为Condition元组，已编译的条件原样保留"""
+    return tuple(
+        condition if isinstance(condition, Condition) else Condition.from_dict(condition)
+        for condition in conditions or []
+    )
@@ -0,0 +1,343 @@
+from typing import Any, Callable, Dict, List, Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+import yaml
+from rpa.utils.db import get_sqlite_pool
+from rpa.utils.device_manager import DeviceManager
+from rpa.utils.logger import get_logger
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+class SchedulerFullError(Exception):
+    """排队任务数达到上限"""
+
+class TaskStore:
+    """任务队列的SQLite持久化，进程重启后排队中的任务继续执行"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id TEXT NOT NULL UNIQUE,
+            flow_path TEXT NOT NULL,
+            variables TEXT,
+            priority INTEGER DEFAULT 0,
+            start_step_index INTEGER DEFAULT 0,
+            device_ips TEXT,
+            device_ip TEXT,
+            max_concurrency INTEGER,
+            status TEXT NOT NULL,
+            error TEXT,
+            enqueued_at REAL,
+            started_at REAL,
+            finished_at REAL
+        )
+    """
+
+    def __init__(self, database: str):
+        self.pool = get_sqlite_pool(database)
+        with self.pool.connection() as conn:
+            conn.execute(self.SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_queue ON tasks (status, priority DESC, seq)")
+            conn.commit()
+
+    def _row(self, cursor, row) -> Dict[str, Any]:
+        task = dict(zip([col[0] for col in cursor.description], row))
+        task['variables'] = json.loads(task['variables'] or '{}')
+        task['device_ips'] = json.loads(task['device_ips'] or '[]')
+        return task
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self.pool.connection() as conn:
+            cursor = conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,))
+            row = cursor.fetchone()
+            return self._row(cursor, row) if row else None
+
+    def put(self, task: Dict[str, Any]) -> bool:
+        """新增任务，task_id已存在且已结束时覆盖为新的排队任务
+
+        Returns:
+            bool: 是否写入，同一task_id的任务仍在排队或执行中时不写入并返回False
+        """
+        with self.pool.connection() as conn:
+            # 只删除已结束的旧任务，排队中或执行中的任务保留，下面的INSERT因task_id唯一约束失败
+            conn.execute(
+                "DELETE FROM tasks WHERE task_id = ? AND status NOT IN (?, ?)",
+                (task['task_id'], QUEUED, RUNNING)
+            )
+            try:
+                conn.execute(
+                    """
+                    INSERT INTO tasks (task_id, flow_path, variables, priority, start_step_index,
+                                       device_ips, device_ip, max_concurrency, status, enqueued_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (task['task_id'], task['flow_path'], json.dumps(task['variables'], ensure_ascii=False),
+                     task['priority'], task['start_step_index'], json.dumps(task['device_ips']),
+                     task['device_ip'], task['max_concurrency'], QUEUED, time.time())
+                )
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                return False
+            conn.commit()
+            return True
+
+    def queued(self, limit: int) -> List[Dict[str, Any]]:
+        """按优先级(高优先)和提交顺序返回排队中的任务"""
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                "SELECT * FROM tasks WHERE status = ? ORDER BY priority DESC, seq LIMIT ?",
+                (QUEUED, limit)
+            )
+            return [self._row(cursor, row) for row in cursor.fetchall()]
+
+    def count(self, status: str, flow_path: Optional[str] = None) -> int:
+        """指定状态的任务数，可按流程过滤"""
+        with self.pool.connection() as conn:
+            if flow_path is None:
+                return conn.execute("SELECT COUNT(*) FROM tasks WHERE status = ?", (status,)).fetchone()[0]
+            return conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status = ? AND flow_path = ?", (status, flow_path)
+            ).fetchone()[0]
+
+    def position(self, task_id: str) -> Optional[int]:
+        """任务在队列中的位置(从1开始)"""
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                """
+                SELECT COUNT(*) FROM tasks t, tasks me
+                WHERE me.task_id = ? AND me.status = ? AND t.status = ?
+                  AND (t.priority > me.priority OR (t.priority = me.priority AND t.seq <= me.seq))
+                """,
+                (task_id, QUEUED, QUEUED)
+            ).fetchone()
+            return row[0] or None
+
+    def mark_running(self, task_id: str, device_ip: str) -> None:
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = ?, device_ip = ?, started_at = ? WHERE task_id = ?",
+                (RUNNING, device_ip, time.time(), task_id)
+            )
+            conn.commit()
+
+    def mark_finished(self, task_id: str, status: str, error: Optional[str] = None) -> None:
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, finished_at = ? WHERE task_id = ?",
+                (status, error, time.time(), task_id)
+            )
+            conn.commit()
+
+    def requeue_running(self) -> int:
+        """进程重启时把上次未执行完的任务放回队列"""
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = ?, device_ip = NULL, started_at = NULL WHERE status = ?",
+                (QUEUED, RUNNING)
+            )
+            conn.commit()
+            return cursor.rowcount
+
+Launcher = Callable[[Dict[str, Any], str], Future]
+
+class TaskScheduler:
+    """流程任务调度器
+
+    /api/flow/start只把任务写入持久化队列，调度线程在有设备空闲或任务结束时
+    按优先级(相同优先级先到先执行)分配设备并启动流程:
+    - 设备亲和：任务只能分配到流程device.ip中的设备，恢复的任务只使用原来的设备
+    - 流程并发上限：流程文件的scheduler.max_concurrency或配置的flow_limits(路径相对项目根目录)
+    - 高优先级任务等待的设备不会被同一轮中低优先级的任务抢走，设备不重叠的任务不受影响
+    - 排队任务数达到max_queued时拒绝新任务(SchedulerFullError)，由调用方稍后重试
+    """
+    _instance = None
+    _lock = threading.Lock()  # 单例锁
+
+    @classmethod
+    def get_instance(cls, settings: Optional[Dict[str, Any]] = None, launcher: Optional[Launcher] = None) -> 'TaskScheduler':
+        """获取调度器单例
+
+        Args:
+            settings: 调度配置(配置文件中的scheduler段)，只在第一次创建时生效
+            launcher: 启动任务的函数，参数为(任务, 设备IP)，返回流程执行的Future
+        """
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls(settings or {}, launcher)
+        return cls._instance
+
+    def __init__(self, settings: Dict[str, Any], launcher: Launcher):
+        self.logger = get_logger(__name__)
+        self.launcher = launcher
+        self.device_manager = DeviceManager()
+        self.max_queued = settings.get('max_queued', 1000)
+        self.retry_after = settings.get('retry_after', 5)
+        self.tick = settings.get('tick', 1.0)
+        self.scan_limit = settings.get('scan_limit', 200)
+        # 配置中的流程路径相对项目根目录，与提交任务时的流程路径统一为绝对路径比较
+        self.flow_limits = {
+            self._flow_key(flow_path): limit
+            for flow_path, limit in (settings.get('flow_limits', {}) or {}).items()
+        }
+        self.store = TaskStore(settings.get('database', 'data/task_queue.db'))
+
+        self._running_per_flow: Dict[str, int] = defaultdict(int)
+        self._running_lock = threading.Lock()
+        self._submit_lock = threading.Lock()  # 去重检查、容量检查与写入作为一个整体，避免同一任务被重复提交
+        self._wakeup = threading.Condition()
+        self._pending = False
+
+        requeued = self.store.requeue_running()
+        if requeued:
+            self.logger.info(f"已将 {requeued} 个未执行完的任务放回队列")
+        self._thread = threading.Thread(target=self._dispatch_loop, name='task-scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, flow_path: str, task_id: str, variables: Optional[Dict[str, Any]] = None,
+               priority: Optional[int] = None, start_step_index: int = 0,
+               device_ip: Optional[str] = None) -> Dict[str, Any]:
+        """提交任务
+
+        Args:
+            flow_path: 流程文件路径
+            task_id: 任务ID，排队中或执行中的同一任务重复提交时直接返回已有任务
+            variables: 流程变量
+            priority: 优先级，越大越先执行，默认取流程文件的scheduler.priority
+            start_step_index: 开始执行的步骤索引
+            device_ip: 指定设备(恢复任务时使用任务原来占用的设备，设备空闲或仍为该任务保留时才启动)
+
+        Returns:
+            Dict: 任务信息
+
+        Raises:
+            SchedulerFullError: 排队任务数达到上限
+        """
+        with open(flow_path, 'r', encoding='utf-8') as f:
+            flow_config = yaml.safe_load(f) or {}
+        device_ips = flow_config.get('device', {}).get('ip') or ''
+        device_ips = [ip.strip() for ip in str(device_ips).split(',') if ip.strip()]
+        if not device_ips and not device_ip:
+            raise ValueError("未配置设备")
+        self.device_manager.register_devices(','.join(device_ips))
+
+        schedule_config = flow_config.get('scheduler', {}) or {}
+        task = {
+            'task_id': task_id,
+            'flow_path': str(flow_path),
+            'variables': variables or {},
+            'priority': int(priority if priority is not None else schedule_config.get('priority', 0)),
+            'start_step_index': start_step_index,
+            'device_ips': device_ips,
+            'device_ip': device_ip,
+            'max_concurrency': schedule_config.get('max_concurrency')
+        }
+        with self._submit_lock:
+            existing = self.store.get(task_id)
+            if existing and existing['status'] in (QUEUED, RUNNING):
+                return existing
+            if self.store.count(QUEUED) >= self.max_queued:
+                raise SchedulerFullError(f"排队任务数已达上限 {self.max_queued}")
+            if not self.store.put(task):
+                return self.store.get(task_id)
+        self.logger.info(f"任务 {task_id} 已加入队列 (流程: {flow_path}, 优先级: {task['priority']})")
+        self.notify()
+        return self.store.get(task_id)
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """任务信息，排队中的任务附带队列位置position"""
+        task = self.store.get(task_id)
+        if task and task['status'] == QUEUED:
+            task['position'] = self.store.position(task_id)
+        return task
+
+    def queued_count(self, flow_path: Optional[str] = None) -> int:
+        """排队中的任务数，可按流程过滤"""
+        return self.store.count(QUEUED, flow_path)
+
+    @staticmethod
+    def _flow_key(flow_path: str) -> str:
+        """流程路径的统一形式：相对路径按项目根目录解析为绝对路径"""
+        return os.path.abspath(os.path.join(os.environ.get('RPA_PROJECT_ROOT', ''), flow_path))
+
+    def notify(self) -> None:
+        """唤醒调度线程(有新任务或设备被释放)"""
+        with self._wakeup:
+            self._pending = True
+            self._wakeup.notify()
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._wakeup:
+                if not self._pending:
+                    self._wakeup.wait(self.tick)
+                self._pending = False
+            try:
+                self._dispatch()
+            except Exception as e:
+                self.logger.error(f"任务调度失败: {str(e)}")
+
+    def _dispatch(self) -> None:
+        # 本轮中更高优先级任务在等待的设备
+        reserved = set()
+        for task in self.store.queued(self.scan_limit):
+            flow_path = task['flow_path']
+            limit = self.flow_limits.get(self._flow_key(flow_path), task['max_concurrency'])
+            if limit and self._running_per_flow[flow_path] >= limit:
+                continue
+
+            device_ip = task['device_ip']
+            if device_ip:
+                # 恢复的任务只能使用原来的设备，设备空闲时才占用，否则继续排队
+                if device_ip in reserved or not self.device_manager.acquire_device(device_ip):
+                    reserved.add(device_ip)
+                    continue
+            else:
+                device_ips = task['device_ips']
+                if reserved.intersection(device_ips):
+                    continue
+                available = self.device_manager.available_devices(device_ips)
+                device_ip = self.device_manager.get_available_device(','.join(available)) if available else None
+                if not device_ip:
+                    reserved.update(device_ips)
+                    continue
+            self._launch(task, device_ip)
+
+    def _launch(self, task: Dict[str, Any], device_ip: str) -> None:
+        task_id = task['task_id']
+        self.store.mark_running(task_id, device_ip)
+        with self._running_lock:
+            self._running_per_flow[task['flow_path']] += 1
+        self.logger.info(f"任务 {task_id} 开始执行，设备: {device_ip}")
+        try:
+            future = self.launcher(task, device_ip)
+        except Exception as e:
+            self.logger.error(f"启动任务 {task_id} 失败: {str(e)}")
+            self.device_manager.release_device(device_ip)
+            self._finish(task, FAILED, str(e))
+            return
+        future.add_done_callback(lambda f: self._on_done(task, f))
+
+    def _on_done(self, task: Dict[str, Any], future: Future) -> None:
+        error = None if future.cancelled() else future.exception()
+        self._finish(task, FAILED if error else COMPLETED, str(error) if error else None)
+
+    def _finish(self, task: Dict[str, Any], status: str, error: Optional[str] = None) -> None:
+        try:
+            self.store.mark_finished(task['task_id'], status, error)
+        except Exception as e:
+            self.logger.error(f"更新任务 {task['task_id']} 状态失败: {str(e)}")
+        with self._running_lock:
+            self._running_per_flow[task['flow_path']] -= 1
+        self.logger.info(f"任务 {task['task_id']} 结束: {status}")
+        # 设备已释放，唤醒调度线程分配下一个任务
+        self.notify()
@@ -0,0 +1,123 @@
+from typing import Any, Callable, Tuple, Union
+import re
+from functools import lru_cache
+
+# 占位符: ${name} 或 ${a.b.c}
+PLACEHOLDER_PATTERN = re.compile(r'\$\{([^${}]+)\}')
+
+# 查找不到变量时的返回值
+MISSING = object()
+# resolve时表示找不到的占位符原样保留
+KEEP = object()
+
+Lookup = Callable[[Tuple[str, ...]], Any]
+
+class Template:
+    """编译后的模板
+
+    parts由字面量字符串和占位符路径(元组)组成，解析时按顺序拼接，
+    耗时只与模板长度有关，与作用域中变量的多少无关。
+    """
+    __slots__ = ('source', 'parts', 'single')
+
+    def __init__(self, source: str, parts: Tuple[Union[str, Tuple[str, ...]], ...]):
+        self.source = source
+        self.parts = parts
+        # 整个字符串就是一个占位符，此时可以返回变量的原始值
+        self.single = len(parts) == 1 and isinstance(parts[0], tuple)
+
+    @property
+    def has_placeholders(self) -> bool:
+        return any(isinstance(part, tuple) for part in self.parts)
+
+    def render(self, lookup: Lookup) -> str:
+        """解析为字符串，找不到的占位符原样保留"""
+        if not self.has_placeholders:
+            return self.source
+        chunks = []
+        for part in self.parts:
+            if isinstance(part, tuple):
+                value = lookup(part)
+                chunks.append('${' + '.'.join(part) + '}' if value is MISSING else str(value))
+            else:
+                chunks.append(part)
+        return ''.join(chunks)
+
+    def resolve(self, lookup: Lookup, missing: Any = None) -> Any:
+        """解析模板
+
+        Args:
+            lookup: 按占位符路径查找变量值的函数，找不到时返回MISSING
+            missing: 整个字符串为单个占位符且找不到时的返回值，KEEP表示返回原字符串
+
+        Returns:
+            整个字符串为单个占位符时返回变量的原始值，否则返回拼接后的字符串
+        """
+        if self.single:
+            value = lookup(self.parts[0])
+            if value is MISSING:
+                return self.source if missing is KEEP else missing
+            return value
+        return self.render(lookup)
+
+@lru_cache(maxsize=4096)
+def compile_template(source: str) -> Template:
+    """把字符串编译为模板，相同字符串只编译一次"""
+    parts = []
+    position = 0
+    for match in PLACEHOLDER_PATTERN.finditer(source):
+        if match.start() > position:
+            parts.append(source[position:match.start()])
+        parts.append(tuple(segment.strip() for segment in match.group(1).split('.')))
+        position = match.end()
+    if position < len(source):
+        parts.append(source[position:])
+    return Template(source, tuple(parts))
+
+def lookup_path(root: Any, path: Tuple[str, ...]) -> Any:
+    """沿路径逐层取值，支持字典键和列表下标，找不到时返回MISSING"""
+    value = root
+    for segment in path:
+        if isinstance(value, dict):
+            if segment not in value:
+                return MISSING
+            value = value[segment]
+        elif isinstance(value, (list, tuple)) and segment.lstrip('-').isdigit():
+            index = int(segment)
+            if not -len(value) <= index < len(value):
+                return MISSING
+            value = value[index]
+        else:
+            return MISSING
+    return value
+
+def has_template(value: Any) -> bool:
+    """字符串、字典或列表中是否含有${...}引用"""
+    if isinstance(value, str):
+        return '${' in value
+    if isinstance(value, dict):
+        return any(has_template(item) for item in value.values())
+    if isinstance(value, list):
+        return any(has_template(item) for item in value)
+    return False
+
+def resolve_value(value: Any, lookup: Lookup, missing: Any = None) -> Any:
+    """递归解析字符串、字典和列表中的${...}引用
+
+    Args:
+        value: 要解析的值
+        lookup: 按占位符路径查找变量值的函数
+        missing: 单个占位符找不到时的返回值，见Template.resolve
+
+    Returns:
+        解析后的值，不含占位符的部分原样返回(不复制)
+    """
+    if isinstance(value, str):
+        if '${' not in value:
+            return value
+        return compile_template(value).resolve(lookup, missing)
+    if isinstance(value, dict):
+        return {key: resolve_value(item, lookup, missing) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_value(item, lookup, missing) for item in value]
+    return value
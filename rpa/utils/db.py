@@ -1,39 +1,240 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, Iterator, List, Optional
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
 import mysql.connector
 from mysql.connector import Error
 from rpa.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+class MySQLPool:
+    """线程安全的MySQL连接池
+
+    连接按需创建，最多size个；连接空闲超过ping_interval秒后，下次取出时先ping，
+    断开则自动重连。取不到连接时等待，超过timeout秒抛出异常。
+    不使用prepared游标：它不支持字典游标，executemany也无法合并为多行INSERT；
+    连接长期复用，服务端的查询解析开销远小于建连开销。
+    """
+
+    def __init__(self, config: Dict[str, Any], size: int = 8, timeout: float = 30, ping_interval: float = 60):
+        """
+        Args:
+            config: mysql.connector.connect的参数
+            size: 最大连接数
+            timeout: 等待空闲连接的最长时间(秒)
+            ping_interval: 空闲多久后取出时检查连接(秒)
+        """
+        self.config = dict(config)
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        # (连接, 归还时间)，后进先出，优先使用最近用过的连接
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._closed = False
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """取出一个连接，退出时归还；出现异常时先回滚，调用方负责commit"""
+        if self._closed:
+            raise RuntimeError("连接池已关闭")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"等待数据库连接超时({self.timeout}秒)")
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        except Exception:
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            raise
+        finally:
+            if conn is not None:
+                self._checkin(conn)
+            self._slots.release()
+
+    def _checkout(self):
+        while True:
+            try:
+                conn, returned_at = self._idle.get_nowait()
+            except queue.Empty:
+                return mysql.connector.connect(**self.config)
+            if time.monotonic() - returned_at < self.ping_interval:
+                return conn
+            try:
+                conn.ping(reconnect=True, attempts=2, delay=1)
+                return conn
+            except Error as e:
+                logger.warning(f"数据库连接已失效，重新创建: {str(e)}")
+                self._discard(conn)
+
+    def _checkin(self, conn) -> None:
+        try:
+            healthy = not self._closed and conn.is_connected()
+        except Exception:
+            healthy = False
+        if healthy:
+            self._idle.put((conn, time.monotonic()))
+        else:
+            self._discard(conn)
+
+    @staticmethod
+    def _discard(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """关闭所有空闲连接，使用中的连接归还时关闭"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+class SQLitePool:
+    """按线程复用的SQLite连接
+
+    每个线程一个长期连接，开启WAL模式，读写互不阻塞；写冲突时等待busy_timeout。
+    连接自带语句缓存，同一SQL在同一连接上只编译一次。
+    """
+
+    def __init__(self, database: str, on_connect: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 busy_timeout: float = 30, cached_statements: int = 256):
+        """
+        Args:
+            database: 数据库文件路径
+            on_connect: 新建连接后的初始化函数，如注册自定义函数
+            busy_timeout: 写锁等待时间(秒)
+            cached_statements: 每个连接缓存的预编译语句数
+        """
+        self.database = database
+        self.on_connect = on_connect
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        Path(database).parent.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """取出当前线程的连接；出现异常时先回滚，调用方负责commit"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        # 启用外键约束
+        conn.execute("PRAGMA foreign_keys = ON")
+        if self.on_connect:
+            self.on_connect(conn)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """关闭所有线程的连接"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+# 进程内共享的连接池，按数据库区分
+_pools: Dict[Any, Any] = {}
+_pools_lock = threading.Lock()
+
+def get_mysql_pool(config: Dict[str, Any], size: int = 8, timeout: float = 30, ping_interval: float = 60) -> MySQLPool:
+    """获取MySQL连接池，相同连接参数共用一个池，池参数只在第一次创建时生效"""
+    key = ('mysql', tuple(sorted((k, str(v)) for k, v in config.items())))
+    with _pools_lock:
+        if key not in _pools or _pools[key]._closed:
+            _pools[key] = MySQLPool(config, size, timeout, ping_interval)
+        return _pools[key]
+
+def get_sqlite_pool(database: str, on_connect: Optional[Callable[[sqlite3.Connection], None]] = None) -> SQLitePool:
+    """获取SQLite连接池，同一数据库文件共用一个池，on_connect只在第一次创建时生效"""
+    key = ('sqlite', str(Path(database).resolve()))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SQLitePool(database, on_connect)
+        return _pools[key]
+
+def close_pools() -> None:
+    """关闭所有连接池"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
 class DatabaseManager:
     _instance = None
+    _lock = threading.Lock()  # 单例锁
     
     @classmethod
     def get_instance(cls):
         if cls._instance is None:
-            cls._instance = DatabaseManager()
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = DatabaseManager()
         return cls._instance
     
     def __init__(self):
-        self.connection = None
+        self.pool: Optional[MySQLPool] = None
         self.connected = False
     
     def connect(self, config: Dict[str, Any]):
-        """连接数据库
+        """创建数据库连接池并检查连接
         
         Args:
-            config: 数据库配置，包含 host, user, password, database 等
+            config: 数据库配置，包含 host, user, password, database 等，
+                pool_size/pool_timeout 为连接池参数
         """
         if self.connected:
             return
         try:
-            self.connection = mysql.connector.connect(
-                host=config.get('host', 'localhost'),
-                user=config.get('user', 'root'),
-                password=config.get('password', ''),
-                database=config.get('database'),
-                port=config.get('port', 3306)
+            self.pool = get_mysql_pool(
+                {
+                    'host': config.get('host', 'localhost'),
+                    'user': config.get('user', 'root'),
+                    'password': config.get('password', ''),
+                    'database': config.get('database'),
+                    'port': config.get('port', 3306)
+                },
+                size=config.get('pool_size', 8),
+                timeout=config.get('pool_timeout', 30)
             )
+            with self.pool.connection():
+                pass
             logger.info("数据库连接成功")
             self.connected = True
         except Error as e:
@@ -41,16 +242,15 @@ class DatabaseManager:
             raise
             
     def disconnect(self):
-        """断开数据库连接"""
+        """关闭数据库连接池"""
         if not self.connected:
             return
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            logger.info("数据库连接已关闭")
-            self.connected = False
+        self.pool.close()
+        logger.info("数据库连接已关闭")
+        self.connected = False
             
     def execute(self, query: str, params: tuple = None) -> Any:
-        """执行SQL查询
+        """执行SQL查询，可在多个线程中同时调用
         
         Args:
             query: SQL查询语句
@@ -60,17 +260,19 @@ class DatabaseManager:
             查询结果
         """
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(query, params or ())
-            
-            if query.lower().startswith('select'):
-                result = cursor.fetchall()
-            else:
-                self.connection.commit()
-                result = cursor.rowcount
-                
-            cursor.close()
-            return result
+            with self.pool.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    cursor.execute(query, params or ())
+                    
+                    if query.lstrip().lower().startswith('select'):
+                        result = cursor.fetchall()
+                    else:
+                        conn.commit()
+                        result = cursor.rowcount
+                finally:
+                    cursor.close()
+                return result
             
         except Error as e:
             logger.error(f"执行SQL失败: {str(e)}")
@@ -119,6 +321,7 @@ class DatabaseManager:
                 def cleanup_db():
                     try:
                         db.disconnect()
+                        close_pools()
                         logger.info("数据库连接已关闭")
                     except Exception as e:
                         logger.error(f"关闭数据库连接失败: {str(e)}")
@@ -0,0 +1,120 @@
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Callable, Dict, Iterable, Optional
+from rpa.utils.logger import get_logger
+
+class HealthResult:
+    """一次健康检查的结果"""
+    __slots__ = ('healthy', 'checked_at', 'latency', 'failures')
+
+    def __init__(self, healthy: bool, checked_at: float, latency: float, failures: int = 0):
+        self.healthy = healthy
+        self.checked_at = checked_at  # 检查完成的时间戳(time.time)
+        self.latency = latency  # 探测耗时(秒)，超时时为probe_timeout
+        self.failures = failures  # 连续失败次数
+
+class DeviceHealthChecker:
+    """并发的设备健康检查
+
+    每次探测在独立的守护线程中执行，同时最多max_workers个，超过的设备留到
+    下一轮；探测有超时，一台设备卡住不影响其他设备，也不会阻止进程退出。
+    探测未返回的设备不会被重复提交，卡住的探测最多占用一个名额。
+    最近一次结果按设备缓存，读取不触发探测。
+    在线设备每healthy_interval秒检查一次，离线设备每unhealthy_interval秒
+    检查一次，以便尽快发现设备恢复。
+    """
+
+    def __init__(self, probe: Callable[[str], bool], max_workers: int = 8, probe_timeout: float = 5.0,
+                 healthy_interval: float = 30.0, unhealthy_interval: float = 5.0):
+        """
+        Args:
+            probe: 探测函数，参数为设备IP，返回设备是否在线
+            max_workers: 同时探测的最大设备数
+            probe_timeout: 单次探测的超时时间(秒)，超时视为离线
+            healthy_interval: 在线设备的检查间隔(秒)
+            unhealthy_interval: 离线设备的检查间隔(秒)
+        """
+        self.logger = get_logger(__name__)
+        self.probe = probe
+        self.probe_timeout = probe_timeout
+        self.healthy_interval = healthy_interval
+        self.unhealthy_interval = unhealthy_interval
+        self._slots = threading.BoundedSemaphore(max(1, max_workers))
+        self._results: Dict[str, HealthResult] = {}
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    def get(self, device_ip: str) -> Optional[HealthResult]:
+        """最近一次检查结果，从未检查过时返回None"""
+        return self._results.get(device_ip)
+
+    def record(self, device_ip: str, healthy: bool, latency: float = 0.0) -> HealthResult:
+        """记录一次检查结果(包括分配、释放设备时的同步检查)"""
+        previous = self._results.get(device_ip)
+        failures = 0 if healthy else (previous.failures + 1 if previous else 1)
+        result = HealthResult(healthy, time.time(), latency, failures)
+        self._results[device_ip] = result
+        return result
+
+    def forget(self, device_ip: str) -> None:
+        self._results.pop(device_ip, None)
+
+    def is_due(self, device_ip: str) -> bool:
+        """按上次结果判断是否到了下次检查时间"""
+        result = self._results.get(device_ip)
+        if result is None:
+            return True
+        interval = self.healthy_interval if result.healthy else self.unhealthy_interval
+        return time.time() - result.checked_at >= interval
+
+    def check(self, device_ip: str) -> bool:
+        """同步探测一台设备并记录结果"""
+        started = time.monotonic()
+        try:
+            healthy = bool(self.probe(device_ip))
+        except Exception:
+            healthy = False
+        self.record(device_ip, healthy, time.monotonic() - started)
+        return healthy
+
+    def check_many(self, device_ips: Iterable[str]) -> Dict[str, bool]:
+        """并发探测多台设备，最多等待probe_timeout秒
+
+        Returns:
+            Dict[str, bool]: 本次完成(含超时)的设备 -> 是否在线；仍在探测中
+                和超过并发上限未提交的设备不包含在内
+        """
+        futures = {}
+        with self._lock:
+            for device_ip in device_ips:
+                if device_ip in self._inflight:
+                    continue
+                if not self._slots.acquire(blocking=False):
+                    break
+                self._inflight.add(device_ip)
+                future = Future()
+                futures[future] = device_ip
+                threading.Thread(
+                    target=self._probe, args=(device_ip, future),
+                    name=f'device-health-{device_ip}', daemon=True
+                ).start()
+        if not futures:
+            return {}
+
+        done, pending = wait(futures, timeout=self.probe_timeout)
+        results = {futures[future]: future.result() for future in done}
+        for future in pending:
+            device_ip = futures[future]
+            self.logger.warning(f"设备 {device_ip} 健康检查超时({self.probe_timeout}秒)")
+            self.record(device_ip, False, self.probe_timeout)
+            results[device_ip] = False
+        return results
+
+    def _probe(self, device_ip: str, future: Future) -> None:
+        try:
+            future.set_result(self.check(device_ip))
+        finally:
+            with self._lock:
+                self._inflight.discard(device_ip)
+            self._slots.release()
@@ -4,7 +4,6 @@ import json
 from pathlib import Path
 import os
 from rpa.utils.logger import get_logger
-import uiautomator2 as u2
 import time
 import glob  # 新增导入
 import yaml  # 新增导入
@@ -12,14 +11,10 @@ from queue import Queue
 from collections import defaultdict
 from threading import Event
 from concurrent.futures import ThreadPoolExecutor
-from multiprocessing import Manager
-
-# 定义设备状态
-class DeviceStatus:
-    UNAVAILABLE = 0  # 不可用
-    AVAILABLE = 1    # 可用
-    BUSY = 2         # 非空闲
-    ALLOCATING = 3  # 新增：正在分配中
+from lib.frame_stream import FrameStream
+from rpa.utils.device_registry import DeviceRegistry, DeviceStatus
+from rpa.utils.device_health import DeviceHealthChecker
+from lib.device_session import DeviceSessionCache
 
 class DeviceManager:
     _instance = None
@@ -39,10 +34,14 @@ class DeviceManager:
             
         self.logger = get_logger(__name__)
         
-        # 使用Manager创建线程安全的字典
-        manager = Manager()
-        self._devices = manager.dict()  # 线程安全的设备状态字典
-        self._error_task_devices = manager.dict()  # 线程安全的异常设备字典
+        # 进程内的设备状态表，分段锁保护，状态切换用compare_and_set保证原子性
+        self._devices = DeviceRegistry()
+        self._error_task_devices: Dict[str, float] = {}  # 异常设备 -> 加入时间
+        
+        # 并发健康检查，结果按设备缓存
+        health_settings = self._load_settings().get('device_health', {})
+        self._health_tick = health_settings.pop('tick', 1.0)
+        self.health = DeviceHealthChecker(self._probe_device, **health_settings)
         
         self._initialized = True
         
@@ -56,8 +55,17 @@ class DeviceManager:
         self._error_task_cleanup_thread = threading.Thread(target=self._cleanup_error_tasks, daemon=True)
         self._error_task_cleanup_thread.start()
         
+    def _load_settings(self) -> Dict:
+        """读取config.yaml"""
+        try:
+            with open('config.yaml', 'r', encoding='utf-8') as f:
+                return yaml.safe_load(f) or {}
+        except Exception as e:
+            self.logger.warning(f"读取配置文件失败，使用默认设置: {str(e)}")
+            return {}
+
     def _check_device_connection(self, device_ip: str) -> bool:
-        """检查设备连接状态
+        """检查设备连接状态并记录到健康检查结果
         
         Args:
             device_ip: 设备IP
@@ -65,30 +73,39 @@ class DeviceManager:
         Returns:
             bool: 设备是否在线
         """
-        try:
-            d = u2.connect(device_ip)
-            # 尝试获取设备信息来验证连接
-            d.info
-            return True
-        except Exception as e:
-            # self.logger.warning(f"设备 {device_ip} 连接检查失败: {str(e)}")
-            return False
+        return self.health.check(device_ip)
+
+    def _probe_device(self, device_ip: str) -> bool:
+        """探测设备是否在线"""
+        # 画面流最近仍在出帧，说明连接正常，无需再发起探测请求
+        stream = FrameStream.get(device_ip)
+        if stream:
+            last_frame_time = stream.last_frame_time()
+            if last_frame_time and time.time() - last_frame_time < 5:
+                return True
+        # 复用共享连接获取设备信息来验证连接，连接失效时重新连接
+        return DeviceSessionCache.get_instance().check(device_ip)
             
     def _check_devices_health(self):
-        """设备健康检查循环"""
+        """设备健康检查循环
+        
+        每个周期并发探测到期的设备(在线设备间隔长、离线设备间隔短)，
+        只检查空闲和不可用的设备，跳过分配中和使用中的设备。
+        """
         while True:
-            time.sleep(10)  # 每10秒检查一次，减少频率
-            current_time = time.time()
-            for device_ip, (status, last_heartbeat) in list(self._devices.items()):
-                # 跳过正在分配中的设备
-                if status == DeviceStatus.ALLOCATING:
-                    continue
-                # 只检查空闲和不可用的设备
-                if status == DeviceStatus.AVAILABLE or status == DeviceStatus.UNAVAILABLE:
-                    if not self._check_device_connection(device_ip):
-                        self._devices[device_ip] = (DeviceStatus.UNAVAILABLE, current_time)
-                    else:
-                        self._devices[device_ip] = (DeviceStatus.AVAILABLE, current_time)
+            time.sleep(self._health_tick)
+            try:
+                statuses = {
+                    device_ip: status
+                    for device_ip, (status, last_heartbeat) in self._devices.items()
+                    if status in (DeviceStatus.AVAILABLE, DeviceStatus.UNAVAILABLE) and self.health.is_due(device_ip)
+                }
+                for device_ip, healthy in self.health.check_many(statuses).items():
+                    new_status = DeviceStatus.AVAILABLE if healthy else DeviceStatus.UNAVAILABLE
+                    # 检查期间设备可能已被分配，只在状态未变时更新
+                    self._devices.compare_and_set(device_ip, statuses[device_ip], new_status)
+            except Exception as e:
+                self.logger.error(f"设备健康检查失败: {str(e)}")
     
     def _cleanup_devices(self):
         """定期调整 YAML 文件和device中的设备"""
@@ -113,86 +130,114 @@ class DeviceManager:
             # 移除不在有效设备列表中的设备
             for device_ip in current_devices:
                 if device_ip not in valid_devices:
-                    del self._devices[device_ip]
+                    self._devices.remove(device_ip)
+                    self.health.forget(device_ip)
                     self.logger.info(f"设备 {device_ip} 已从设备池中移除，因不在有效的 YAML 文件中")
 
             # 添加 YAML 文件中存在但不在设备管理器中的设备
             for device_ip in valid_devices:
-                if device_ip not in current_devices:
-                    self._devices[device_ip] = (DeviceStatus.UNAVAILABLE, time.time())  # 状态为不可用
+                if self._devices.add(device_ip, DeviceStatus.UNAVAILABLE):  # 状态为不可用
                     self.logger.info(f"设备 {device_ip} 已添加到设备池，状态为不可用")
     
     def register_devices(self, device_ips: str):
         """注册设备到设备池"""
         devices = [ip.strip() for ip in device_ips.split(',') if ip.strip()]
-        current_time = time.time()
         for device in devices:
-            if device not in self._devices:
-                self._devices[device] = (DeviceStatus.UNAVAILABLE, current_time)
+            if self._devices.add(device, DeviceStatus.UNAVAILABLE):
                 self.logger.info(f"设备 {device} 已添加到设备池")
     
-    def get_available_device(self, device_ips: str):
+    def get_available_device(self, device_ips: str, timeout: float = 0):
         """获取指定设备列表中的一个空闲设备
         
         Args:
-            device_ids: 设备ID列表
+            device_ips: 逗号分隔的设备IP列表
+            timeout: 没有可用设备时等待设备释放的最长时间(秒)，默认不等待
             
         Returns:
             Optional[str]: 可用设备的IP地址，如果没有可用设备则返回None
         """
         device_ids = [ip.strip() for ip in device_ips.split(',') if ip.strip()]
-        current_time = time.time()
-        
+        deadline = time.monotonic() + timeout
+        while True:
+            device_ip = self._allocate(device_ids)
+            remaining = deadline - time.monotonic()
+            if device_ip or remaining <= 0:
+                return device_ip
+            # 等待有设备被释放或恢复可用
+            self._devices.wait_for_status(device_ids, DeviceStatus.AVAILABLE, remaining)
+
+    def _allocate(self, device_ids: List[str]) -> Optional[str]:
+        """尝试分配一个设备，状态切换均为原子操作，同一设备不会被重复分配"""
         for device_ip in device_ids:
-            if device_ip in self._devices:
-                status, last_heartbeat = self._devices[device_ip]
-                if status == DeviceStatus.AVAILABLE:
-                    # 先标记为分配中
-                    self._devices[device_ip] = (DeviceStatus.ALLOCATING, current_time)
-                    # 再次检查连接状态
-                    if self._check_device_connection(device_ip):
-                        self._devices[device_ip] = (DeviceStatus.BUSY, current_time)
-                        self.logger.info(f"设备 {device_ip} 已分配")
-                        return device_ip
-                    else:
-                        # 如果连接失败，恢复为不可用状态
-                        self._devices[device_ip] = (DeviceStatus.UNAVAILABLE, current_time)
+            # 先标记为分配中
+            if self._devices.compare_and_set(device_ip, DeviceStatus.AVAILABLE, DeviceStatus.ALLOCATING):
+                # 再次检查连接状态
+                if self._check_device_connection(device_ip):
+                    self._devices.set(device_ip, DeviceStatus.BUSY)
+                    self.logger.info(f"设备 {device_ip} 已分配")
+                    return device_ip
+                # 如果连接失败，恢复为不可用状态
+                self._devices.set(device_ip, DeviceStatus.UNAVAILABLE)
 
         # 如果没有可用设备，尝试连接设备
         for device_ip in device_ids:
-            if device_ip not in self._devices:
-                self._devices[device_ip] = (DeviceStatus.UNAVAILABLE, current_time)
-            
-            status = self._devices[device_ip][0]
-            if status != DeviceStatus.BUSY and status != DeviceStatus.ALLOCATING:
-                # 先标记为分配中
-                self._devices[device_ip] = (DeviceStatus.ALLOCATING, current_time)
+            self._devices.add(device_ip, DeviceStatus.UNAVAILABLE)
+            if self._devices.compare_and_set(device_ip, (DeviceStatus.AVAILABLE, DeviceStatus.UNAVAILABLE), DeviceStatus.ALLOCATING):
                 if self._check_device_connection(device_ip):
-                    self._devices[device_ip] = (DeviceStatus.BUSY, current_time)
+                    self._devices.set(device_ip, DeviceStatus.BUSY)
                     self.logger.info(f"设备 {device_ip} 连接成功，状态已更新为可用")
                     return device_ip
-                else:
-                    self._devices[device_ip] = (DeviceStatus.UNAVAILABLE, current_time)
+                self._devices.set(device_ip, DeviceStatus.UNAVAILABLE)
         return None
     
+    def acquire_device(self, device_ip: str) -> bool:
+        """占用指定设备(恢复任务时使用原来的设备)
+        
+        设备空闲时原子地标记为非空闲；设备仍因任务异常被保留(见add_error_task_device)时
+        直接交给恢复的任务，不等待异常清理。
+        
+        Returns:
+            bool: 是否占用成功，设备正被其他任务使用或不可用时返回False
+        """
+        if self._error_task_devices.pop(device_ip, None) is not None:
+            status = (self._devices.get(device_ip) or (None,))[0]
+            if status == DeviceStatus.BUSY:
+                self.logger.info(f"设备 {device_ip} 由恢复的任务继续使用")
+                return True
+        if self._devices.compare_and_set(device_ip, DeviceStatus.AVAILABLE, DeviceStatus.BUSY):
+            self.logger.info(f"设备 {device_ip} 已分配")
+            return True
+        return False
+    
+    def available_devices(self, device_ips: List[str]) -> List[str]:
+        """返回列表中当前空闲的设备，只读取状态，不探测"""
+        return [
+            device_ip for device_ip in device_ips
+            if (self._devices.get(device_ip) or (None,))[0] == DeviceStatus.AVAILABLE
+        ]
+    
     def release_device(self, device_ip: str):
-        """释放设备"""
+        """释放设备，连接正常时恢复为可用，否则标记为不可用等待健康检查恢复"""
         if device_ip in self._devices:
             if self._check_device_connection(device_ip):
-                self._devices[device_ip] = (DeviceStatus.AVAILABLE, time.time())
+                self._devices.set(device_ip, DeviceStatus.AVAILABLE)
+            else:
+                self._devices.set(device_ip, DeviceStatus.UNAVAILABLE)
             self.logger.info(f"设备 {device_ip} 已释放")
     
     def get_all_devices(self) -> Dict[str, Dict[str, any]]:
-        """获取所有设备状态"""
+        """获取所有设备状态，连接状态取最近一次健康检查结果，不发起探测"""
         current_time = time.time()
-        return {
-            ip: {
+        devices = {}
+        for ip, (status, last_heartbeat) in self._devices.items():
+            health = self.health.get(ip)
+            devices[ip] = {
                 "status": "unavailable" if status == DeviceStatus.UNAVAILABLE else "available" if status == DeviceStatus.AVAILABLE else "busy",
-                "connected": self._check_device_connection(ip),
-                "last_heartbeat": int(current_time - last_heartbeat)
+                "connected": health.healthy if health else None,
+                "last_heartbeat": int(current_time - last_heartbeat),
+                "last_check": int(current_time - health.checked_at) if health else None
             }
-            for ip, (status, last_heartbeat) in self._devices.items()
-        }            
+        return devices            
             
     def add_error_task_device(self, device_ip: str):
         """添加异常任务的设备"""
@@ -208,9 +253,9 @@ class DeviceManager:
             for device_ip in list(self._error_task_devices.keys()):
                 last_error_time = self._error_task_devices.get(device_ip, 0)
                 if current_time - last_error_time > 600:  # 10分钟 = 600秒
-                    if device_ip in self._error_task_devices:
-                        del self._error_task_devices[device_ip]
-                    with self._devices:
-                        self.release_device(device_ip)
+                    # 设备可能已被恢复的任务取走(acquire_device)，此时不能再释放
+                    if self._error_task_devices.pop(device_ip, None) is None:
+                        continue
+                    self.release_device(device_ip)
                     self.logger.info(f"设备 {device_ip} 因异常状态超过10分钟未处理而被释放")
             
\ No newline at end of file
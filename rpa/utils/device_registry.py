@@ -0,0 +1,112 @@
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# 定义设备状态
+class DeviceStatus:
+    UNAVAILABLE = 0  # 不可用
+    AVAILABLE = 1    # 可用
+    BUSY = 2         # 非空闲
+    ALLOCATING = 3  # 新增：正在分配中
+
+DeviceState = Tuple[int, float]  # (状态, 最后心跳时间)
+
+class DeviceRegistry:
+    """进程内的设备状态表
+
+    设备按IP哈希到固定数量的分段锁上，不同设备的读写互不阻塞；
+    compare_and_set在分段锁内完成"检查并修改"，同一设备不会被重复分配。
+    设备变为可用时通知在wait_for_status上等待的线程。
+    """
+
+    def __init__(self, stripes: int = 16):
+        """
+        Args:
+            stripes: 分段锁数量
+        """
+        self._states: Dict[str, DeviceState] = {}
+        self._stripes = [threading.Lock() for _ in range(max(1, stripes))]
+        self._changed = threading.Condition()
+
+    def _lock_for(self, device_ip: str) -> threading.Lock:
+        return self._stripes[hash(device_ip) % len(self._stripes)]
+
+    def __contains__(self, device_ip: str) -> bool:
+        return device_ip in self._states
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def get(self, device_ip: str) -> Optional[DeviceState]:
+        """设备的(状态, 最后心跳时间)，未注册时返回None"""
+        return self._states.get(device_ip)
+
+    def items(self) -> List[Tuple[str, DeviceState]]:
+        """所有设备状态的快照"""
+        return list(self._states.items())
+
+    def keys(self) -> List[str]:
+        return list(self._states)
+
+    def add(self, device_ip: str, status: int = DeviceStatus.UNAVAILABLE) -> bool:
+        """设备未注册时添加，返回是否新增"""
+        with self._lock_for(device_ip):
+            if device_ip in self._states:
+                return False
+            self._states[device_ip] = (status, time.time())
+        self._notify(status)
+        return True
+
+    def set(self, device_ip: str, status: int) -> None:
+        """设置设备状态并刷新心跳时间"""
+        with self._lock_for(device_ip):
+            self._states[device_ip] = (status, time.time())
+        self._notify(status)
+
+    def remove(self, device_ip: str) -> None:
+        with self._lock_for(device_ip):
+            self._states.pop(device_ip, None)
+
+    def compare_and_set(self, device_ip: str, expected: Union[int, Iterable[int]], status: int) -> bool:
+        """设备当前状态为expected(之一)时改为status
+
+        Args:
+            device_ip: 设备IP
+            expected: 期望的当前状态，可以是多个
+            status: 新状态
+
+        Returns:
+            bool: 是否修改成功，设备未注册时返回False
+        """
+        expected = (expected,) if isinstance(expected, int) else tuple(expected)
+        with self._lock_for(device_ip):
+            state = self._states.get(device_ip)
+            if state is None or state[0] not in expected:
+                return False
+            self._states[device_ip] = (status, time.time())
+        self._notify(status)
+        return True
+
+    def _notify(self, status: int) -> None:
+        if status == DeviceStatus.AVAILABLE:
+            with self._changed:
+                self._changed.notify_all()
+
+    def wait_for_status(self, device_ips: Iterable[str], status: int = DeviceStatus.AVAILABLE,
+                        timeout: Optional[float] = None) -> bool:
+        """等待任一设备进入指定状态(目前只通知AVAILABLE)
+
+        Returns:
+            bool: 超时前有设备处于该状态返回True
+        """
+        device_ips = list(device_ips)
+
+        def ready() -> bool:
+            for device_ip in device_ips:
+                state = self._states.get(device_ip)
+                if state is not None and state[0] == status:
+                    return True
+            return False
+
+        with self._changed:
+            return self._changed.wait_for(ready, timeout)
@@ -0,0 +1,175 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import atexit
+import json
+import queue
+import threading
+import time
+from rpa.utils.logger import get_logger
+
+# 队列控制消息
+_FLUSH = object()
+_STOP = object()
+
+Writer = Callable[[List[Any]], None]
+
+class ExportQueue:
+    """进程级共享的后台导出队列(write-behind)
+
+    导出动作只把记录放入队列就返回，后台线程按目标(文件、数据库)合并记录，
+    攒够batch_size条或距上次写入超过flush_interval秒时批量写入。
+    flush会等待调用前提交的记录全部写完；进程退出时自动flush。
+    """
+    _instance = None
+    _lock = threading.Lock()  # 单例锁
+
+    @classmethod
+    def get_instance(cls, settings: Optional[Dict[str, Any]] = None) -> 'ExportQueue':
+        """获取导出队列单例
+
+        Args:
+            settings: 导出配置(配置文件中的export段)，只在第一次创建时生效
+
+        Returns:
+            ExportQueue: 共享的导出队列
+        """
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    settings = settings or {}
+                    cls._instance = cls(
+                        batch_size=settings.get('batch_size', 100),
+                        flush_interval=settings.get('flush_interval', 1.0),
+                        max_queue_size=settings.get('max_queue_size', 10000),
+                        max_retries=settings.get('max_retries', 3)
+                    )
+                    atexit.register(cls._instance.close)
+        return cls._instance
+
+    @classmethod
+    def current(cls) -> Optional['ExportQueue']:
+        """已创建的导出队列，没有时返回None"""
+        return cls._instance
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 1.0,
+                 max_queue_size: int = 10000, max_retries: int = 3):
+        """
+        Args:
+            batch_size: 累计多少条记录后立即写入
+            flush_interval: 最长攒批时间(秒)
+            max_queue_size: 队列最多容纳的提交次数，满时submit阻塞(背压)
+            max_retries: 写入失败时的重试次数
+        """
+        self.logger = get_logger(__name__)
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self.max_retries = max(0, int(max_retries))
+        self._queue: "queue.Queue[Tuple[Any, ...]]" = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+        self._worker = threading.Thread(target=self._worker_loop, name='export-writer', daemon=True)
+        self._worker.start()
+
+    def submit(self, key: str, writer: Writer, records: List[Any]) -> None:
+        """提交待写入的记录
+
+        Args:
+            key: 写入目标标识(如文件路径)，相同key且写入函数相等的连续提交合并后一次写入
+            writer: 写入函数，参数为该目标的记录列表，失败时抛出异常；写入时才调用，
+                不应绑定可能在此之前被关闭的资源(文件导出使用record_log.RecordAppender)
+            records: 记录列表，调用方之后不应再修改
+        """
+        if self._closed:
+            raise RuntimeError("导出队列已关闭")
+        if not records:
+            return
+        try:
+            self._queue.put_nowait((key, writer, records))
+        except queue.Full:
+            self.logger.warning("导出队列已满，等待后台写入")
+            self._queue.put((key, writer, records))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待调用前提交的记录全部写完
+
+        Args:
+            timeout: 最长等待秒数，None表示一直等待
+
+        Returns:
+            bool: 是否在超时前写完
+        """
+        if not self._worker.is_alive():
+            return self._queue.empty()
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 30) -> bool:
+        """写完所有记录并停止后台线程"""
+        if self._closed:
+            return True
+        self._closed = True
+        flushed = self.flush(timeout)
+        if self._worker.is_alive():
+            self._queue.put((_STOP,))
+            self._worker.join(timeout)
+        if not flushed:
+            self.logger.error("关闭导出队列时仍有记录未写完")
+        return flushed
+
+    def _worker_loop(self) -> None:
+        # key -> [(writer, 记录列表), ...]，同一目标按提交顺序写入
+        pending: Dict[str, List[Tuple[Writer, List[Any]]]] = {}
+        pending_count = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and item[0] is _STOP:
+                self._write_pending(pending)
+                return
+
+            if item is not None and item[0] is _FLUSH:
+                self._write_pending(pending)
+                pending_count, deadline = 0, None
+                item[1].set()
+                continue
+
+            if item is not None:
+                key, writer, records = item
+                runs = pending.setdefault(key, [])
+                # 写入函数相同(如同一文件、相同格式和列)时合并，否则各自按原写入函数写入
+                if runs and runs[-1][0] == writer:
+                    runs[-1][1].extend(records)
+                else:
+                    runs.append((writer, list(records)))
+                pending_count += len(records)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if pending_count >= self.batch_size or (deadline is not None and time.monotonic() >= deadline):
+                self._write_pending(pending)
+                pending_count, deadline = 0, None
+
+    def _write_pending(self, pending: Dict[str, List[Tuple[Writer, List[Any]]]]) -> None:
+        """按目标批量写入并清空pending"""
+        for key, runs in pending.items():
+            for writer, records in runs:
+                self._write_batch(key, writer, records)
+        pending.clear()
+
+    def _write_batch(self, key: str, writer: Writer, records: List[Any]) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                writer(records)
+                self.logger.debug(f"已写入 {len(records)} 条记录到 {key}")
+                return
+            except Exception as e:
+                if attempt < self.max_retries:
+                    self.logger.warning(f"写入 {key} 失败，第 {attempt + 1} 次重试: {str(e)}")
+                    time.sleep(min(2 ** attempt, 10))
+                else:
+                    self.logger.error(f"写入 {key} 失败，丢弃 {len(records)} 条记录: {str(e)}")
+                    self.logger.error(f"丢弃的记录: {json.dumps(records, ensure_ascii=False, default=str)}")
@@ -1,37 +1,175 @@
-from typing import List, Tuple, Dict, Any
-from paddleocr import PaddleOCR
+from typing import List, Tuple, Dict, Any, Optional, Union
+import asyncio
+from concurrent.futures import Future
+import cv2
+import numpy as np
 from loguru import logger
 from lib.text_matcher import TextMatcher
+from lib.frame_diff import FrameChangeDetector
+from lib.ocr_cache import default_cache
+from rpa.utils.ocr_service import OCRService
 
 class OCRHelper:
-    def __init__(self, lang='ch'):
+    def __init__(self, lang='ch', settings: Optional[Dict[str, Any]] = None):
         """
-        初始化PaddleOCR
+        初始化OCR工具，模型由进程内共享的OCRService持有
 
         Args:
             lang: 识别语言,'ch'(中文),'en'(英文)等
+            settings: OCR服务配置(配置文件中的ocr段)，只在服务第一次创建时生效
         """
-        self.ocr = PaddleOCR(
-            use_angle_cls=True,
-            lang=lang,
-            show_log=False,  # 关闭PaddleOCR的调试日志
-            cls_batch_num=1,  # 减小批处理大小
-            rec_batch_num=1,
-            det_db_score_mode='fast',  # 使用快速模式
-            use_mp=True,  # 启用多进程
-            total_process_num=2  # 使用2个进程
-        )
+        settings = dict(settings or {})
+        settings.setdefault('lang', lang)
+        # 画面变化检测：画面未变化时直接复用上一次的识别结果
+        self.change_detection = settings.pop('change_detection', True)
+        self.frame_detector = FrameChangeDetector(threshold=settings.pop('change_threshold', 12.0))
+        self._last_results: Dict[Tuple, List[List[Any]]] = {}
+        # 按像素内容哈希缓存识别结果(进程内共享)，容量只在第一次配置时生效
+        self.cache = default_cache
+        if 'cache_size' in settings:
+            self.cache.configure(settings.pop('cache_size'))
+        self.service = OCRService.get_instance(settings)
+        # 缓存key使用共享服务实际的识别语言，服务可能由其他配置先创建
+        self.engine_params = {'engine': 'paddle', 'lang': self.service.lang}
+        if self.service.lang != settings['lang']:
+            logger.warning(f"OCR服务已使用语言 {self.service.lang} 创建，忽略配置的 {settings['lang']}")
         self.logger = logger
 
-    def extract_text(self, image_path: str, keywords: List[str] = None,
+    def submit(self, image: Union[str, np.ndarray]) -> Future:
+        """提交识别任务到共享OCR服务
+
+        Args:
+            image: 图片路径或帧
+
+        Returns:
+            Future: 结果为PaddleOCR原始识别结果
+        """
+        return self.service.submit(image)
+
+    def _lookup_cached(self, image: Union[str, np.ndarray],
+                       region: List[int] = None) -> Tuple[Optional[Tuple], Optional[str], Optional[List[List[Any]]]]:
+        """查找可复用的识别结果(画面未变化或像素内容命中缓存)
+
+        Returns:
+            (cache_key, content_key, lines)，lines为None表示需要重新识别
+        """
+        cache_key = None
+        if self.change_detection and isinstance(image, np.ndarray):
+            cache_key = (tuple(region) if region else None, image.shape)
+            # 指定region时只关心该区域是否变化
+            watched = image
+            if region:
+                x1, y1, x2, y2 = map(int, region)
+                watched = image[max(0, y1):max(0, y2), max(0, x1):max(0, x2)]
+            changed = watched.size == 0 or self.frame_detector.is_changed(cache_key, watched)
+            if not changed and cache_key in self._last_results:
+                self.logger.debug("画面未变化，复用上一次OCR结果")
+                return cache_key, None, self._last_results[cache_key]
+
+        content_key = None
+        if isinstance(image, np.ndarray):
+            content_key = self.cache.make_key(image, region, self.engine_params)
+            lines = self.cache.get(content_key)
+            if lines is not None:
+                return cache_key, content_key, lines
+        return cache_key, content_key, None
+
+    def _remember(self, cache_key: Optional[Tuple], content_key: Optional[str],
+                  lines: List[List[Any]]) -> None:
+        """记录识别结果，供后续相同画面复用"""
+        if content_key is not None:
+            self.cache.put(content_key, lines)
+        if cache_key is not None:
+            self._last_results[cache_key] = lines
+
+    def _run_ocr(self, image: Union[str, np.ndarray], region: List[int] = None) -> List[List[Any]]:
+        """
+        执行OCR识别，指定region时只对该区域做检测和识别
+
+        Args:
+            image: 图片路径或帧
+            region: 识别区域 [x1, y1, x2, y2]，坐标系与image一致
+
+        Returns:
+            PaddleOCR原始结果行列表[[box, (text, confidence)], ...]，
+            box坐标已映射回image的坐标系
+        """
+        cache_key, content_key, lines = self._lookup_cached(image, region)
+        if lines is None:
+            lines = self._recognize(image, region)
+        self._remember(cache_key, content_key, lines)
+        return lines
+
+    async def _run_ocr_async(self, image: Union[str, np.ndarray], region: List[int] = None) -> List[List[Any]]:
+        """_run_ocr的异步版本，等待识别结果时不占用线程"""
+        cache_key, content_key, lines = self._lookup_cached(image, region)
+        if lines is None:
+            lines = await self._recognize_async(image, region)
+        self._remember(cache_key, content_key, lines)
+        return lines
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """获取识别结果缓存的命中统计(hits/misses/size/hit_rate)"""
+        return self.cache.stats()
+
+    def _crop(self, image: Union[str, np.ndarray],
+              region: List[int] = None) -> Tuple[Optional[Union[str, np.ndarray]], Tuple[int, int]]:
+        """裁剪识别区域
+
+        Returns:
+            (待识别图像, 区域偏移)，区域为空时图像为None
+        """
+        if not region:
+            return image, (0, 0)
+        if isinstance(image, str):
+            image = cv2.imread(image)
+        height, width = image.shape[:2]
+        x1, y1, x2, y2 = map(int, region)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(width, x2), min(height, y2)
+        if x2 <= x1 or y2 <= y1:
+            return None, (0, 0)
+        return np.ascontiguousarray(image[y1:y2, x1:x2]), (x1, y1)
+
+    @staticmethod
+    def _to_lines(result: List[Any], offset: Tuple[int, int]) -> List[List[Any]]:
+        """取出识别结果行，并将区域内坐标映射回原图坐标"""
+        if not result or not result[0]:
+            return []
+
+        lines = result[0]
+        offset_x, offset_y = offset
+        if offset_x or offset_y:
+            lines = [
+                [[[x + offset_x, y + offset_y] for x, y in box], rec]
+                for box, rec in lines
+            ]
+        return lines
+
+    def _recognize(self, image: Union[str, np.ndarray], region: List[int] = None) -> List[List[Any]]:
+        """执行OCR识别(不经过缓存)"""
+        image, offset = self._crop(image, region)
+        if image is None:
+            return []
+        return self._to_lines(self.service.ocr(image), offset)
+
+    async def _recognize_async(self, image: Union[str, np.ndarray], region: List[int] = None) -> List[List[Any]]:
+        """异步执行OCR识别(不经过缓存)，直接等待OCR服务的Future"""
+        image, offset = self._crop(image, region)
+        if image is None:
+            return []
+        result = await asyncio.wrap_future(self.service.submit(image))
+        return self._to_lines(result, offset)
+
+    def extract_text(self, image: Union[str, np.ndarray], keywords: List[str] = None,
                     region: List[int] = None) -> List[Dict[str, Any]]:
         """
         识别图片中的文字
 
         Args:
-            image_path: 图片路径
+            image: 图片路径或ScreenshotHelper.capture_frame返回的帧
             keywords: 需要匹配的关键词列表
-            region: 识别区域 [x1, y1, x2, y2]
+            region: 识别区域 [x1, y1, x2, y2]，只识别该区域，结果坐标仍为原图坐标
 
         Returns:
             包含识别结果的列表,每项包含:
@@ -41,25 +179,15 @@ class OCRHelper:
         """
         try:
             # 执行OCR识别
-            result = self.ocr.ocr(image_path, cls=True)
-
-            if not result or not result[0]:
-                return []
+            lines = self._run_ocr(image, region)
 
             # 处理识别结果
             ocr_results = []
-            for line in result[0]:
+            for line in lines:
                 box = line[0]
                 text = line[1][0]
                 confidence = line[1][1]
 
-                # 如果指定了region,检查是否在区域内
-                if region:
-                    x1, y1, x2, y2 = region
-                    box_x1, box_y1 = box[0]
-                    if not (x1 <= box_x1 <= x2 and y1 <= box_y1 <= y2):
-                        continue
-
                 # 如果指定了keywords,检查是否包含关键词
                 if keywords:
                     if not any(k in text for k in keywords):
@@ -79,15 +207,17 @@ class OCRHelper:
 
 
 
-    def find(self, image_path: str, text: str = None, textContains: str = None, textMatches: str = None,
+    def find(self, image: Union[str, np.ndarray], text: str = None, textContains: str = None, textMatches: str = None,
                     region: List[int] = None) -> List[Dict[str, Any]]:
         """
         识别图片中的文字
 
         Args:
-            image_path: 图片路径
-            keywords: 需要匹配的关键词列表
-            region: 识别区域 [x1, y1, x2, y2]
+            image: 图片路径或ScreenshotHelper.capture_frame返回的帧
+            text: 精确匹配的文字
+            textContains: 包含匹配的文字
+            textMatches: 正则匹配的文字
+            region: 识别区域 [x1, y1, x2, y2]，只识别该区域，结果坐标仍为原图坐标
 
         Returns:
             包含识别结果的列表,每项包含:
@@ -97,37 +227,42 @@ class OCRHelper:
         """
         try:
             # 执行OCR识别
-            result = self.ocr.ocr(image_path, cls=True)
+            lines = self._run_ocr(image, region)
+            return self._match_lines(lines, text, textContains, textMatches)
 
-            if not result or not result[0]:
-                return []
+        except Exception as e:
+            self.logger.error(f"OCR识别失败: {str(e)}")
+            return []
 
-            # 处理识别结果
-            ocr_results = []
-            for line in result[0]:
-                box = line[0]
-                text_to_match = line[1][0]
-                confidence = line[1][1]
+    async def find_async(self, image: Union[str, np.ndarray], text: str = None, textContains: str = None,
+                         textMatches: str = None, region: List[int] = None) -> List[Dict[str, Any]]:
+        """find的异步版本，参数和返回值与find相同"""
+        try:
+            lines = await self._run_ocr_async(image, region)
+            return self._match_lines(lines, text, textContains, textMatches)
 
-                # 如果指定了region,检查是否在区域内
-                if region:
-                    x1, y1, x2, y2 = region
-                    box_x1, box_y1 = box[0]
-                    if not (x1 <= box_x1 <= x2 and y1 <= box_y1 <= y2):
-                        continue
+        except Exception as e:
+            self.logger.error(f"OCR识别失败: {str(e)}")
+            return []
 
-                # 如果指定了keywords,检查是否包含关键词
-                if not TextMatcher(text_to_match).match(text=text, textContains=textContains, textMatches=textMatches):
-                    continue
+    @staticmethod
+    def _match_lines(lines: List[List[Any]], text: str = None, textContains: str = None,
+                     textMatches: str = None) -> List[Dict[str, Any]]:
+        """筛选匹配的识别结果行"""
+        ocr_results = []
+        for line in lines:
+            box = line[0]
+            text_to_match = line[1][0]
+            confidence = line[1][1]
 
-                ocr_results.append({
-                    'box': box,
-                    'text': text_to_match,
-                    'confidence': confidence
-                })
+            # 如果指定了keywords,检查是否包含关键词
+            if not TextMatcher(text_to_match).match(text=text, textContains=textContains, textMatches=textMatches):
+                continue
 
-            return ocr_results
+            ocr_results.append({
+                'box': box,
+                'text': text_to_match,
+                'confidence': confidence
+            })
 
-        except Exception as e:
-            self.logger.error(f"OCR识别失败: {str(e)}")
-            return []
\ No newline at end of file
+        return ocr_results
@@ -0,0 +1,205 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+import copy
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import cv2
+import numpy as np
+from paddleocr import PaddleOCR
+from lib.ocr_boxes import sorted_boxes, get_rotate_crop_image, get_minarea_rect_crop
+from rpa.utils.logger import get_logger
+
+class OCRService:
+    """进程级共享的OCR服务
+
+    所有设备的流程共用一组OCR模型。识别请求先进入队列，工作线程在
+    max_wait_ms内攒够最多max_batch_size个请求后一起处理：检测逐张执行，
+    方向分类和文字识别把所有请求的文字块合并成真正的批次执行。
+    每个工作线程持有一份独立的模型实例(PaddleOCR不是线程安全的)，
+    模型在线程第一次执行识别时才加载。
+    """
+    _instance = None
+    _lock = threading.Lock()  # 单例锁
+
+    @classmethod
+    def get_instance(cls, settings: Optional[Dict[str, Any]] = None) -> 'OCRService':
+        """获取OCR服务单例
+
+        Args:
+            settings: OCR配置(配置文件中的ocr段)，只在第一次创建时生效
+
+        Returns:
+            OCRService: 共享的OCR服务
+        """
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls(**(settings or {}))
+        return cls._instance
+
+    def __init__(self, lang: str = 'ch', max_workers: int = 2, warm_up: bool = False,
+                 max_batch_size: int = 8, max_wait_ms: float = 10, rec_batch_num: int = 16):
+        """
+        Args:
+            lang: 识别语言,'ch'(中文),'en'(英文)等
+            max_workers: 工作线程数，即进程内最多加载的模型份数
+            warm_up: 是否在创建时后台预加载模型
+            max_batch_size: 一个批次最多合并的识别请求数
+            max_wait_ms: 凑批次时最多等待的毫秒数
+            rec_batch_num: 方向分类和文字识别每次前向的文字块数
+        """
+        self.logger = get_logger(__name__)
+        self.lang = lang
+        self.max_workers = max_workers
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.rec_batch_num = rec_batch_num
+        self._queue: "queue.Queue[Tuple[Union[str, np.ndarray], Future]]" = queue.Queue()
+        self._local = threading.local()
+        self._workers = []
+        for index in range(max_workers):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                args=(warm_up,),
+                name=f'ocr-worker-{index}',
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        if warm_up:
+            self.logger.info(f"预加载OCR模型 (工作线程数: {max_workers})")
+
+    def _get_engine(self) -> PaddleOCR:
+        """获取当前工作线程的模型，不存在时加载"""
+        engine = getattr(self._local, 'engine', None)
+        if engine is None:
+            self.logger.info(f"工作线程 {threading.current_thread().name} 加载OCR模型")
+            engine = PaddleOCR(
+                use_angle_cls=True,
+                lang=self.lang,
+                show_log=False,  # 关闭PaddleOCR的调试日志
+                cls_batch_num=self.rec_batch_num,
+                rec_batch_num=self.rec_batch_num,
+                det_db_score_mode='fast',  # 使用快速模式
+                use_mp=True,  # 启用多进程
+                total_process_num=2  # 使用2个进程
+            )
+            self._local.engine = engine
+        return engine
+
+    def submit(self, image: Union[str, np.ndarray]) -> Future:
+        """提交识别任务
+
+        Args:
+            image: 图片路径或帧
+
+        Returns:
+            Future: 结果为PaddleOCR原始识别结果
+        """
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def ocr(self, image: Union[str, np.ndarray]) -> List[Any]:
+        """同步识别，等价于submit(image).result()"""
+        return self.submit(image).result()
+
+    def _worker_loop(self, warm_up: bool) -> None:
+        """工作线程主循环：取批次、识别、回填结果"""
+        if warm_up:
+            try:
+                self._get_engine()
+            except Exception as e:
+                self.logger.error(f"预加载OCR模型失败: {str(e)}")
+
+        while True:
+            batch = self._next_batch()
+            # 跳过已被调用方取消的请求
+            batch = [(image, future) for image, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self._run_batch(batch)
+
+    def _next_batch(self) -> List[Tuple[Union[str, np.ndarray], Future]]:
+        """阻塞等待第一个请求，然后在max_wait内尽量凑满批次"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batch(self, batch: List[Tuple[Union[str, np.ndarray], Future]]) -> None:
+        try:
+            engine = self._get_engine()
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        try:
+            results = self._recognize_batch(engine, [image for image, _ in batch])
+        except Exception as e:
+            # 批量识别失败时退回逐张识别，避免一张坏图拖累整个批次
+            self.logger.warning(f"批量OCR识别失败，改为逐张识别: {str(e)}")
+            for image, future in batch:
+                try:
+                    future.set_result(engine.ocr(image, cls=True))
+                except Exception as single_error:
+                    future.set_exception(single_error)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _recognize_batch(self, engine: PaddleOCR, images: List[Union[str, np.ndarray]]) -> List[List[Any]]:
+        """批量识别，返回与PaddleOCR.ocr相同格式的结果列表"""
+        box_type = getattr(engine.args, 'det_box_type', 'quad')
+        image_boxes = []
+        crops = []
+        for image in images:
+            image = self._prepare_image(image)
+            dt_boxes, _ = engine.text_detector(image.copy())
+            boxes = sorted_boxes(dt_boxes) if dt_boxes is not None and len(dt_boxes) else []
+            image_boxes.append(boxes)
+            for box in boxes:
+                box = copy.deepcopy(box)
+                if box_type == 'quad':
+                    crops.append(get_rotate_crop_image(image, box))
+                else:
+                    crops.append(get_minarea_rect_crop(image, box))
+
+        rec_res = []
+        if crops:
+            if engine.use_angle_cls:
+                crops, _, _ = engine.text_classifier(crops)
+            rec_res, _ = engine.text_recognizer(crops)
+
+        # 按请求拆分识别结果
+        results = []
+        index = 0
+        for boxes in image_boxes:
+            lines = []
+            for box in boxes:
+                text, score = rec_res[index][0], rec_res[index][1]
+                index += 1
+                if score >= engine.drop_score:
+                    lines.append([box.tolist(), (text, score)])
+            results.append([lines] if lines else [None])
+        return results
+
+    def _prepare_image(self, image: Union[str, np.ndarray]) -> np.ndarray:
+        """统一转换为BGR三通道数组"""
+        if isinstance(image, str):
+            image = cv2.imread(image)
+            if image is None:
+                raise FileNotFoundError("无法读取图片")
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        return image
@@ -1,87 +1,200 @@
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 import os
-from PIL import Image
+import cv2
+import numpy as np
 from loguru import logger
-import uiautomator2 as u2
-import io
+from lib.device_session import get_device
+from lib.frame_stream import FrameStream
 
 class ScreenshotHelper:
-    def __init__(self, device_id: str):
+    def __init__(self, device_id: str, settings: Optional[Dict[str, Any]] = None):
         """
         初始化截图助手
-        
+
         Args:
             device_id: 设备ID
+            settings: 截图配置(对应配置文件中的screenshot段)
+                - debug_save: 是否将每一帧落盘，仅调试使用，默认False
+                - debug_dir: 调试落盘目录，默认temp
+                - stream: 是否启用持续画面流，默认False
+                - stream_max_age: 画面流中可直接使用的最大帧龄(秒)，默认1.0
+                - stream_fresh_timeout: 界面变化后等待画面流采集到新帧的最长时间(秒)，默认2.0
+                - stream_interval/stream_buffer_size/replay_dir: 见FrameStream.for_device
         """
+        settings = settings or {}
         self.device_id = device_id
         self.logger = logger
         self.scale = 0.5  # 内部缩放比例
         self.quality = 50  # JPEG质量
-        # 初始化UIAutomator2连接
-        self.ui_device = u2.connect(device_id)
+        self.debug_save = settings.get('debug_save', False)
+        self.debug_dir = settings.get('debug_dir', 'temp')
+        # 初始化UIAutomator2连接(与机器人共用同一个连接)
+        self.ui_device = get_device(device_id)
+        # 画面流：后台持续采集，读取当前画面时不再发起截图请求
+        self.stream_max_age = settings.get('stream_max_age', 1.0)
+        self.stream_fresh_timeout = settings.get('stream_fresh_timeout', 2.0)
+        self.stream = None
+        if settings.get('stream', False):
+            self.stream = FrameStream.for_device(device_id, self.ui_device, settings)
+
+    def close(self) -> None:
+        """停止该设备的画面流"""
+        if self.stream:
+            FrameStream.release(self.device_id)
+            self.stream = None
+
+    def mark_ui_changed(self) -> None:
+        """记录界面已被操作改变，之后读取的画面必须是此后开始采集的帧"""
+        if self.stream:
+            self.stream.mark_ui_changed()
+
+    def _grab(self) -> np.ndarray:
+        """获取一帧原始BGR画面
+
+        画面流中的最新帧开始采集于最近一次界面操作之后且不超过stream_max_age时直接使用；
+        最新帧早于界面操作时等待画面流采集新帧，避免识别到操作前的画面(如刚关闭的弹窗)。
+        界面操作时间记录在设备的画面流上(FrameStream.mark_ui_changed)，与bots共用。
+        """
+        if self.stream:
+            image = self.stream.current_frame(self.stream_max_age, self.stream_fresh_timeout)
+            if image is not None:
+                return image
+            self.logger.debug("画面流暂无可用帧，直接截图")
+        # opencv格式直接得到BGR数组，省去PIL对象的转换
+        return self.ui_device.screenshot(format='opencv')
+
+    def capture_frame(self,
+                      region: Optional[List[int]] = None,
+                      filename_prefix: str = "frame") -> np.ndarray:
+        """
+        获取屏幕帧，全程在内存中处理，不经过磁盘
+
+        Args:
+            region: 截图区域 [x1, y1, x2, y2]，None表示全屏
+            filename_prefix: 调试落盘时使用的文件名前缀
+
+        Returns:
+            缩放后的灰度图(numpy数组)，可直接传给OCRHelper
+        """
+        try:
+            image = self._grab()
+
+            # 如果指定了区域，先裁剪(切片不复制数据)
+            if region:
+                x1, y1, x2, y2 = map(int, region)
+                image = image[y1:y2, x1:x2]
+
+            # 先转灰度再缩放，缩放只需处理单通道
+            frame = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            height, width = frame.shape[:2]
+            new_size = (int(width * self.scale), int(height * self.scale))
+            frame = cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
+
+            if self.debug_save:
+                self._save_debug_frame(frame, filename_prefix)
+
+            return frame
 
-    def take_screenshot(self, 
+        except Exception as e:
+            self.logger.error(f"截图失败: {str(e)}")
+            raise
+
+    def take_screenshot(self,
                        save_path: str,
                        region: Optional[List[int]] = None,
                        filename_prefix: str = "screenshot") -> str:
         """
-        获取屏幕截图，支持区域截图
-        
+        获取屏幕截图并保存为文件，支持区域截图
+
+        轮询类动作应优先使用capture_frame，此方法仅保留给需要文件的场景
+
         Args:
             save_path: 保存目录
             region: 截图区域 [x1, y1, x2, y2]，None表示全屏
             filename_prefix: 文件名前缀
-            
+
         Returns:
             截图文件的完整路径
         """
         try:
             # 确保保存目录存在
             os.makedirs(save_path, exist_ok=True)
-            
+
             # 生成文件名
-            import time
             filename = f"{filename_prefix}.jpg"  # 使用jpg格式
             full_path = os.path.join(save_path, filename)
-            
-            # 使用UIAutomator2截图
-            screenshot_data = self.ui_device.screenshot(format='pillow')
-            
-            # 如果指定了区域，先裁剪
-            if region:
-                x1, y1, x2, y2 = region
-                screenshot_data = screenshot_data.crop((x1, y1, x2, y2))
-            
-            # 缩放图片
-            original_size = screenshot_data.size
-            new_size = tuple(int(dim * self.scale) for dim in original_size)
-            screenshot_data = screenshot_data.resize(new_size, Image.Resampling.LANCZOS)
-            
-            # 转换为灰度图
-            screenshot_data = screenshot_data.convert('L')
-            
+
+            frame = self.capture_frame(region=region, filename_prefix=filename_prefix)
+
             # 保存为JPEG格式
-            screenshot_data.save(full_path, 'JPEG', quality=self.quality, optimize=True)
-            
+            cv2.imwrite(full_path, frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+
             return full_path
-            
+
         except Exception as e:
             self.logger.error(f"截图失败: {str(e)}")
             raise
 
+    def _save_debug_frame(self, frame: np.ndarray, filename_prefix: str) -> None:
+        """调试模式下将帧落盘，失败不影响主流程"""
+        try:
+            os.makedirs(self.debug_dir, exist_ok=True)
+            full_path = os.path.join(self.debug_dir, f"{filename_prefix}.jpg")
+            cv2.imwrite(full_path, frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        except Exception as e:
+            self.logger.warning(f"调试截图保存失败: {str(e)}")
+
     def get_scale_factor(self) -> float:
         """获取当前缩放比例"""
         return self.scale
 
     def get_real_coordinates(self, x: int, y: int) -> Tuple[int, int]:
         """将缩放后的坐标转换为实际坐标
-        
+
         Args:
             x: 缩放图片上的x坐标
             y: 缩放图片上的y坐标
-            
+
         Returns:
             实际屏幕上的坐标(x, y)
         """
         # 只考虑缩放因子，不考虑区域偏移
-        return (int(x / self.scale), int(y / self.scale))
\ No newline at end of file
+        return (int(x / self.scale), int(y / self.scale))
+
+    def to_screen_coordinates(self, x: float, y: float,
+                              region: Optional[List[int]] = None) -> Tuple[int, int]:
+        """将帧上的坐标映射回屏幕坐标
+
+        Args:
+            x: 帧上的x坐标
+            y: 帧上的y坐标
+            region: 截帧时使用的区域 [x1, y1, x2, y2]，None表示全屏
+
+        Returns:
+            实际屏幕上的坐标(x, y)
+        """
+        screen_x, screen_y = self.get_real_coordinates(x, y)
+        if region:
+            screen_x += int(region[0])
+            screen_y += int(region[1])
+        return (screen_x, screen_y)
+
+    def to_frame_region(self, region: List[int],
+                        screenshot_region: Optional[List[int]] = None) -> List[int]:
+        """将屏幕区域映射为帧上的区域，用于OCRHelper的region参数
+
+        Args:
+            region: 屏幕区域 [x1, y1, x2, y2]
+            screenshot_region: 截帧时使用的区域，None表示全屏
+
+        Returns:
+            帧坐标系下的区域 [x1, y1, x2, y2]
+        """
+        offset_x, offset_y = (int(screenshot_region[0]), int(screenshot_region[1])) if screenshot_region else (0, 0)
+        x1, y1, x2, y2 = map(int, region)
+        return [
+            int((x1 - offset_x) * self.scale),
+            int((y1 - offset_y) * self.scale),
+            int((x2 - offset_x) * self.scale),
+            int((y2 - offset_y) * self.scale),
+        ]
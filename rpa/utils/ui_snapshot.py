@@ -0,0 +1,99 @@
+from typing import Optional
+import threading
+import time
+import xml.etree.ElementTree as ET
+from rpa.utils.logger import get_logger
+from rpa.utils.ui_tree import UITree
+from lib.wait import ChangeSignal
+
+class UISnapshot:
+    """UI层级快照
+
+    缓存最近一次dump_hierarchy的结果及其解析后的节点树，供同一设备上的
+    节点类动作共用。点击、滑动、输入等会改变界面的动作以及休眠、轮询等待类
+    动作执行后由BaseBot调用invalidate失效，超过ttl的快照也会在下次读取时重新获取。
+    失效时通知changes，正在等待界面变化的动作会提前重新检查。
+    """
+
+    def __init__(self, device, ttl: float = 2.0, changes: Optional[ChangeSignal] = None):
+        """
+        Args:
+            device: UIAutomator2设备实例
+            ttl: 快照有效期(秒)，0表示每次读取都重新获取
+            changes: 界面变化信号，不传时新建
+        """
+        self.device = device
+        self.ttl = ttl
+        self.changes = changes or ChangeSignal()
+        self.logger = get_logger(__name__)
+        self.dumps = 0  # 实际执行dump的次数
+        self.hits = 0  # 复用快照的次数
+        self._xml: Optional[str] = None
+        self._root: Optional[ET.Element] = None
+        self._tree: Optional[UITree] = None
+        self._captured_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """使当前快照失效"""
+        with self._lock:
+            self._xml = None
+            self._root = None
+            self._tree = None
+        self.changes.notify()
+
+    def is_fresh(self) -> bool:
+        """快照是否存在且未过期"""
+        return self._root is not None and time.monotonic() - self._captured_at <= self.ttl
+
+    def _ensure(self, refresh: bool) -> None:
+        if not refresh and self.is_fresh():
+            self.hits += 1
+            return
+        xml_content = self.device.dump_hierarchy()
+        self._root = ET.fromstring(xml_content)
+        self._xml = xml_content
+        self._tree = None
+        self._captured_at = time.monotonic()
+        self.dumps += 1
+
+    def get_xml(self, refresh: bool = False) -> str:
+        """获取层级XML文本
+
+        Args:
+            refresh: 是否强制重新获取
+
+        Returns:
+            str: dump_hierarchy的原始XML
+        """
+        with self._lock:
+            self._ensure(refresh)
+            return self._xml
+
+    def get_root(self, refresh: bool = False) -> ET.Element:
+        """获取解析后的根节点
+
+        Args:
+            refresh: 是否强制重新获取
+
+        Returns:
+            ET.Element: 层级树的根节点
+        """
+        with self._lock:
+            self._ensure(refresh)
+            return self._root
+
+    def get_tree(self, refresh: bool = False) -> UITree:
+        """获取带索引的层级树，索引在同一快照上只建立一次
+
+        Args:
+            refresh: 是否强制重新获取
+
+        Returns:
+            UITree: 带text/content-desc/resource-id索引和空间索引的层级树
+        """
+        with self._lock:
+            self._ensure(refresh)
+            if self._tree is None:
+                self._tree = UITree(self._root)
+            return self._tree
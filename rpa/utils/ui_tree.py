@@ -0,0 +1,144 @@
+from typing import Dict, List, Optional, Tuple
+import re
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+import numpy as np
+
+# UIAutomator层级中bounds属性的格式: [x1,y1][x2,y2]
+BOUNDS_PATTERN = re.compile(r'\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]')
+
+def parse_bounds(bounds_str: str) -> Optional[Tuple[int, int, int, int]]:
+    """解析bounds字符串
+
+    Args:
+        bounds_str: 形如"[x1,y1][x2,y2]"的字符串
+
+    Returns:
+        Optional[Tuple[int, int, int, int]]: (x1, y1, x2, y2)，格式错误时返回None
+    """
+    match = BOUNDS_PATTERN.fullmatch(bounds_str.strip()) if bounds_str else None
+    if not match:
+        return None
+    return tuple(int(value) for value in match.groups())
+
+def bounds_to_dict(bounds: Tuple[int, int, int, int]) -> Dict[str, int]:
+    """转换为与UIAutomator2 info['bounds']相同的字典格式"""
+    x1, y1, x2, y2 = (int(value) for value in bounds)
+    return {'left': x1, 'top': y1, 'right': x2, 'bottom': y2}
+
+class UITree:
+    """带索引的UI层级树
+
+    解析层级时一次性建立索引：
+    - text、content-desc、resource-id到节点的哈希表
+    - 所有节点的整数bounds，保存在(n, 4)的紧凑数组中
+    - 按节点左上角划分的网格空间索引，用于"区域内节点"查询
+
+    节点用其在文档顺序中的下标表示，查询结果均按文档顺序返回。
+    """
+
+    def __init__(self, root: ET.Element, cell_size: int = 200):
+        """
+        Args:
+            root: 层级树根节点
+            cell_size: 空间索引的网格边长(像素)
+        """
+        self.root = root
+        self.cell_size = cell_size
+        self.nodes: List[ET.Element] = [node for node in root.iter() if node is not root]
+        self.bounds = np.full((len(self.nodes), 4), -1, dtype=np.int32)
+        self.has_bounds = np.zeros(len(self.nodes), dtype=bool)
+        self._by_text: Dict[str, List[int]] = defaultdict(list)
+        self._by_desc: Dict[str, List[int]] = defaultdict(list)
+        self._by_resource_id: Dict[str, List[int]] = defaultdict(list)
+        self._grid: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+        for index, node in enumerate(self.nodes):
+            attrs = node.attrib
+            if attrs.get('text'):
+                self._by_text[attrs['text']].append(index)
+            if attrs.get('content-desc'):
+                self._by_desc[attrs['content-desc']].append(index)
+            if attrs.get('resource-id'):
+                self._by_resource_id[attrs['resource-id']].append(index)
+
+            bounds = parse_bounds(attrs.get('bounds', ''))
+            if bounds:
+                self.bounds[index] = bounds
+                self.has_bounds[index] = True
+                self._grid[(bounds[0] // cell_size, bounds[1] // cell_size)].append(index)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def node(self, index: int) -> ET.Element:
+        return self.nodes[index]
+
+    def bounds_of(self, index: int) -> Optional[Dict[str, int]]:
+        """获取节点bounds(left/top/right/bottom字典)，节点没有bounds时返回None"""
+        if not self.has_bounds[index]:
+            return None
+        return bounds_to_dict(self.bounds[index])
+
+    def _lookup(self, table: Dict[str, List[int]], value: str, contains: bool) -> List[int]:
+        if not contains:
+            return list(table.get(value, ()))
+        # 包含匹配只需遍历不同的取值，而不是所有节点
+        indices = []
+        for key, key_indices in table.items():
+            if value in key:
+                indices.extend(key_indices)
+        return sorted(indices)
+
+    def find_by_text(self, text: str, contains: bool = False) -> List[int]:
+        """按text查找节点，contains为True时做包含匹配"""
+        return self._lookup(self._by_text, text, contains)
+
+    def find_by_desc(self, desc: str, contains: bool = False) -> List[int]:
+        """按content-desc查找节点，contains为True时做包含匹配"""
+        return self._lookup(self._by_desc, desc, contains)
+
+    def find_by_resource_id(self, resource_id: str) -> List[int]:
+        """按resource-id查找节点"""
+        return list(self._by_resource_id.get(resource_id, ()))
+
+    def filter_in_region(self, indices: List[int], region: List[int]) -> List[int]:
+        """保留完全位于region内的节点
+
+        Args:
+            indices: 节点下标列表
+            region: 区域 [x1, y1, x2, y2]
+
+        Returns:
+            List[int]: 区域内的节点下标(保持原顺序)
+        """
+        if not indices:
+            return []
+        candidates = np.asarray(indices, dtype=np.intp)
+        x1, y1, x2, y2 = map(int, region)
+        bounds = self.bounds[candidates]
+        mask = (self.has_bounds[candidates] &
+                (bounds[:, 0] >= x1) & (bounds[:, 1] >= y1) &
+                (bounds[:, 2] <= x2) & (bounds[:, 3] <= y2))
+        return candidates[mask].tolist()
+
+    def nodes_in_region(self, region: List[int]) -> List[int]:
+        """查询完全位于region内的所有节点
+
+        区域内节点的左上角必然落在区域内，只需检查与区域重叠的网格。
+
+        Args:
+            region: 区域 [x1, y1, x2, y2]
+
+        Returns:
+            List[int]: 区域内的节点下标，按文档顺序
+        """
+        x1, y1, x2, y2 = map(int, region)
+        if x2 < x1 or y2 < y1:
+            return []
+        candidates = []
+        for cell_x in range(x1 // self.cell_size, x2 // self.cell_size + 1):
+            for cell_y in range(y1 // self.cell_size, y2 // self.cell_size + 1):
+                candidates.extend(self._grid.get((cell_x, cell_y), ()))
+        candidates.sort()
+        return self.filter_in_region(candidates, region)
@@ -2,13 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import asyncio
 import yaml
 import os
 from pathlib import Path
 from rpa.core.base_bot import BaseBot
 from rpa.utils.logger import setup_logger, get_logger
 import subprocess
-import uiautomator2 as u2
+from lib.device_session import get_device
 import time
 from rpa.utils.device_manager import DeviceManager
 from typing import Dict, Any
@@ -53,8 +54,8 @@ def setup_uiautomator2(device_ip: str) -> bool:
 
         logger.info(f"正在初始化设备 {device_ip}")
 
-        # 使用 u2.connect()
-        d = u2.connect(device_ip)
+        # 使用共享的设备连接，之后的流程直接复用
+        d = get_device(device_ip)
         try:
             # 检查ATX应用是否已安装
             atx_package = "com.github.uiautomator"
@@ -130,18 +131,21 @@ def load_config(config_path: str) -> Dict[str, Any]:
         logger.error(f"加载配置文件失败: {str(e)}")
         return {}
 
+def create_bot(flow_config: Dict[str, Any], device_ip: str, task_id=None) -> BaseBot:
+    """合并全局配置并创建机器人实例"""
+    # 加载全局配置
+    global_config = load_config('config.yaml')
+    # 合并全局配置和流程配置
+    flow_config.update(global_config)
+
+    # 直接使用传入的设备IP创建机器人实例
+    return BaseBot(flow_config, device_ip, task_id)
+
 def main(flow_config: Dict[str, Any], device_ip: str, start_step_index: int = 0,task_id=None):
     logger = get_logger(__name__)
 
     try:
-
-                # 加载全局配置
-        global_config = load_config('config.yaml')
-        # 合并全局配置和流程配置
-        flow_config.update(global_config)
-
-        # 直接使用传入的设备IP创建机器人实例
-        bot = BaseBot(flow_config, device_ip,task_id)
+        bot = create_bot(flow_config, device_ip, task_id)
 
         # 执行流程
         bot.run_flow(flow_config, start_step_index)
@@ -154,6 +158,21 @@ def main(flow_config: Dict[str, Any], device_ip: str, start_step_index: int = 0,
         DeviceManager().add_error_task_device(device_ip)
         raise
 
+async def main_async(flow_config: Dict[str, Any], device_ip: str, start_step_index: int = 0, task_id=None):
+    """main的异步版本，在共享事件循环中执行流程(见AsyncFlowRunner)"""
+    loop = asyncio.get_running_loop()
+    try:
+        # 连接设备是阻塞调用，放到线程池
+        bot = await loop.run_in_executor(None, create_bot, flow_config, device_ip, task_id)
+
+        await bot.run_flow_async(flow_config, start_step_index)
+
+        await loop.run_in_executor(None, DeviceManager().release_device, device_ip)
+
+    except Exception as e:
+        await loop.run_in_executor(None, DeviceManager().add_error_task_device, device_ip)
+        raise
+
 def run():
     args = parse_args()
 
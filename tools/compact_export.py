@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.record_log import compact
+
+def main():
+    parser = argparse.ArgumentParser(description="按key去重压缩export_data导出的jsonl/csv文件")
+    parser.add_argument('path', help="要压缩的记录文件")
+    parser.add_argument('--key', required=True, help="去重字段，多个字段用逗号分隔，如 station_name")
+    parser.add_argument('--output', help="输出文件，默认覆盖原文件；.json输出JSON数组，.csv输出CSV")
+    parser.add_argument('--format', choices=['jsonl', 'csv', 'json'], help="输入格式，默认按扩展名推断")
+    args = parser.parse_args()
+
+    try:
+        keys = [key.strip() for key in args.key.split(',') if key.strip()]
+        total, kept = compact(args.path, keys, args.output, args.format)
+        print(f"读取 {total} 条记录，保留 {kept} 条，输出到 {args.output or args.path}")
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()